@@ -1,12 +1,19 @@
+import csv
+import functools
 import logging
 import inspect
 import os
 import re
 import random
-import itertools
+import shutil
+import sqlite3
+import time
+from concurrent.futures import wait
 from typing import Annotated, Optional
 
+import numpy as np
 import vtk
+from vtk.util import numpy_support
 
 import slicer
 from slicer.ScriptedLoadableModule import *
@@ -14,6 +21,7 @@ from slicer.util import VTKObservationMixin
 from slicer.parameterNodeWrapper import (
     parameterNodeWrapper,
     WithinRange,
+    Choice,
     Validator
 )
 
@@ -22,6 +30,48 @@ from slicer import vtkMRMLTableNode
 
 import qt
 
+from SlicerLiverSegmentsLib import (
+    AGREEMENT_METRICS,
+    DEFAULT_CASE_ID_PATTERN,
+    DICOM_SERIES_EXTENSION,
+    AgreementMetricsCache,
+    CroppedVolumeCache,
+    DatasetPrefetcher,
+    DatasetRegistry,
+    DicomSeriesIndex,
+    DirectoryScanner,
+    Instrumentation,
+    ManifestEntry,
+    MemoryBudget,
+    RatingsAnalytics,
+    ResultsDatabase,
+    ResultsJournal,
+    SurfaceCache,
+    SurfaceGenerator,
+    TranscodingCache,
+    blockedLoadingOrder,
+    caseAgreementMetrics,
+    countVolumeLoads,
+    cropToBounds,
+    currentMemoryUsage,
+    fileContentHash,
+    isDicomSeriesPath,
+    needsTranscoding,
+    ijkToRasMatrix,
+    imageSizeInBytes,
+    labelBounds,
+    mergeShardResults,
+    methodAgreement,
+    pairByCaseId,
+    readImage,
+    readResultsColumns,
+    shardFileName,
+    shardLoadingOrder,
+    shuffledLoadingOrder,
+    writeMergedResults,
+    writeResultsCsv,
+)
+
 class MatchesInteger(Validator):
    def validate(self, value):
       if re.match("[0-9]+", value) is None:
@@ -30,17 +80,34 @@ class MatchesInteger(Validator):
 @parameterNodeWrapper
 class SlicerLiverSegmentsParameterNode:
     volumesDirectory: str = ""
-    method1Directory: str = ""
-    method2Directory: str = ""
-    method3Directory: str = ""
-    method4Directory: str = ""
+    methodDirectories: list[str]
+    caseIdPattern: str = DEFAULT_CASE_ID_PATTERN
     orderSeed: Annotated[str, MatchesInteger()] = str(random.randint(0,65535))
+    loadingOrderMode: Annotated[str, Choice(["Shuffled", "Blocked"])] = "Shuffled"
+    loadingOrderWindow: Annotated[int, WithinRange(1, 1000)] = 2
     outputFileName: str = ""
+    workerProcesses: Annotated[int, WithinRange(1, 256)] = min(8, os.cpu_count() or 1)
+    transcodingMode: Annotated[str, Choice(["Off", "On first view", "At experiment start"])] = "Off"
+    surfaceMode: Annotated[str, Choice(["Always", "On demand"])] = "Always"
+    surfaceSmoothing: Annotated[float, WithinRange(0.0, 1.0)] = 0.5
+    surfaceDecimation: Annotated[float, WithinRange(0.0, 0.99)] = 0.0
+    previewDecimation: Annotated[float, WithinRange(0.0, 0.99)] = 0.0
+    cropToSegmentation: bool = False
+    cropMargin: Annotated[float, WithinRange(0.0, 1000.0)] = 20.0
+    shardCount: Annotated[int, WithinRange(1, 64)] = 1
+    shardIndex: Annotated[int, WithinRange(1, 64)] = 1
+    shardOverlapPercent: Annotated[int, WithinRange(0, 100)] = 10
+    agreementMetrics: bool = False
+    resultsBackend: Annotated[str, Choice(["CSV", "SQLite"])] = "CSV"
+    raterName: str = os.environ.get("USERNAME") or os.environ.get("USER") or "Rater"
+    cacheDirectory: str = os.path.join(slicer.app.cachePath, "SlicerLiverSegments")
     resultsTableNode: vtkMRMLTableNode = None
     question1Score:  Annotated[int, WithinRange(1,5)] = 1
     question2Score:  Annotated[int, WithinRange(1,5)] = 1
     question3Score:  Annotated[int, WithinRange(1,5)] = 1
     question4Score:  Annotated[int, WithinRange(1,5)] = 1
+    prefetchPrevious: bool = False
+    memoryBudgetMB: Annotated[int, WithinRange(0, 262144)] = 4096
     totalEvaluations: int
     currentEvaluation: int
 
@@ -109,28 +176,15 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
                 qt.QFileDialog.getExistingDirectory(None, "Select Volumes Directory"))
             )
 
-        self.ui.method1DirPushButton.clicked.connect(
-            lambda:
-            self.ui.method1DirLineEdit.setText(
-                qt.QFileDialog.getExistingDirectory(None, "Select Method 1 Segmentations Directory"))
-            )
+        # One segmentations directory row per method, added after the volumes directory row
+        self._methodDirectoryRows = []
+        self.ui.addMethodPushButton.clicked.connect(self.onAddMethod)
+        self.ui.removeMethodPushButton.clicked.connect(self.onRemoveMethod)
 
-        self.ui.method2DirPushButton.clicked.connect(
+        self.ui.cacheDirPushButton.clicked.connect(
             lambda:
-            self.ui.method2DirLineEdit.setText(
-                qt.QFileDialog.getExistingDirectory(None, "Select Method 2 Segmentations Directory"))
-            )
-
-        self.ui.method3DirPushButton.clicked.connect(
-            lambda:
-            self.ui.method3DirLineEdit.setText(
-                qt.QFileDialog.getExistingDirectory(None, "Select Method 3 Segmentations Directory"))
-            )
-
-        self.ui.method4DirPushButton.clicked.connect(
-            lambda:
-            self.ui.method4DirLineEdit.setText(
-                qt.QFileDialog.getExistingDirectory(None, "Select Method 4 Segmentations Directory"))
+            self.ui.cacheDirLineEdit.setText(
+                qt.QFileDialog.getExistingDirectory(None, "Select Cache Directory"))
             )
 
         self.ui.outputFilePushButton.clicked.connect(
@@ -146,12 +200,73 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         self.ui.firstPushButton.clicked.connect(self.onFirst)
         self.ui.lastPushButton.clicked.connect(self.onLast)
         self.ui.orderSeedPushButton.clicked.connect(self.onGenerateNewOrderSeed)
+        self.ui.showSurfacesPushButton.clicked.connect(self.onShowSurfaces)
+        self.ui.mergeShardsPushButton.clicked.connect(self.onMergeShards)
+        self.ui.analyzeResultsPushButton.clicked.connect(self.onAnalyzeResults)
+        self.ui.exportResultsPushButton.clicked.connect(self.onExportResults)
+        self.ui.analyticsGroupBox.toggled.connect(lambda expanded: self.updateAnalyticsSummary())
+        slicer.app.layoutManager().layoutChanged.connect(self.onLayoutChanged)
+
+        self.ui.timingSummaryLabel.setFont(qt.QFontDatabase.systemFont(qt.QFontDatabase.FixedFont))
+
+        # Memory usage is shown live during the experiment
+        self._memoryTimer = qt.QTimer()
+        self._memoryTimer.setInterval(2000)
+        self._memoryTimer.timeout.connect(self.updateMemoryUsage)
+        self.ui.analyticsSummaryLabel.setFont(qt.QFontDatabase.systemFont(qt.QFontDatabase.FixedFont))
 
         # These connections ensure that we update parameter node when scene is closed
         self.addObserver(slicer.mrmlScene, slicer.mrmlScene.StartCloseEvent, self.onSceneStartClose)
         self.addObserver(slicer.mrmlScene, slicer.mrmlScene.EndCloseEvent, self.onSceneEndClose)
         self._parameterNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.enableStartExperimentButtonIfPossible)
+        self._parameterNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.updateMethodDirectoryRows)
+        self.initializeParameterNode()
+
+
+    def onSelectMethodDirectory(self, methodIndex: int) -> None:
+        directory = qt.QFileDialog.getExistingDirectory(None, f"Select Method {methodIndex + 1} Segmentations Directory")
+        if directory:
+            methodDirectories = list(self._parameterNode.methodDirectories)
+            methodDirectories[methodIndex] = directory
+            self._parameterNode.methodDirectories = methodDirectories
+
+    def onAddMethod(self) -> None:
+        self._parameterNode.methodDirectories = list(self._parameterNode.methodDirectories) + [""]
 
+    def onRemoveMethod(self) -> None:
+        if len(self._parameterNode.methodDirectories) > 1:
+            self._parameterNode.methodDirectories = list(self._parameterNode.methodDirectories)[:-1]
+
+    def updateMethodDirectoryRows(self, caller=None, event=None) -> None:
+        """
+        Shows one segmentations directory row per method of the parameter node
+        """
+        methodDirectories = list(self._parameterNode.methodDirectories)
+        formLayout = self.ui.directoriesGroupBox.layout()
+
+        def selectDirectory(methodIndex):
+            return lambda: self.onSelectMethodDirectory(methodIndex)
+
+        while len(self._methodDirectoryRows) < len(methodDirectories):
+            methodIndex = len(self._methodDirectoryRows)
+            lineEdit = qt.QLineEdit()
+            lineEdit.readOnly = True
+            pushButton = qt.QPushButton("...")
+            pushButton.clicked.connect(selectDirectory(methodIndex))
+            rowWidget = qt.QWidget()
+            rowLayout = qt.QHBoxLayout(rowWidget)
+            rowLayout.setContentsMargins(0, 0, 0, 0)
+            rowLayout.addWidget(lineEdit)
+            rowLayout.addWidget(pushButton)
+            formLayout.insertRow(methodIndex + 1, f"Method {methodIndex + 1} directory:", rowWidget)
+            self._methodDirectoryRows.append((rowWidget, lineEdit))
+        while len(self._methodDirectoryRows) > len(methodDirectories):
+            rowWidget, _ = self._methodDirectoryRows.pop()
+            formLayout.removeRow(rowWidget)
+
+        for (_, lineEdit), directory in zip(self._methodDirectoryRows, methodDirectories):
+            lineEdit.text = directory
+        self.ui.removeMethodPushButton.enabled = len(methodDirectories) > 1
 
     def onGenerateNewOrderSeed(self) -> None:
         # Generate a new random seed
@@ -163,7 +278,7 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 
     def onFirst(self) -> None:
         # Save current data before proceeding
-        self.logic.saveCurrentDataToTable()
+        self.saveCurrentData()
 
         reply = qt.QMessageBox.question(
             self.parent,
@@ -172,25 +287,11 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             qt.QMessageBox.Yes | qt.QMessageBox.No
         )
         if reply == qt.QMessageBox.Yes:
-            self.logic.firstDataset()
-            # Update button states
-            self.ui.firstPushButton.setEnabled(False)
-            self.ui.previousPushButton.setEnabled(False)
-            self.ui.lastPushButton.setEnabled(True)
-            self.ui.saveAndNextPushButton.setEnabled(True)
-            if self.logic.isLastDataset():
-                self.ui.saveAndNextPushButton.setText("Save")
-            else:
-                self.ui.saveAndNextPushButton.setText("Save and Next")
-            # Update progress bar
-            self.ui.progressBar.setValue(
-                self._parameterNode.currentEvaluation /
-                self._parameterNode.totalEvaluations * 100
-            )
+            self.logic.firstDatasetAsync(self.onDatasetLoaded, self.onDatasetLoadingProgress)
 
     def onLast(self) -> None:
         # Save current data before proceeding
-        self.logic.saveCurrentDataToTable()
+        self.saveCurrentData()
 
         reply = qt.QMessageBox.question(
             self.parent,
@@ -199,23 +300,16 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             qt.QMessageBox.Yes | qt.QMessageBox.No
         )
         if reply == qt.QMessageBox.Yes:
-            self.logic.lastDataset()
-            # Update button states
-            self.ui.firstPushButton.setEnabled(True)
-            self.ui.previousPushButton.setEnabled(True)
-            self.ui.lastPushButton.setEnabled(False)
-            self.ui.saveAndNextPushButton.setEnabled(True)
-            self.ui.saveAndNextPushButton.setText("Save")
-            # Update progress bar
-            self.ui.progressBar.setValue(
-                self._parameterNode.currentEvaluation /
-                self._parameterNode.totalEvaluations * 100
-            )
+            self.logic.lastDatasetAsync(self.onDatasetLoaded, self.onDatasetLoadingProgress)
 
 
+    def saveCurrentData(self) -> None:
+        self.logic.saveCurrentDataToTable()
+        self.updateAnalyticsSummary()
+
     def onSaveAndNext(self) -> None:
         # Save current data
-        self.logic.saveCurrentDataToTable()
+        self.saveCurrentData()
 
         if not self.logic.isLastDataset():
             reply = qt.QMessageBox.question(
@@ -225,17 +319,7 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
                 qt.QMessageBox.Yes | qt.QMessageBox.No
             )
             if reply == qt.QMessageBox.Yes:
-                self.logic.nextDataset()
-                self.ui.previousPushButton.setEnabled(True)
-                self.ui.firstPushButton.setEnabled(True)
-
-                # Update button text and states
-                if self.logic.isLastDataset():
-                    self.ui.saveAndNextPushButton.setText("Save")
-                    self.ui.lastPushButton.setEnabled(False)
-                else:
-                    self.ui.saveAndNextPushButton.setText("Save and Next")
-                    self.ui.lastPushButton.setEnabled(True)
+                self.logic.nextDatasetAsync(self.onDatasetLoaded, self.onDatasetLoadingProgress)
         else:
             # We are on the last dataset
             # Inform the user that they've reached the end
@@ -244,23 +328,86 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
                 'Information',
                 'You are on the last dataset. Your responses have been saved. You can navigate back to review or modify your responses.'
             )
-            # Keep navigation buttons enabled
-            self.ui.saveAndNextPushButton.setText("Save")
-            self.ui.saveAndNextPushButton.setEnabled(True)
-            self.ui.lastPushButton.setEnabled(False)
-            self.ui.previousPushButton.setEnabled(True)
-            self.ui.firstPushButton.setEnabled(True)
-
-        # Update progress
-        self.ui.progressBar.setValue(
-            self._parameterNode.currentEvaluation /
-            self._parameterNode.totalEvaluations * 100
-        )
+            self.updateNavigationButtons()
 
     def onPrevious(self) -> None:
+        # Clicking Previous while the next dataset is loading cancels that load
+        self.logic.previousDatasetAsync(self.onDatasetLoaded, self.onDatasetLoadingProgress)
+
+    def onMergeShards(self) -> None:
+        paths = qt.QFileDialog.getOpenFileNames(None, "Shard results files", ".", "CSV Files (*.csv);; All Files (*)")
+        if not paths:
+            return
+        outputPath = qt.QFileDialog.getSaveFileName(None, "Merged results file", ".", "CSV Files (*.csv);; All Files (*)")
+        if not outputPath:
+            return
+
+        problems = self.logic.mergeShardResults(paths, outputPath)
+        if problems is None:
+            qt.QMessageBox.warning(self.parent, 'Shard results not merged', 'See the log for details.')
+        elif problems:
+            qt.QMessageBox.warning(
+                self.parent,
+                'Shard results merged with problems',
+                f'{len(problems)} problems were found, see the log for details:\n' + '\n'.join(problems[:10])
+            )
+        else:
+            qt.QMessageBox.information(self.parent, 'Information', f'{len(paths)} shard results files were merged.')
+
+    def onExportResults(self) -> None:
+        outputPath = qt.QFileDialog.getSaveFileName(
+            None, "Results of all raters", ".", "CSV Files (*.csv);; All Files (*)")
+        if not outputPath:
+            return
+
+        numberOfEvaluations = self.logic.exportResultsDatabase(outputPath)
+        if numberOfEvaluations is None:
+            qt.QMessageBox.warning(self.parent, 'Results not exported', 'See the log for details.')
+        else:
+            qt.QMessageBox.information(
+                self.parent, 'Information', f'{numberOfEvaluations} evaluations were exported to {outputPath}.')
+
+    def onAnalyzeResults(self) -> None:
+        paths = qt.QFileDialog.getOpenFileNames(
+            None, "Results files of the raters", ".", "CSV Files (*.csv);; All Files (*)")
+        if not paths:
+            return
+
+        problems = self.logic.analyzeResultsFiles(paths)
+        if problems:
+            qt.QMessageBox.warning(
+                self.parent,
+                'Results files not analyzed',
+                f'{len(problems)} files could not be read:\n' + '\n'.join(problems[:10])
+            )
+        self.ui.analyticsGroupBox.collapsed = False
+        self.updateAnalyticsSummary()
+
+    def onShowSurfaces(self) -> None:
+        self.logic.buildSurfaces()
+        self.ui.showSurfacesPushButton.setEnabled(self.logic.hasPendingSurfaces())
+        self.updateTimingSummary()
+
+    def onLayoutChanged(self, layout) -> None:
+        # Deferred surfaces are built as soon as the 3D view is shown
+        if self.logic.hasPendingSurfaces() and self.logic.isThreeDViewVisible():
+            self.onShowSurfaces()
+
+    def onDatasetLoadingProgress(self, message) -> None:
+        self.ui.datasetLoadingLabel.setText(message)
+
+    def onDatasetLoaded(self) -> None:
+        self.ui.datasetLoadingLabel.setText("")
+        self.ui.showSurfacesPushButton.setEnabled(self.logic.hasPendingSurfaces())
+        self.updateNavigationButtons()
+        self.updateTimingSummary()
+        self.updateMemoryUsage()
+
+    def updateNavigationButtons(self) -> None:
+        """
+        Updates the navigation buttons and the progress bar for the dataset in the scene
+        """
         self.ui.saveAndNextPushButton.setEnabled(True)
-        self.logic.previousDataset()
-        # Adjust button text if not on last dataset
         if self.logic.isLastDataset():
             self.ui.saveAndNextPushButton.setText("Save")
             self.ui.lastPushButton.setEnabled(False)
@@ -289,23 +436,94 @@ class SlicerLiverSegmentsWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             self.ui.q2GroupBox.setEnabled(True)
             self.ui.q3GroupBox.setEnabled(True)
             self.ui.q4GroupBox.setEnabled(True)
-            self.ui.saveAndNextPushButton.setEnabled(True)
-            self.ui.lastPushButton.setEnabled(True)
             self.logic.startExperiment()
+            self.updateNavigationButtons()
+            if self.logic.resumedEvaluations:
+                self.ui.datasetLoadingLabel.setText(
+                    f"Resumed at evaluation {self._parameterNode.currentEvaluation}, "
+                    f"{self.logic.resumedEvaluations} evaluations restored from previous sessions")
+            self.ui.showSurfacesPushButton.setEnabled(self.logic.hasPendingSurfaces())
+            self.ui.loadingOrderSummaryLabel.setText(
+                f"About {self.logic.expectedVolumeLoads} volume loads estimated for "
+                f"{self._parameterNode.totalEvaluations} evaluations "
+                f"(memory budget of {self._parameterNode.memoryBudgetMB} MB)")
+            self.updateTimingSummary()
+            self.updateAnalyticsSummary()
+            self.updateMemoryUsage()
+            self._memoryTimer.start()
         else:
-           raise ValueError("Number of files in volume and methods directory must be equal")
+           raise ValueError("Volumes and segmentations could not be paired by case ID, see the log for details")
+
+    def updateTimingSummary(self) -> None:
+        """
+        Shows the timing statistics of the recent loading stages
+        """
+        lines = [f"{'Stage':<20}{'Count':>6}{'Mean':>9}{'Median':>9}{'P95':>9}{'Max':>9}"]
+        for stage, count, mean, median, p95, maximum in self.logic.instrumentation.summary():
+            lines.append(f"{stage:<20}{count:>6}{mean:>8.2f}s{median:>8.2f}s{p95:>8.2f}s{maximum:>8.2f}s")
+        self.ui.timingSummaryLabel.setText("\n".join(lines))
+
+    def updateMemoryUsage(self) -> None:
+        """
+        Shows the memory retained by the session against the budget, and the resident memory of the application
+        """
+        self.logic.updateMemoryUsage()
+        usage, totalBytes, budgetBytes = self.logic.memoryUsage()
+        megabyte = 1024 * 1024
+        categories = ", ".join(f"{category.lower()} {nbytes / megabyte:.0f}"
+                               for category, nbytes in sorted(usage.items()) if nbytes)
+        self.ui.memoryUsageLabel.setText(
+            f"Memory: {totalBytes / megabyte:.0f} of {budgetBytes / megabyte:.0f} MB"
+            + (f" ({categories})" if categories else "")
+            + f", Slicer {currentMemoryUsage() / megabyte:.0f} MB")
+
+    def updateAnalyticsSummary(self) -> None:
+        """
+        Shows the mean scores of the methods, the tests of their differences and the agreement between raters.
+        The statistics are only computed while the analytics are shown.
+        """
+        if self.ui.analyticsGroupBox.collapsed:
+            return
+        analytics = self.logic.analytics
+        questions = [columnName.split()[0] for columnName in analytics.scoreColumns]
+        header = "".join(f"{question:>8}" for question in questions)
+        lines = [f"{len(analytics)} ratings by {analytics.numberOfRaters} raters", "", f"{'Mean score':<16}{header}"]
+        for method, means in enumerate(analytics.meanScores(), start=1):
+            lines.append(f"{f'Method {method}':<16}" + "".join(f"{mean:>8.2f}" for mean in means))
+
+        lines.append(f"{'Friedman p':<16}" + "".join(
+            f"{analytics.friedman(question)[1]:>8.3f}" for question in range(len(questions))))
+        pairwise = [analytics.pairwiseWilcoxon(question) for question in range(len(questions))]
+        for pairIndex, (first, second, *_) in enumerate(pairwise[0] if pairwise else []):
+            lines.append(f"{f'Wilcoxon p {first + 1}-{second + 1}':<16}" + "".join(
+                f"{tests[pairIndex][3]:>8.3f}" for tests in pairwise))
+
+        if analytics.numberOfRaters > 1:
+            lines.append("")
+            lines.append(f"{'Fleiss kappa':<16}" + "".join(
+                f"{analytics.fleissKappa(question):>8.2f}" for question in range(len(questions))))
+            lines.append(f"{'ICC(2,1)':<16}" + "".join(
+                f"{analytics.icc(question)[0]:>8.2f}" for question in range(len(questions))))
+        self.ui.analyticsSummaryLabel.setText("\n".join(lines))
 
     def enableStartExperimentButtonIfPossible(self, caller, event) -> None:
         self.ui.startExperimentPushButton.setEnabled(self.logic.canExperimentStart())
 
     def initializeParameterNode(self) -> None:
         self._parameterNode =  self.logic.getParameterNode()
+        # Studies compare four methods unless configured otherwise
+        if not self._parameterNode.methodDirectories:
+            self._parameterNode.methodDirectories = [""] * 4
+        self.updateMethodDirectoryRows()
 
     def cleanup(self) -> None:
         """
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        slicer.app.layoutManager().layoutChanged.disconnect(self.onLayoutChanged)
+        self._memoryTimer.stop()
+        self.logic.cleanup()
 
 
     def enter(self) -> None:
@@ -374,7 +592,30 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
     """
 
     # Define a tuple of valid file extensions
-    VALID_EXTENSIONS = ("nii.gz", ".nii", ".dcm", ".nrrd", ".seg.nrrd" )
+    # DICOM volumes are read as series, see _scanDicomSeries
+    VALID_EXTENSIONS = ("nii.gz", ".nii", ".nrrd", ".seg.nrrd" )
+
+    # Results table columns and their types, in table order
+    RESULTS_COLUMNS = (
+        ("Sequence", vtk.VTK_INT),
+        ("Method", vtk.VTK_INT),
+        ("Volume File", vtk.VTK_STRING),
+        ("Segmentation File", vtk.VTK_STRING),
+        ("Q1 Scoring", vtk.VTK_INT),
+        ("Q2 Scoring", vtk.VTK_INT),
+        ("Q3 Scoring", vtk.VTK_INT),
+        ("Q4 Scoring", vtk.VTK_INT),
+    )
+
+    # Columns identifying an evaluation in the results
+    RESULTS_KEY_COLUMNS = ("Method", "Sequence")
+
+    # Results database shared by the sessions writing their results files to the same directory
+    RESULTS_DATABASE_FILE_NAME = "SlicerLiverSegmentsResults.sqlite"
+
+    # Agreement of the method of an evaluation with the other methods, written after the scores when computed.
+    # They are derived from the segmentations, so they are neither journaled nor required to resume a session.
+    METRICS_COLUMNS = tuple((columnName, vtk.VTK_DOUBLE) for columnName in AGREEMENT_METRICS)
 
     def __init__(self) -> None:
         """
@@ -392,70 +633,181 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
         self._currentVolumeFileName = None
         self._currentSegmentsFileName = None
         self._currentDatasetIndex = 0
+        self._loadingOrder = []
+        # Volume and segmentation files of each method and case, listed when the experiment is initialized
+        self._registry = DatasetRegistry("", [], [], [])
+        # The volume and segmentation nodes persist across datasets, only their contents are replaced
         self._currentVolumeNode = None
         self._currentSegmentationNode = None
+        self._labelmapNode = None
+        # Segmentation path and decoded labelmap of the current dataset while its surfaces are deferred
+        self._pendingSurfaces = None
+        # Full detail surfaces being built in the background, while coarse ones are shown
+        self._surfaceRefinement = None
+        self._refinementTimer = qt.QTimer()
+        self._refinementTimer.setInterval(100)
+        self._refinementTimer.timeout.connect(self._onRefinementTimer)
+        self.instrumentation = Instrumentation()
+        self._prefetcher = DatasetPrefetcher(self._decodeDataset)
+        # Volumes, labelmaps and surfaces retained by the session, within one budget
+        self._memory = MemoryBudget(0)
+        self._surfaceCache = SurfaceCache("")
+        self._surfaceGenerator = None
+        self._transcodingCache = TranscodingCache("")
+        self._croppedVolumeCache = CroppedVolumeCache("")
+        self._dicomIndex = DicomSeriesIndex("")
+        self._agreementMetricsCache = AgreementMetricsCache("")
+        self._pythonExecutable = None
+        self._resultsJournal = None
+        self._resultsDatabase = None
+        self._resultsColumns = {}
+        self.expectedVolumeLoads = 0
+        self.resumedEvaluations = 0
+        # Ratings of this session and of any results files analyzed, updated as evaluations are saved
+        self.analytics = RatingsAnalytics(self.scoreColumns())
+        # Asynchronous loads are completed on the main thread, by polling the prefetcher from the event loop
+        self._pendingLoad = None
+        self._loadTimer = qt.QTimer()
+        self._loadTimer.setInterval(50)
+        self._loadTimer.timeout.connect(self._onLoadTimer)
+        # Agreement metrics computed in worker processes, by sequence, joined to the table from the event loop
+        self._metricsFutures = {}
+        self._metricsRows = {}
+        self._metricsTimer = qt.QTimer()
+        self._metricsTimer.setInterval(500)
+        self._metricsTimer.timeout.connect(self._onMetricsTimer)
+
+    def cleanup(self) -> None:
+        """
+        Stops any background work started by the logic
+        """
+        self.cancelPendingLoad()
+        self.cancelSurfaceRefinement()
+        self.cancelAgreementMetrics()
+        self._prefetcher.shutdown()
+        if self._resultsJournal is not None or self._resultsDatabase is not None:
+            try:
+                self.compactResults()
+            except OSError as e:
+                print(f"Failed to write results to {self.resultsFileName()}: {e}")
+            self._closeResultsStore()
+        if self._surfaceGenerator is not None:
+            self._surfaceGenerator.shutdown()
+            self._surfaceGenerator = None
+        self._transcodingCache.shutdown()
+        self._dicomIndex.shutdown()
+        self.instrumentation.close()
+
+    def initializeDatasets(self) -> bool:
+        """
+        Lists and checks the dataset files, and prepares the caches used to load them.
+        Does not require the results table, so it can be used without the GUI.
+        """
+
+        # Store and check dataset files, pairing segmentations with volumes by case ID
+        self._dicomIndex.shutdown()
+        self._dicomIndex.databaseDirectory = os.path.join(self._parameterNode.cacheDirectory, "Dicom")
+        methodDirectories = list(self._parameterNode.methodDirectories)
+        try:
+            scanner = self._directoryScanner()
+            volumeEntries = scanner.scan(self._parameterNode.volumesDirectory)
+            if not volumeEntries:
+                volumeEntries = self._scanDicomSeries(self._parameterNode.volumesDirectory, scanner)
+            methodEntries = [scanner.scan(directory) for directory in methodDirectories]
+        except OSError as e:
+            print(f"Failed to list dataset files: {e}")
+            return False
+
+        segmentationFiles = []
+        for methodIndex, entries in enumerate(methodEntries):
+            pairedEntries, problems = pairByCaseId(volumeEntries, entries)
+            if pairedEntries is None:
+                print(f"Method {methodIndex + 1} segmentations do not match the volumes:\n  " + "\n  ".join(problems))
+                return False
+            segmentationFiles.append([entry.name for entry in pairedEntries])
+
+        self._registry = DatasetRegistry(
+            self._parameterNode.volumesDirectory,
+            [entry.name for entry in volumeEntries],
+            methodDirectories,
+            segmentationFiles)
+        if self.analytics.numberOfMethods < self._registry.numberOfMethods:
+            self.analytics = RatingsAnalytics(self.scoreColumns(), self._registry.numberOfMethods)
+
+        # Decoded volumes are shared by the segmentations of all methods for the same sequence, they are kept
+        # within the memory budget
+        self._memory.clear()
+        self._memory.budgetBytes = self._parameterNode.memoryBudgetMB * 1024 * 1024
+        self._surfaceCache.directory = os.path.join(self._parameterNode.cacheDirectory, "Surfaces")
+        self._transcodingCache.shutdown()
+        self._transcodingCache.directory = os.path.join(self._parameterNode.cacheDirectory, "Transcoded")
+        self._croppedVolumeCache.directory = os.path.join(self._parameterNode.cacheDirectory, "Cropped")
+        self.cancelAgreementMetrics()
+        self._agreementMetricsCache.directory = os.path.join(self._parameterNode.cacheDirectory, "Metrics")
+
+        # Stage timings of this session are logged for later analysis
+        try:
+            self.instrumentation.setLogPath(os.path.join(
+                self._parameterNode.cacheDirectory, "Timings", time.strftime("%Y%m%d-%H%M%S") + ".jsonl"))
+        except OSError as e:
+            print(f"Failed to open the timings log: {e}")
+
+        # Worker processes are started on first use and kept for the session. They run the Python interpreter
+        # of Slicer, as the application executable cannot act as one.
+        self._pythonExecutable = shutil.which("PythonSlicer", path=os.path.join(slicer.app.slicerHome, "bin"))
+        self._dicomIndex.maxWorkers = self._parameterNode.workerProcesses
+        self._dicomIndex.executable = self._pythonExecutable
+        if self._surfaceGenerator is not None:
+            self._surfaceGenerator.shutdown()
+            self._surfaceGenerator = None
+        # Coarse surfaces are refined in the background by the worker processes, even with a single one
+        if self._parameterNode.workerProcesses > 1 or self._parameterNode.previewDecimation > 0:
+            self._surfaceGenerator = SurfaceGenerator(self._parameterNode.workerProcesses, self._pythonExecutable)
+
+        return True
 
     def initializeExperiment(self) -> bool:
 
-        # Store and check dataset files and consistency
-        self._volumeFiles = self.getFilesInDirectory(self._parameterNode.volumesDirectory)
-        self._method1Files = self.getFilesInDirectory(self._parameterNode.method1Directory)
-        self._method2Files = self.getFilesInDirectory(self._parameterNode.method2Directory)
-        self._method3Files = self.getFilesInDirectory(self._parameterNode.method3Directory)
-        self._method4Files = self.getFilesInDirectory(self._parameterNode.method4Directory)
-
-        if (len(self._volumeFiles) != len(self._method1Files) or
-            len(self._volumeFiles) != len(self._method2Files) or
-            len(self._volumeFiles) != len(self._method3Files) or
-            len(self._volumeFiles) != len(self._method4Files)):
+        if not self.initializeDatasets():
             return False
+        # The results table has one row per evaluation of this session
+        self.computeLoadingOrder()
 
         # Update progress values
-        self._parameterNode.totalEvaluations = len(self._volumeFiles) * 4
+        self._parameterNode.totalEvaluations = len(self._loadingOrder)
         self._parameterNode.currentEvaluation = 1
 
+        # Saved evaluations are journaled next to the output file, or stored in the results database of its
+        # directory
+        self._closeResultsStore()
+        if self._parameterNode.resultsBackend == "SQLite":
+            self._resultsDatabase = self._openResultsDatabase()
+        else:
+            self._resultsJournal = ResultsJournal(self.resultsFileName() + ".journal")
+
+        # Build the results columns in bulk (-1 for integers, NaN for metrics, "N/A" for strings) and keep their
+        # handles. The metrics columns are only added when they are computed, so that results files keep their
+        # columns otherwise.
+        numRows = len(self._loadingOrder)
         self._resultsTable = self._parameterNode.resultsTableNode.GetTable()
-        sequenceNumberColumn = vtk.vtkIntArray()
-        sequenceNumberColumn.SetName("Sequence")
-        methodColumn = vtk.vtkIntArray()
-        methodColumn.SetName("Method")
-        volumeFileName = vtk.vtkStringArray()
-        volumeFileName.SetName("Volume File")
-        segmentsFileName = vtk.vtkStringArray()
-        segmentsFileName.SetName("Segmentation File")
-        q1ScoringColumn = vtk.vtkIntArray()
-        q1ScoringColumn.SetName("Q1 Scoring")
-        q2ScoringColumn = vtk.vtkIntArray()
-        q2ScoringColumn.SetName("Q2 Scoring")
-        q3ScoringColumn = vtk.vtkIntArray()
-        q3ScoringColumn.SetName("Q3 Scoring")
-        q4ScoringColumn = vtk.vtkIntArray()
-        q4ScoringColumn.SetName("Q4 Scoring")
-
-        self._resultsTable.AddColumn(sequenceNumberColumn)
-        self._resultsTable.AddColumn(methodColumn)
-        self._resultsTable.AddColumn(volumeFileName)
-        self._resultsTable.AddColumn(segmentsFileName)
-        self._resultsTable.AddColumn(q1ScoringColumn)
-        self._resultsTable.AddColumn(q2ScoringColumn)
-        self._resultsTable.AddColumn(q3ScoringColumn)
-        self._resultsTable.AddColumn(q4ScoringColumn)
-
-        numRows = len(self._volumeFiles) * 4 # Files x methods
-        self._resultsTable.SetNumberOfRows(numRows)
-
-        # Initialize table data (-1 for integers, "N/A" for strings)
-        for colIndex in range(self._resultsTable.GetNumberOfColumns()):
-            column = self._resultsTable.GetColumn(colIndex)
-            columnType = column.GetDataType()
-            if columnType in [vtk.VTK_INT, vtk.VTK_UNSIGNED_INT, vtk.VTK_LONG, vtk.VTK_UNSIGNED_LONG, vtk.VTK_SHORT, vtk.VTK_UNSIGNED_SHORT, vtk.VTK_CHAR, vtk.VTK_UNSIGNED_CHAR]:
-                # Integer types
-                for rowIndex in range(numRows):
-                    column.SetValue(rowIndex, -1)
-            elif columnType == vtk.VTK_STRING:
-                # String type
+        self._resultsTable.RemoveAllColumns()
+        self._resultsColumns = {}
+        metricsColumns = self.METRICS_COLUMNS if self._parameterNode.agreementMetrics else ()
+        for columnName, columnType in self.RESULTS_COLUMNS + metricsColumns:
+            if columnType == vtk.VTK_STRING:
+                column = vtk.vtkStringArray()
+                column.SetNumberOfValues(numRows)
                 for rowIndex in range(numRows):
                     column.SetValue(rowIndex, "N/A")
+            elif columnType == vtk.VTK_DOUBLE:
+                column = numpy_support.numpy_to_vtk(np.full(numRows, np.nan), deep=True, array_type=columnType)
+            else:
+                column = numpy_support.numpy_to_vtk(
+                    np.full(numRows, -1, dtype=np.int32), deep=True, array_type=columnType)
+            column.SetName(columnName)
+            self._resultsTable.AddColumn(column)
+            self._resultsColumns[columnName] = column
+        self._resultsTable.Modified()
 
         return True
 
@@ -473,96 +825,942 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
             prop_value = getattr(self._parameterNode, prop_name)
             if prop_value is None or prop_value == "":
                 return False
+        if not self._parameterNode.methodDirectories or not all(self._parameterNode.methodDirectories):
+            return False
+        return self._parameterNode.shardIndex <= self._parameterNode.shardCount
+
+    def resultsFileName(self) -> str:
+        """
+        Returns the results file of this session: the output file, with the shard appended to its name for
+        sharded sessions
+        """
+        if self._parameterNode.shardCount > 1:
+            return shardFileName(
+                self._parameterNode.outputFileName, self._parameterNode.shardIndex - 1, self._parameterNode.shardCount)
+        return self._parameterNode.outputFileName
+
+    def resultsDatabaseFileName(self) -> str:
+        """
+        Returns the results database of the directory of the output file
+        """
+        return os.path.join(
+            os.path.dirname(os.path.abspath(self._parameterNode.outputFileName)), self.RESULTS_DATABASE_FILE_NAME)
+
+    def _openResultsDatabase(self) -> ResultsDatabase:
+        return ResultsDatabase(
+            self.resultsDatabaseFileName(),
+            [columnName for columnName, _ in self.RESULTS_COLUMNS],
+            self.RESULTS_KEY_COLUMNS)
+
+    def _closeResultsStore(self) -> None:
+        if self._resultsJournal is not None:
+            self._resultsJournal.close()
+            self._resultsJournal = None
+        if self._resultsDatabase is not None:
+            self._resultsDatabase.close()
+            self._resultsDatabase = None
+
+    def _directoryScanner(self) -> DirectoryScanner:
+        return DirectoryScanner(
+            os.path.join(self._parameterNode.cacheDirectory, "Manifests"),
+            self.VALID_EXTENSIONS,
+            self._parameterNode.caseIdPattern)
+
+    def _scanDicomSeries(self, dirPath: str, scanner: DirectoryScanner) -> list:
+        """
+        Returns manifest entries for the DICOM series found under dirPath, each series being one volume.
+        The case ID of a series is taken from its top-level directory (the patient one, as the study and series
+        directories below it are numbered per patient), or from its patient ID if that directory has none.
+        """
+        entries = []
+        for series in self._dicomIndex.scan(dirPath):
+            caseId = scanner.caseId(series.caseDirectory) if series.caseDirectory else None
+            if caseId is None:
+                caseId = scanner.caseId(series.patientId)
+            entries.append(ManifestEntry(name=series.name, size=series.size, mtime=0, caseId=caseId))
+        return entries
+
+    def getDatasetPaths(self, index) -> tuple:
+        """
+        Returns the volume and segmentation file paths of the dataset at the given loading order index
+        """
+        method_idx, sequence_idx = self._loadingOrder[index]
+        return self._registry.volumePath(sequence_idx), self._registry.segmentationPath(method_idx, sequence_idx)
+
+    def getSegmentationPaths(self, sequence_idx) -> list:
+        """
+        Returns the segmentation file paths of all methods for a sequence
+        """
+        return self._registry.segmentationPaths(sequence_idx)
+
+    def _decodeSettings(self) -> dict:
+        """
+        Returns the settings of the decoding pipeline, as keyword arguments of _readVolume. They are read on the
+        main thread and passed to the prefetch worker thread, which must not read the parameter node.
+        """
+        return {
+            "transcode": self._parameterNode.transcodingMode != "Off",
+            "cropMargin": self._parameterNode.cropMargin if self._parameterNode.cropToSegmentation else None,
+        }
+
+    def _readImage(self, path, transcode: bool = False):
+        """
+        Reads an image file, through its uncompressed copy if transcode is set
+        """
+        if isDicomSeriesPath(path):
+            return self._dicomIndex.read(path)
+        if transcode and needsTranscoding(path):
+            return self._transcodingCache.read(path)
+        return readImage(path)
+
+    def _readVolume(self, sequence_idx, volumePath, transcode: bool = False, cropMargin: Optional[float] = None):
+        """
+        Reads a volume, cropped to the union of the extents of its segmentations grown by cropMargin millimeters
+        unless cropMargin is None. Cropped volumes are cached on disk.
+        """
+        if cropMargin is None:
+            return self._readImage(volumePath, transcode)
+
+        segmentationPaths = self.getSegmentationPaths(sequence_idx)
+        margin = cropMargin
+        try:
+            key = self._croppedVolumeCache.key(volumePath, segmentationPaths, margin)
+            cropped = self._croppedVolumeCache.load(key)
+        except OSError as e:
+            print(f"Cropped volume cache unavailable: {e}")
+            key, cropped = None, None
+        if cropped is not None:
+            return cropped
+
+        volume = self._readImage(volumePath, transcode)
+        with self.instrumentation.measure("volume crop", sequence=sequence_idx, file=volumePath):
+            lower, upper = None, None
+            for segmentationPath in segmentationPaths:
+                bounds = labelBounds(self._readImage(segmentationPath, transcode))
+                if bounds is None:
+                    continue
+                lower = bounds[0] if lower is None else np.minimum(lower, bounds[0])
+                upper = bounds[1] if upper is None else np.maximum(upper, bounds[1])
+            if lower is None:
+                # Nothing segmented by any method, show the whole volume
+                return volume
+            cropped = cropToBounds(volume, lower, upper, margin)
+
+        if key is not None:
+            try:
+                self._croppedVolumeCache.store(key, cropped)
+            except OSError as e:
+                print(f"Failed to cache the cropped volume of {volumePath}: {e}")
+        return cropped
+
+    def startTranscoding(self) -> list:
+        """
+        Transcodes all the compressed inputs in worker processes, in loading order, and returns their futures
+        """
+        paths = []
+        # Starting with the current dataset, as a resumed session does not go through the earlier ones
+        indices = list(range(len(self._loadingOrder)))
+        for index in indices[self._currentDatasetIndex:] + indices[:self._currentDatasetIndex]:
+            paths.extend(path for path in self.getDatasetPaths(index) if needsTranscoding(path) and path not in paths)
+        return self._transcodingCache.transcodeInBackground(
+            paths, self._parameterNode.workerProcesses, self._pythonExecutable)
+
+    def _agreementMetricsCases(self) -> dict:
+        """
+        Returns the segmentation paths of every sequence of the loading order, in order of first evaluation
+        """
+        cases = {}
+        for _, sequence_idx in self._loadingOrder:
+            if sequence_idx not in cases:
+                cases[sequence_idx] = self.getSegmentationPaths(sequence_idx)
+        return cases
+
+    def startAgreementMetrics(self) -> None:
+        """
+        Computes the agreement metrics of every case in worker processes, in loading order, and joins them to the
+        results table as they complete. Cached cases only cost a lookup.
+        """
+        self.cancelAgreementMetrics()
+        self._metricsRows = {}
+        for rowIndex, (_, sequence_idx) in enumerate(self._loadingOrder):
+            self._metricsRows.setdefault(sequence_idx, []).append(rowIndex)
+        self._metricsFutures = self._agreementMetricsCache.computeInBackground(
+            self._agreementMetricsCases(), self._parameterNode.workerProcesses, self._pythonExecutable)
+        self._metricsTimer.start()
+
+    def cancelAgreementMetrics(self) -> None:
+        self._metricsTimer.stop()
+        self._metricsFutures = {}
+        self._agreementMetricsCache.shutdown()
+
+    def _onMetricsTimer(self) -> None:
+        doneSequences = [sequence_idx for sequence_idx, future in self._metricsFutures.items() if future.done()]
+        for sequence_idx in doneSequences:
+            future = self._metricsFutures.pop(sequence_idx)
+            try:
+                metrics = future.result()
+            except Exception as e:
+                print(f"Failed to compute the agreement metrics of sequence {sequence_idx}: {e}")
+                continue
+            self._joinAgreementMetrics(sequence_idx, metrics)
+        if doneSequences:
+            self._resultsTable.Modified()
+        if not self._metricsFutures:
+            self._metricsTimer.stop()
+            logging.info(f"Agreement metrics joined for {len(self._metricsRows)} sequences")
+
+    def _joinAgreementMetrics(self, sequence_idx, metrics) -> None:
+        """
+        Writes the agreement of each method with the others on a sequence to the rows of its evaluations
+        """
+        rows = np.array(self._metricsRows[sequence_idx])
+        methods = np.array([self._loadingOrder[row][0] for row in rows])
+        agreement = np.array([methodAgreement(metrics, method_idx) for method_idx in range(len(metrics["volumes"]))])
+        for metricIndex, (columnName, _) in enumerate(self.METRICS_COLUMNS):
+            column = self._resultsColumns[columnName]
+            # Columns are written through a view of their memory
+            numpy_support.vtk_to_numpy(column)[rows] = agreement[methods, metricIndex]
+            column.Modified()
+
+    def _datasetTags(self, index) -> dict:
+        method_idx, sequence_idx = self._loadingOrder[index]
+        return {"index": index, "method": method_idx, "sequence": sequence_idx}
+
+    def _fileSize(self, path) -> int:
+        if isDicomSeriesPath(path):
+            return self._dicomIndex.series(path).size
+        return os.path.getsize(path)
+
+    def _decodeDataset(self, index, volumePath, segmentationPath, settings: dict, isCancelled=None) -> tuple:
+        """
+        Reads and decodes the files of a dataset with the settings of _decodeSettings. Runs on the prefetch worker
+        thread, so it must not touch the scene nor the parameter node.
+        The volume is skipped when volumePath is None, i.e. when it is already in the volume cache, and the
+        segmentation when segmentationPath is None. A decode cancelled while reading the volume, as told by
+        isCancelled, stops before reading the segmentation.
+        """
+        volume = None
+        if volumePath is not None:
+            with self.instrumentation.measure("volume read", **self._datasetTags(index),
+                                              file=volumePath, fileSize=self._fileSize(volumePath)):
+                volume = self._readVolume(self._loadingOrder[index][1], volumePath, **settings)
+        if isCancelled is not None and isCancelled():
+            return volume, None
+        segmentation = None
+        if segmentationPath is not None:
+            with self.instrumentation.measure("segmentation read", **self._datasetTags(index),
+                                              file=segmentationPath, fileSize=os.path.getsize(segmentationPath)):
+                segmentation = self._readImage(segmentationPath, settings["transcode"])
+                # Hash the segmentation file now, so that looking up its cached surfaces does not read it again
+                fileContentHash(segmentationPath)
+        return volume, segmentation
+
+    def _nodeNameFromPath(self, path) -> str:
+        fileName = os.path.basename(path)
+        for extension in sorted(self.VALID_EXTENSIONS + (DICOM_SERIES_EXTENSION,), key=len, reverse=True):
+            if fileName.endswith(extension):
+                return fileName[:-len(extension)].rstrip(".")
+        return fileName
+
+    @staticmethod
+    def _isInScene(node) -> bool:
+        return node is not None and slicer.mrmlScene.IsNodePresent(node)
+
+    def _updateVolumeNode(self, volumeNode, decoded, name):
+        """
+        Replaces the image data of volumeNode with the decoded volume, creating the node if it is not in the scene.
+        Reusing the node keeps its display node and the slice view pipelines.
+        """
+        if not self._isInScene(volumeNode):
+            volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode", name)
+        volumeNode.SetName(name)
+        volumeNode.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(ijkToRasMatrix(decoded)))
+        slicer.util.updateVolumeFromArray(volumeNode, decoded.array)
+        volumeNode.CreateDefaultDisplayNodes()
+        return volumeNode
+
+    def _updateSegmentationNode(self, segmentationNode, decoded, name):
+        """
+        Replaces the segments of segmentationNode with the decoded labelmap, creating the node if it is not in the
+        scene. Returns None if the labelmap cannot be imported this way.
+        """
+        if decoded.array.ndim != 3:
+            # Multi-layer segmentations need the full segmentation reader
+            return None
+
+        # The labelmap node is only used for importing, it is kept hidden between datasets
+        if not self._isInScene(self._labelmapNode):
+            self._labelmapNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
+            self._labelmapNode.SetHideFromEditors(True)
+            self._labelmapNode.SetSaveWithScene(False)
+        labelmapNode = self._labelmapNode
+        labelmapNode.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(ijkToRasMatrix(decoded)))
+        slicer.util.updateVolumeFromArray(labelmapNode, decoded.array)
+
+        if not self._isInScene(segmentationNode):
+            segmentationNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode", name)
+            segmentationNode.CreateDefaultDisplayNodes()
+        segmentationNode.SetName(name)
+        segmentationNode.GetSegmentation().RemoveAllSegments()
+        segmentationNode.SetReferenceImageGeometryParameterFromVolumeNode(labelmapNode)
+        slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelmapNode, segmentationNode)
+
+        # Restore segment names and colors stored in .seg.nrrd headers
+        segmentProperties = {}
+        for key, value in decoded.metadata.items():
+            match = re.match(r"Segment([0-9]+)_(Name|Color|LabelValue)$", key)
+            if match:
+                segmentProperties.setdefault(match.group(1), {})[match.group(2)] = value
+        segmentation = segmentationNode.GetSegmentation()
+        segmentsByLabel = {segmentation.GetNthSegment(i).GetLabelValue(): segmentation.GetNthSegment(i)
+                           for i in range(segmentation.GetNumberOfSegments())}
+        for properties in segmentProperties.values():
+            segment = segmentsByLabel.get(int(properties.get("LabelValue", -1)))
+            if segment is None:
+                continue
+            if "Name" in properties:
+                segment.SetName(properties["Name"])
+            if "Color" in properties:
+                segment.SetColor(*[float(c) for c in properties["Color"].split()[:3]])
+
+        return segmentationNode
+
+    def _applySurfaceParameters(self, segmentation, decimationFactor) -> None:
+        segmentation.SetConversionParameter("Smoothing factor", str(self._parameterNode.surfaceSmoothing))
+        segmentation.SetConversionParameter("Decimation factor", str(decimationFactor))
+
+    def _surfaceGenerationArguments(self, segmentation, decodedSegmentation):
+        """
+        Returns the arguments of SurfaceGenerator.generate for the decoded labelmap, or None if the segmentation
+        cannot be converted in parallel and the regular conversion has to be used.
+        """
+        if (self._surfaceGenerator is None or decodedSegmentation is None or decodedSegmentation.array.ndim != 3
+                or segmentation.GetConversionParameter("Joint smoothing") not in ("", "0")):
+            return None
+
+        def floatParameter(name):
+            try:
+                return float(segmentation.GetConversionParameter(name))
+            except ValueError:
+                return 0.0
+
+        return (
+            decodedSegmentation.array,
+            ijkToRasMatrix(decodedSegmentation),
+            floatParameter("Smoothing factor"),
+            floatParameter("Decimation factor"),
+            segmentation.GetConversionParameter("Compute surface normals") != "0")
+
+    @staticmethod
+    def _orderedSurfaces(segmentation, surfaces):
+        # Segments are imported in ascending label value order
+        if len(surfaces) != segmentation.GetNumberOfSegments():
+            return None
+        return [surfaces[labelValue] for labelValue in sorted(surfaces)]
+
+    def _generateClosedSurfaces(self, segmentation, decodedSegmentation):
+        """
+        Builds the closed surfaces of all segments in parallel from the decoded labelmap. Returns None if the
+        segmentation cannot be converted this way and the regular conversion has to be used.
+        """
+        arguments = self._surfaceGenerationArguments(segmentation, decodedSegmentation)
+        if arguments is None:
+            return None
+        return self._orderedSurfaces(segmentation, self._surfaceGenerator.generate(*arguments))
+
+    def _loadCachedSurfaces(self, segmentation, segmentationPath) -> tuple:
+        """
+        Returns the cache key of the surfaces for the current conversion parameters and the cached surfaces,
+        or None if they are not cached
+        """
+        try:
+            key = self._surfaceCache.key(segmentationPath, segmentation.SerializeAllConversionParameters())
+            return key, self._surfaceCache.load(key, segmentation.GetNumberOfSegments())
+        except OSError as e:
+            print(f"Surface cache unavailable: {e}")
+            return None, None
+
+    def _saveCachedSurfaces(self, key, polyDatas, segmentationPath) -> None:
+        if key is None:
+            return
+        try:
+            self._surfaceCache.save(key, polyDatas)
+        except OSError as e:
+            print(f"Failed to cache surfaces of {segmentationPath}: {e}")
+
+    def _createClosedSurface(self, segmentationNode, segmentationPath, decodedSegmentation=None,
+                             preview=False) -> None:
+        """
+        Creates the closed surface representation of a segmentation, reusing surfaces cached on disk for the same
+        file content and conversion parameters, or building them in parallel from the decoded labelmap.
+        With preview, surfaces not cached are first shown at the coarse preview decimation, and refined in the
+        background.
+        """
+        segmentation = segmentationNode.GetSegmentation()
+        closedSurfaceName = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+        segments = [segmentation.GetNthSegment(i) for i in range(segmentation.GetNumberOfSegments())]
+
+        self._applySurfaceParameters(segmentation, self._parameterNode.surfaceDecimation)
+        key, polyDatas = self._loadCachedSurfaces(segmentation, segmentationPath)
+
+        if (polyDatas is None and preview
+                and self._parameterNode.previewDecimation > self._parameterNode.surfaceDecimation
+                and self._showPreviewSurfaces(segmentationNode, segmentationPath, decodedSegmentation, key)):
+            return
+
+        generatedPolyDatas = None
+        if polyDatas is None:
+            try:
+                generatedPolyDatas = self._generateClosedSurfaces(segmentation, decodedSegmentation)
+            except Exception as e:
+                print(f"Parallel surface generation failed for {segmentationPath}: {e}")
+
+        for segment, polyData in zip(segments, polyDatas or generatedPolyDatas or []):
+            segment.AddRepresentation(closedSurfaceName, polyData)
+
+        # Only converts the segments when the surfaces were neither cached nor generated in parallel
+        segmentationNode.CreateClosedSurfaceRepresentation()
+
+        if polyDatas is None:
+            self._saveCachedSurfaces(
+                key, [segment.GetRepresentation(closedSurfaceName) for segment in segments], segmentationPath)
+
+    def _showPreviewSurfaces(self, segmentationNode, segmentationPath, decodedSegmentation, key) -> bool:
+        """
+        Shows coarse surfaces of the segmentation and starts building the full detail ones, which replace them
+        once done. Returns False if the surfaces cannot be built in the background.
+        """
+        segmentation = segmentationNode.GetSegmentation()
+        closedSurfaceName = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+        arguments = self._surfaceGenerationArguments(segmentation, decodedSegmentation)
+        if arguments is None:
+            return False
+        labelmap, ijkToRas, smoothingFactor, decimationFactor, computeNormals = arguments
+        previewDecimation = self._parameterNode.previewDecimation
+
+        # Coarse surfaces are cached under their own conversion parameters
+        self._applySurfaceParameters(segmentation, previewDecimation)
+        previewKey, previewPolyDatas = self._loadCachedSurfaces(segmentation, segmentationPath)
+        self._applySurfaceParameters(segmentation, decimationFactor)
+
+        try:
+            previewFutures = None
+            if previewPolyDatas is None:
+                previewFutures = self._surfaceGenerator.submit(
+                    labelmap, ijkToRas, smoothingFactor, previewDecimation, computeNormals)
+            # Queued behind the coarse surfaces, so the workers move on to them right away
+            futures = self._surfaceGenerator.submit(labelmap, ijkToRas, smoothingFactor, decimationFactor,
+                                                    computeNormals)
+            if previewFutures is not None:
+                previewPolyDatas = self._orderedSurfaces(segmentation, self._surfaceGenerator.collect(previewFutures))
+                if previewPolyDatas is not None:
+                    self._saveCachedSurfaces(previewKey, previewPolyDatas, segmentationPath)
+        except Exception as e:
+            print(f"Parallel surface generation failed for {segmentationPath}: {e}")
+            return False
+        if previewPolyDatas is None:
+            for future in futures.values():
+                future.cancel()
+            return False
+
+        for i, polyData in enumerate(previewPolyDatas):
+            segmentation.GetNthSegment(i).AddRepresentation(closedSurfaceName, polyData)
+        segmentationNode.CreateClosedSurfaceRepresentation()
+
+        self._surfaceRefinement = (segmentationNode, segmentationPath, key, futures)
+        self._refinementTimer.start()
         return True
 
-    def getFilesInDirectory(self, dirPath: str) -> list:
+    def _onRefinementTimer(self) -> None:
+        if self._surfaceRefinement is None:
+            self._refinementTimer.stop()
+            return
+        segmentationNode, segmentationPath, key, futures = self._surfaceRefinement
+        if not all(future.done() for future in futures.values()):
+            return
+        self._refinementTimer.stop()
+        self._surfaceRefinement = None
+
+        segmentation = segmentationNode.GetSegmentation()
+        closedSurfaceName = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+        with self.instrumentation.measure("surface refine", **self._datasetTags(self._currentDatasetIndex)):
+            try:
+                polyDatas = self._orderedSurfaces(segmentation, self._surfaceGenerator.collect(futures))
+            except Exception as e:
+                print(f"Surface refinement failed for {segmentationPath}: {e}")
+                return
+            if polyDatas is None:
+                return
+            for i, polyData in enumerate(polyDatas):
+                segmentation.GetNthSegment(i).AddRepresentation(closedSurfaceName, polyData)
+        self._saveCachedSurfaces(key, polyDatas, segmentationPath)
+
+        layoutManager = slicer.app.layoutManager()
+        if layoutManager is not None:
+            layoutManager.threeDWidget(0).threeDView().scheduleRender()
+
+    def cancelSurfaceRefinement(self) -> None:
         """
-        Returns a list of all files in the given directory filtered by valid extensions.
+        Stops refining the surfaces of the current dataset, keeping the coarse ones
         """
-        if not os.path.exists(dirPath):
-            print(f"Directory {dirPath} does not exist!")
-            return []
+        if self._surfaceRefinement is not None:
+            for future in self._surfaceRefinement[3].values():
+                future.cancel()
+            self._surfaceRefinement = None
+        self._refinementTimer.stop()
+
+    def _prefetchNeighbours(self, index) -> list:
+        neighbours = [index + 1]
+        if self._parameterNode.prefetchPrevious:
+            neighbours.append(index - 1)
+        return [i for i in neighbours if 0 <= i < len(self._loadingOrder)]
+
+    def _requestDecode(self, index) -> None:
+        """
+        Starts decoding the dataset at index in the background, skipping the volume if it is cached
+        """
+        volume_path, segmentation_path = self.getDatasetPaths(index)
+        if ("volume", self._loadingOrder[index][1]) in self._memory:
+            volume_path = None
+        self._prefetcher.request(index, index, volume_path, segmentation_path, self._decodeSettings())
 
-        # List all files in the directory, filter out any subdirectories,
-        # filter by extension, and then sort them
-        return sorted([f for f in os.listdir(dirPath)
-                       if os.path.isfile(os.path.join(dirPath, f))
-                       and f.endswith(self.VALID_EXTENSIONS)])
+    def _schedulePrefetch(self, index) -> None:
+        """
+        Starts decoding the datasets adjacent to index in the background
+        """
+        neighbours = self._prefetchNeighbours(index)
+        self._prefetcher.retain(neighbours)
+        for neighbour in neighbours:
+            self._requestDecode(neighbour)
 
     def loadDataset(self, index) -> None:
         if index < 0 or index >= len(self._loadingOrder):
             print(f"Index {index} is out of range!")
             return
 
+        # A synchronous load supersedes any pending asynchronous one
+        self.cancelPendingLoad()
+        self.cancelSurfaceRefinement()
+
         try:
             # Change cursor to busy indicator
             qt.QApplication.setOverrideCursor(qt.Qt.WaitCursor)
 
             method_idx, sequence_idx = self._loadingOrder[index]
-
-            # Load the volume
-            volume_filename = self._volumeFiles[sequence_idx]
-            volume_path = os.path.join(self._parameterNode.volumesDirectory, volume_filename)
-            self._currentVolumeNode = slicer.util.loadVolume(volume_path)
-            if not self._currentVolumeNode:
-                print(f"Failed to load volume from {volume_path}")
-
-            # Load the segmentation
-            segmentationDirectories = [
-                self._parameterNode.method1Directory,
-                self._parameterNode.method2Directory,
-                self._parameterNode.method3Directory,
-                self._parameterNode.method4Directory,
-            ]
-            segmentationFiles = [
-                self._method1Files,
-                self._method2Files,
-                self._method3Files,
-                self._method4Files,
-            ]
-            segmentation_filename = segmentationFiles[method_idx][sequence_idx]
-            segmentation_path = os.path.join(segmentationDirectories[method_idx], segmentation_filename)
-            self._currentSegmentationNode = slicer.util.loadSegmentation(segmentation_path)
-            if not self._currentSegmentationNode:
-                print(f"Failed to load segmentation from {segmentation_path}")
-            else:
-                self._currentSegmentationNode.CreateClosedSurfaceRepresentation()
+            volume_path, segmentation_path = self.getDatasetPaths(index)
+            cachedVolume = self._memory.get(("volume", sequence_idx))
+
+            # Use the prefetched data if available, decode it now otherwise
+            decoded = self._prefetcher.take(index)
+            if decoded is None:
+                try:
+                    decoded = self._decodeDataset(
+                        index, None if cachedVolume is not None else volume_path, segmentation_path,
+                        self._decodeSettings())
+                except Exception as e:
+                    print(f"Failed to decode dataset {index}: {e}")
+                    decoded = (None, None)
+            decodedVolume, decodedSegmentation = decoded
+
+            if cachedVolume is not None:
+                decodedVolume = cachedVolume
+            elif decodedVolume is None:
+                # The volume was left out of the prefetch while it was cached, and evicted since. It is decoded now
+                # through the same pipeline, so that it is cropped or read from its DICOM series like any other.
+                try:
+                    decodedVolume, _ = self._decodeDataset(index, volume_path, None, self._decodeSettings())
+                except Exception as e:
+                    print(f"Failed to decode volume {volume_path}: {e}")
+            if cachedVolume is None and decodedVolume is not None:
+                self._memory.put(("volume", sequence_idx), "Volumes", decodedVolume.nbytes, MemoryBudget.PINNED,
+                                 decodedVolume)
+
+            # Observers and views are updated once, when the batch ends
+            slicer.mrmlScene.StartState(slicer.mrmlScene.BatchProcessState)
+            try:
+                with self.instrumentation.measure("scene insert", **self._datasetTags(index)):
+                    # Load the volume
+                    volumeNode = None
+                    if decodedVolume is not None:
+                        volumeNode = self._updateVolumeNode(
+                            self._currentVolumeNode, decodedVolume, self._nodeNameFromPath(volume_path))
+                    self._replaceCurrentNode("_currentVolumeNode", volumeNode)
+                    if not self._currentVolumeNode:
+                        print(f"Failed to load volume from {volume_path}")
+
+                    # Load the segmentation
+                    segmentationNode = None
+                    if decodedSegmentation is not None:
+                        segmentationNode = self._updateSegmentationNode(
+                            self._currentSegmentationNode, decodedSegmentation,
+                            self._nodeNameFromPath(segmentation_path))
+                    if segmentationNode is None:
+                        segmentationNode = slicer.util.loadSegmentation(segmentation_path)
+                    self._replaceCurrentNode("_currentSegmentationNode", segmentationNode)
+                self._pendingSurfaces = None
+                if not self._currentSegmentationNode:
+                    print(f"Failed to load segmentation from {segmentation_path}")
+                else:
+                    self._pendingSurfaces = (index, segmentation_path, decodedSegmentation)
+                    if self._parameterNode.surfaceMode == "Always":
+                        self._buildPendingSurfaces()
+                    elif self._currentSegmentationNode.GetDisplayNode() is not None:
+                        # Only the labelmap is shown in the slice views until the surfaces are built
+                        self._currentSegmentationNode.GetDisplayNode().SetVisibility3D(False)
+            finally:
+                slicer.mrmlScene.EndState(slicer.mrmlScene.BatchProcessState)
+
+            if self._currentVolumeNode:
+                slicer.util.setSliceViewerLayers(background=self._currentVolumeNode, fit=True)
 
             # Load existing data if available
             self.loadDataFromTable()
 
+            # Decode the neighbouring datasets while the rater works on this one
+            self._schedulePrefetch(index)
+            self.updateMemoryUsage()
+
         finally:
             # Restore the cursor
             qt.QApplication.restoreOverrideCursor()
 
-            # Reset the 3D view to center on the loaded data
-            layoutManager = slicer.app.layoutManager()
-            threeDView = layoutManager.threeDWidget(0).threeDView()
-            threeDView.resetFocalPoint()
-            threeDView.renderWindow().Render()
+        if self._pendingSurfaces is None:
+            self._renderThreeDView(index)
+        elif self.isThreeDViewVisible():
+            # Build the surfaces once the slice views are shown
+            qt.QTimer.singleShot(0, self.buildSurfaces)
 
+    def _sceneMemoryUsage(self) -> dict:
+        """
+        Returns the bytes of the volume, labelmaps and surfaces of the dataset shown, by category
+        """
+        def dataBytes(dataObject) -> int:
+            # Actual memory sizes are in KiB
+            return dataObject.GetActualMemorySize() * 1024 if dataObject is not None else 0
+
+        usage = {"Volumes": 0, "Labelmaps": 0, "Surfaces": 0}
+        if self._isInScene(self._currentVolumeNode):
+            usage["Volumes"] += dataBytes(self._currentVolumeNode.GetImageData())
+        if self._isInScene(self._labelmapNode):
+            usage["Labelmaps"] += dataBytes(self._labelmapNode.GetImageData())
+        if self._isInScene(self._currentSegmentationNode):
+            representationCategories = {
+                slicer.vtkSegmentationConverter.GetBinaryLabelmapRepresentationName(): "Labelmaps",
+                slicer.vtkSegmentationConverter.GetClosedSurfaceRepresentationName(): "Surfaces",
+            }
+            segmentation = self._currentSegmentationNode.GetSegmentation()
+            counted = set()
+            for segmentIndex in range(segmentation.GetNumberOfSegments()):
+                segment = segmentation.GetNthSegment(segmentIndex)
+                for representationName, category in representationCategories.items():
+                    representation = segment.GetRepresentation(representationName)
+                    # Segments share the labelmap of their layer, it is counted once
+                    if representation is None or representation.__this__ in counted:
+                        continue
+                    counted.add(representation.__this__)
+                    usage[category] += dataBytes(representation)
+        if self._pendingSurfaces is not None and self._pendingSurfaces[2] is not None:
+            usage["Labelmaps"] += self._pendingSurfaces[2].nbytes
+        return usage
+
+    def _accountPrefetchedDatasets(self) -> None:
+        """
+        Tracks the datasets decoded in advance, which are released by dropping their requests
+        """
+        completed = self._prefetcher.completed()
+        for key in self._memory.keys():
+            if key[0] == "prefetch" and key[1] not in completed:
+                self._memory.pop(key)
+        for index, decoded in completed.items():
+            if ("prefetch", index) not in self._memory:
+                self._memory.put(("prefetch", index), "Prefetched",
+                                 sum(image.nbytes for image in decoded if image is not None),
+                                 MemoryBudget.PREFETCHED, release=functools.partial(self._prefetcher.cancel, index))
+
+    def updateMemoryUsage(self) -> None:
+        """
+        Updates the memory accounting of the dataset shown, of the cached volumes and of the prefetched datasets,
+        and evicts cached and prefetched data if the budget is exceeded. The dataset shown is pinned, the cached
+        volumes of the datasets to prefetch are evicted last.
+        """
+        for category, nbytes in self._sceneMemoryUsage().items():
+            self._memory.put(("scene", category), category, nbytes, MemoryBudget.PINNED)
+        if self._loadingOrder:
+            currentSequence = self._loadingOrder[self._currentDatasetIndex][1]
+            prefetchedSequences = {self._loadingOrder[neighbour][1]
+                                   for neighbour in self._prefetchNeighbours(self._currentDatasetIndex)}
+            for key in self._memory.keys():
+                if key[0] != "volume":
+                    continue
+                if key[1] == currentSequence:
+                    self._memory.setPriority(key, MemoryBudget.PINNED)
+                elif key[1] in prefetchedSequences:
+                    self._memory.setPriority(key, MemoryBudget.PREFETCHED)
+                else:
+                    self._memory.setPriority(key, MemoryBudget.CACHED)
+        self._accountPrefetchedDatasets()
 
-    def startExperiment(self) -> None:
+    def memoryUsage(self) -> tuple:
         """
-        Called once the datasets are verified, to start the experiment
+        Returns the bytes retained by category, the total and the budget
         """
-        # Set the random seed from the parameter node
-        random_seed = int(self._parameterNode.orderSeed)
-        random.seed(random_seed)
+        return self._memory.usage(), self._memory.totalBytes, self._memory.budgetBytes
+
+    def _renderThreeDView(self, index) -> None:
+        # Reset the 3D view to center on the loaded data (there are no views when running without the GUI)
+        layoutManager = slicer.app.layoutManager()
+        if layoutManager is not None:
+            with self.instrumentation.measure("render", **self._datasetTags(index)):
+                threeDView = layoutManager.threeDWidget(0).threeDView()
+                threeDView.resetFocalPoint()
+                threeDView.renderWindow().Render()
+
+    @staticmethod
+    def isThreeDViewVisible() -> bool:
+        layoutManager = slicer.app.layoutManager()
+        if layoutManager is None or layoutManager.threeDViewCount == 0:
+            return False
+        return layoutManager.threeDWidget(0).isVisible()
 
-        # Prepare methods and sequences
-        methods = list(range(0, 4))  # Methods from 0 to 3
-        sequences = list(range(0, len(self._volumeFiles)))  # Sequence indices
-        random.shuffle(sequences)
+    def hasPendingSurfaces(self) -> bool:
+        """
+        Returns whether the surfaces of the current dataset are not built yet
+        """
+        return self._pendingSurfaces is not None
 
-        # Create the loading order and shuffle it
-        self._loadingOrder = list(itertools.product(methods, sequences))
-        random.shuffle(self._loadingOrder)
+    def _buildPendingSurfaces(self) -> bool:
+        if self._pendingSurfaces is None or not self._currentSegmentationNode:
+            return False
+        index, segmentationPath, decodedSegmentation = self._pendingSurfaces
+        self._pendingSurfaces = None
+        with self.instrumentation.measure("surface build", **self._datasetTags(index)):
+            self._createClosedSurface(self._currentSegmentationNode, segmentationPath, decodedSegmentation,
+                                      preview=True)
+            if self._currentSegmentationNode.GetDisplayNode() is not None:
+                self._currentSegmentationNode.GetDisplayNode().SetVisibility3D(True)
+        return True
+
+    def buildSurfaces(self) -> None:
+        """
+        Builds and shows the surfaces of the current dataset if they were deferred, as in the "On demand" surface
+        mode until the 3D view is visible or the rater asks for them
+        """
+        index = self._pendingSurfaces[0] if self._pendingSurfaces is not None else None
+        try:
+            qt.QApplication.setOverrideCursor(qt.Qt.WaitCursor)
+            built = self._buildPendingSurfaces()
+        finally:
+            qt.QApplication.restoreOverrideCursor()
+        if built:
+            self._renderThreeDView(index)
+
+
+    def loadDatasetAsync(self, index, onLoaded=None, onProgress=None) -> None:
+        """
+        Switches to the dataset at index without blocking the event loop. The files are decoded on the prefetch
+        thread while the current dataset stays in the scene, which is only updated once decoding has finished.
+        onProgress is called with a status message while waiting, and onLoaded once the dataset is in the scene.
+        A load still pending is cancelled by the next call, or by cancelPendingLoad.
+        """
+        if index < 0 or index >= len(self._loadingOrder):
+            print(f"Index {index} is out of range!")
+            return
+
+        if self._pendingLoad is not None and self._pendingLoad[0] == index:
+            # Already on its way, only the callbacks change
+            self._pendingLoad = (index, onLoaded, onProgress, self._pendingLoad[3])
+            return
+        if self._pendingLoad is not None and index == self._currentDatasetIndex:
+            # Going back to the dataset still in the scene
+            self.cancelPendingLoad()
+            if onLoaded is not None:
+                onLoaded()
+            return
+
+        self.cancelPendingLoad()
+        self._requestDecode(index)
+        self._pendingLoad = (index, onLoaded, onProgress, time.perf_counter())
+        self._loadTimer.start()
+        self._onLoadTimer()
+
+    def cancelPendingLoad(self) -> None:
+        """
+        Abandons the pending asynchronous load, if any. The current dataset stays in the scene.
+        """
+        if self._pendingLoad is None:
+            return
+        index = self._pendingLoad[0]
+        self._pendingLoad = None
+        self._loadTimer.stop()
+        # Keep decoding it if it is prefetched anyway
+        if index not in self._prefetchNeighbours(self._currentDatasetIndex):
+            self._prefetcher.cancel(index)
+
+    def isLoading(self) -> bool:
+        return self._pendingLoad is not None
+
+    def _onLoadTimer(self) -> None:
+        if self._pendingLoad is None:
+            self._loadTimer.stop()
+            return
+        index, onLoaded, onProgress, startTime = self._pendingLoad
+        if not self._prefetcher.isDone(index):
+            if onProgress is not None:
+                onProgress(f"Loading evaluation {index + 1}/{len(self._loadingOrder)}... "
+                           f"({time.perf_counter() - startTime:.1f}s)")
+            return
+
+        # Decoding is done, insert the dataset into the scene from the main thread
+        self._loadTimer.stop()
+        self._pendingLoad = None
+        if onProgress is not None:
+            onProgress(f"Displaying evaluation {index + 1}/{len(self._loadingOrder)}...")
+        self._currentDatasetIndex = index
+        self._parameterNode.currentEvaluation = index + 1
+        self.loadDataset(index)
+        if onLoaded is not None:
+            onLoaded()
+
+    def computeLoadingOrder(self) -> None:
+        """
+        Computes the loading order of the datasets from the order seed
+        """
+        random_seed = int(self._parameterNode.orderSeed)
+        numberOfMethods = self._registry.numberOfMethods
+        numberOfSequences = self._registry.numberOfCases
+        window = self._parameterNode.loadingOrderWindow
+
+        # Create the loading order. The blocked order keeps the presentations of each volume close to each
+        # other so that they are served from the volume cache.
+        if self._parameterNode.loadingOrderMode == "Blocked":
+            self._loadingOrder = blockedLoadingOrder(numberOfMethods, numberOfSequences, random_seed, window)
+        else:
+            self._loadingOrder = shuffledLoadingOrder(numberOfMethods, numberOfSequences, random_seed)
+
+        # Sharded sessions evaluate their part of the order, plus the evaluations shared by all shards
+        if self._parameterNode.shardCount > 1:
+            self._loadingOrder = shardLoadingOrder(
+                self._loadingOrder,
+                self._parameterNode.shardCount,
+                self._parameterNode.shardIndex - 1,
+                self._parameterNode.shardOverlapPercent / 100.0,
+                random_seed)
+
+        # Volumes are cached within the memory budget, the number of loads is estimated from their decoded sizes
+        self.expectedVolumeLoads = countVolumeLoads(
+            self._loadingOrder, self._parameterNode.memoryBudgetMB * 1024 * 1024, self._volumeSizes())
+        logging.info(f"Loading order ({self._parameterNode.loadingOrderMode}, seed {random_seed}): "
+                     f"about {self.expectedVolumeLoads} volume loads for {len(self._loadingOrder)} evaluations "
+                     f"with a memory budget of {self._parameterNode.memoryBudgetMB} MB")
+
+    def _volumeSizes(self) -> list:
+        """
+        Returns the estimated decoded size in bytes of the volume of each sequence, read from the file headers.
+        DICOM series, and files whose header cannot be read, are estimated by their file size.
+        """
+        sizes = []
+        for sequence_idx in range(self._registry.numberOfCases):
+            path = self._registry.volumePath(sequence_idx)
+            try:
+                sizes.append(self._fileSize(path) if isDicomSeriesPath(path) else imageSizeInBytes(path))
+            except Exception:
+                try:
+                    sizes.append(self._fileSize(path))
+                except OSError:
+                    sizes.append(0)
+        return sizes
+
+    def startExperiment(self) -> None:
+        """
+        Called once the datasets are verified and the loading order computed, to start the experiment
+        """
+        # Recover evaluations saved in a previous session, from the results file and the more recent journal or
+        # results database
+        self._restoreResultsFromFile()
+        if self._resultsDatabase is not None:
+            try:
+                self._restoreResultsFromRecords(self._resultsDatabase.records(self.sessionRaterName()))
+            except sqlite3.Error as e:
+                print(f"Failed to read previous results from {self._resultsDatabase.path}: {e}")
+        else:
+            self._restoreResultsFromRecords(self._resultsJournal.records())
+        # The journal or database holds the evaluations saved since the results file was last written
+        self.resumedEvaluations = int(np.count_nonzero(
+            numpy_support.vtk_to_numpy(self._resultsColumns["Method"]) >= 0))
+
+        # Continue with the first evaluation not scored yet, background work starts from there
+        self._currentDatasetIndex = self.firstUnscoredIndex()
+        self._parameterNode.currentEvaluation = self._currentDatasetIndex + 1
+        self._addTableToAnalytics()
+        if self._parameterNode.transcodingMode == "At experiment start":
+            self.startTranscoding()
+        if self._parameterNode.agreementMetrics:
+            self.startAgreementMetrics()
 
-        # Load the first dataset
         self.loadDataset(self._currentDatasetIndex)
 
 
+    def precomputeDatasets(self) -> None:
+        """
+        Builds and caches the derived data of every dataset in loading order, so that rater sessions start warm.
+        Requires initializeDatasets and computeLoadingOrder, but not the GUI.
+        """
+        transcodingFutures = self.startTranscoding() if self._parameterNode.transcodingMode != "Off" else []
+        metricsFutures = self._agreementMetricsCache.computeInBackground(
+            self._agreementMetricsCases(), self._parameterNode.workerProcesses, self._pythonExecutable) \
+            if self._parameterNode.agreementMetrics else {}
+        croppedSequences = set()
+        settings = self._decodeSettings()
+
+        for index in range(len(self._loadingOrder)):
+            # Decode the next segmentation while the surfaces of this one are built
+            if index + 1 < len(self._loadingOrder):
+                self._prefetcher.retain([index, index + 1])
+                self._prefetcher.request(index + 1, index + 1, None, self.getDatasetPaths(index + 1)[1], settings)
+
+            _, segmentation_path = self.getDatasetPaths(index)
+            decoded = self._prefetcher.take(index)
+            if decoded is None:
+                try:
+                    decoded = self._decodeDataset(index, None, segmentation_path, settings)
+                except Exception as e:
+                    print(f"Failed to decode {segmentation_path}: {e}")
+                    decoded = (None, None)
+            decodedSegmentation = decoded[1]
+
+            # The same segmentation node is reused for every dataset
+            segmentationNode = None
+            if decodedSegmentation is not None:
+                segmentationNode = self._updateSegmentationNode(
+                    self._currentSegmentationNode, decodedSegmentation, self._nodeNameFromPath(segmentation_path))
+            if segmentationNode is None:
+                segmentationNode = slicer.util.loadSegmentation(segmentation_path)
+            self._replaceCurrentNode("_currentSegmentationNode", segmentationNode)
+            if not segmentationNode:
+                print(f"Failed to load segmentation from {segmentation_path}")
+                continue
+
+            self._createClosedSurface(segmentationNode, segmentation_path, decodedSegmentation)
+
+            sequence_idx = self._loadingOrder[index][1]
+            if self._parameterNode.cropToSegmentation and sequence_idx not in croppedSequences:
+                try:
+                    self._readVolume(sequence_idx, self.getDatasetPaths(index)[0], **settings)
+                except Exception as e:
+                    print(f"Failed to crop volume {self.getDatasetPaths(index)[0]}: {e}")
+                croppedSequences.add(sequence_idx)
+            logging.info(f"Precomputed dataset {index + 1}/{len(self._loadingOrder)}: {segmentation_path}")
+        self.cleanScene()
+
+        wait(transcodingFutures)
+        for future in transcodingFutures:
+            if future.exception() is not None:
+                print(f"Transcoding failed: {future.exception()}")
+        wait(metricsFutures.values())
+        for sequence_idx, future in metricsFutures.items():
+            if future.exception() is not None:
+                print(f"Failed to compute the agreement metrics of sequence {sequence_idx}: {future.exception()}")
+
     def isLastDataset(self) -> bool:
         return self._currentDatasetIndex == len(self._loadingOrder) - 1
 
@@ -585,20 +1783,35 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
         else:
             return False
 
-    def cleanScene(self) -> None:
+    def _replaceCurrentNode(self, attributeName, node) -> None:
+        """
+        Makes node the current node stored in attributeName, removing the previous one from the scene if it was
+        not reused
+        """
+        previousNode = getattr(self, attributeName)
+        if previousNode is not None and previousNode is not node and self._isInScene(previousNode):
+            slicer.mrmlScene.RemoveNode(previousNode)
+        setattr(self, attributeName, node or None)
 
-        slicer.mrmlScene.RemoveNode(self._currentVolumeNode)
-        slicer.mrmlScene.RemoveNode(self._currentSegmentationNode)
+    def cleanScene(self) -> None:
+        """
+        Removes the dataset nodes from the scene. Not needed between datasets, whose nodes are reused.
+        """
+        with self.instrumentation.measure("clean scene"):
+            for node in (self._currentVolumeNode, self._currentSegmentationNode, self._labelmapNode):
+                if self._isInScene(node):
+                    slicer.mrmlScene.RemoveNode(node)
+            self._currentVolumeNode = None
+            self._currentSegmentationNode = None
+            self._labelmapNode = None
 
 
     def firstDataset(self) -> None:
-        self.cleanScene()
         self._currentDatasetIndex = 0
         self._parameterNode.currentEvaluation = 1
         self.loadDataset(self._currentDatasetIndex)
 
     def lastDataset(self) -> None:
-        self.cleanScene()
         self._currentDatasetIndex = len(self._loadingOrder) - 1
         self._parameterNode.currentEvaluation = self._parameterNode.totalEvaluations
         self.loadDataset(self._currentDatasetIndex)
@@ -607,9 +1820,7 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
         if self._currentDatasetIndex + 1 < len(self._loadingOrder):
             self._currentDatasetIndex += 1
             self._parameterNode.currentEvaluation += 1
-            # Clear the scene
-            self.cleanScene()
-            # Load the next dataset
+            # Load the next dataset into the current nodes
             self.loadDataset(self._currentDatasetIndex)
         else:
             print("No more datasets to load.")
@@ -619,56 +1830,266 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
         if self._currentDatasetIndex > 0:
             self._currentDatasetIndex -= 1
             self._parameterNode.currentEvaluation -= 1
-            # Clear the scene
-            self.cleanScene()
-            # Load the previous dataset
+            # Load the previous dataset into the current nodes
             self.loadDataset(self._currentDatasetIndex)
         else:
             print("This is the first dataset.")
 
 
+    def firstDatasetAsync(self, onLoaded=None, onProgress=None) -> None:
+        self.loadDatasetAsync(0, onLoaded, onProgress)
+
+    def lastDatasetAsync(self, onLoaded=None, onProgress=None) -> None:
+        self.loadDatasetAsync(len(self._loadingOrder) - 1, onLoaded, onProgress)
+
+    def nextDatasetAsync(self, onLoaded=None, onProgress=None) -> None:
+        if self._currentDatasetIndex + 1 < len(self._loadingOrder):
+            self.loadDatasetAsync(self._currentDatasetIndex + 1, onLoaded, onProgress)
+        else:
+            print("No more datasets to load.")
+
+    def previousDatasetAsync(self, onLoaded=None, onProgress=None) -> None:
+        """
+        Goes back from the dataset shown, not from the one still loading: the pending load is cancelled first
+        """
+        self.cancelPendingLoad()
+        if self._currentDatasetIndex > 0:
+            self.loadDatasetAsync(self._currentDatasetIndex - 1, onLoaded, onProgress)
+        else:
+            print("This is the first dataset.")
+
     def saveCurrentDataToTable(self) -> None:
         currentRowIndex = self._currentDatasetIndex
         method_idx, sequence_idx = self._loadingOrder[self._currentDatasetIndex]
 
-        # Get data to save
-        sequenceNumber = sequence_idx
-        methodNumber = method_idx
-        volumeFileName = self._volumeFiles[sequence_idx]
-        segmentationDirectories = [
-            self._parameterNode.method1Directory,
-            self._parameterNode.method2Directory,
-            self._parameterNode.method3Directory,
-            self._parameterNode.method4Directory,
-        ]
-        segmentationFiles = [
-            self._method1Files,
-            self._method2Files,
-            self._method3Files,
-            self._method4Files,
-        ]
-        segmentationFileName = segmentationFiles[method_idx][sequence_idx]
-
-        q1Score = self._parameterNode.question1Score
-        q2Score = self._parameterNode.question2Score
-        q3Score = self._parameterNode.question3Score
-        q4Score = self._parameterNode.question4Score
-
-        # Save values to the table
-        self._resultsTable.GetColumnByName("Sequence").SetValue(currentRowIndex, sequenceNumber)
-        self._resultsTable.GetColumnByName("Method").SetValue(currentRowIndex, methodNumber)
-        self._resultsTable.GetColumnByName("Volume File").SetValue(currentRowIndex, volumeFileName)
-        self._resultsTable.GetColumnByName("Segmentation File").SetValue(currentRowIndex, segmentationFileName)
-        self._resultsTable.GetColumnByName("Q1 Scoring").SetValue(currentRowIndex, q1Score)
-        self._resultsTable.GetColumnByName("Q2 Scoring").SetValue(currentRowIndex, q2Score)
-        self._resultsTable.GetColumnByName("Q3 Scoring").SetValue(currentRowIndex, q3Score)
-        self._resultsTable.GetColumnByName("Q4 Scoring").SetValue(currentRowIndex, q4Score)
+        record = {
+            "Sequence": sequence_idx,
+            "Method": method_idx,
+            "Volume File": self._registry.volumeFile(sequence_idx),
+            "Segmentation File": self._registry.segmentationFile(method_idx, sequence_idx),
+            "Q1 Scoring": self._parameterNode.question1Score,
+            "Q2 Scoring": self._parameterNode.question2Score,
+            "Q3 Scoring": self._parameterNode.question3Score,
+            "Q4 Scoring": self._parameterNode.question4Score,
+        }
+
+        with self.instrumentation.measure("table save", **self._datasetTags(currentRowIndex)):
+            # Save values to the table
+            for columnName, value in record.items():
+                self._resultsColumns[columnName].SetValue(currentRowIndex, value)
+            self._resultsTable.Modified()
+
+            # Journal or upsert the evaluation instead of rewriting the whole results file
+            if self._resultsDatabase is not None:
+                self._resultsDatabase.save(self.sessionRaterName(), record)
+            else:
+                self._resultsJournal.append(record)
+
+        self.analytics.add(self.analytics.raterIndex(self.sessionRaterName()), method_idx, sequence_idx,
+                           [record[columnName] for columnName in self.scoreColumns()])
+
+        # The results file is written once the rater reaches the end of the experiment
+        if self.isLastDataset():
+            self.compactResults()
+
+    def compactResults(self) -> None:
+        """
+        Writes the results table to the output file and compacts the results journal, if any
+        """
+        numRows = self._resultsTable.GetNumberOfRows()
+        # Metrics still being computed are written as NaN
+        columns = [(columnName, columnType) for columnName, columnType in self.RESULTS_COLUMNS + self.METRICS_COLUMNS
+                   if columnName in self._resultsColumns]
+        header = [columnName for columnName, _ in columns]
+        columnValues = []
+        for columnName, columnType in columns:
+            column = self._resultsColumns[columnName]
+            if columnType == vtk.VTK_STRING:
+                columnValues.append([column.GetValue(rowIndex) for rowIndex in range(numRows)])
+            else:
+                columnValues.append(numpy_support.vtk_to_numpy(column).tolist())
+        if self._resultsJournal is not None:
+            self._resultsJournal.compact(self.resultsFileName(), header, zip(*columnValues))
+        else:
+            writeResultsCsv(self.resultsFileName(), header, zip(*columnValues))
 
+    def exportResultsDatabase(self, outputPath) -> Optional[int]:
+        """
+        Writes the evaluations of all raters in the results database of the output directory to outputPath, with
+        one row per rater and evaluation. Returns the number of evaluations written, or None if the database could
+        not be read.
+        """
+        database = self._resultsDatabase
+        if database is None:
+            if not os.path.isfile(self.resultsDatabaseFileName()):
+                print(f"No results database found at {self.resultsDatabaseFileName()}")
+                return None
+            database = self._openResultsDatabase()
+        try:
+            return database.exportCsv(outputPath)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Failed to export results from {database.path} to {outputPath}: {e}")
+            return None
+        finally:
+            if database is not self._resultsDatabase:
+                database.close()
+
+    @classmethod
+    def scoreColumns(cls) -> tuple:
+        return tuple(columnName for columnName, _ in cls.RESULTS_COLUMNS if columnName.endswith("Scoring"))
+
+    def mergeShardResults(self, paths, outputPath) -> Optional[list]:
+        """
+        Merges the results files of the shards of a study into outputPath, with one row per shard and evaluation.
+        Returns the conflicts and missing evaluations found, the file is written even if there are some. Returns
+        None if the files could not be merged.
+        """
+        try:
+            header, rows, problems = mergeShardResults(paths, self.scoreColumns())
+            writeMergedResults(outputPath, header, rows)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Failed to merge shard results: {e}")
+            return None
+        for problem in problems:
+            print(problem)
+        return problems
+
+    def _restoreResultsFromFile(self) -> int:
+        """
+        Fills the results table with the evaluations of an existing results file, if it was made on the same
+        datasets in the same order (i.e. with the same seed). Returns the number of evaluations restored.
+        """
+        path = self.resultsFileName()
+        if not os.path.isfile(path):
+            return 0
+
+        try:
+            columns = readResultsColumns(path)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Failed to read previous results from {path}: {e}")
+            return 0
+
+        missingColumns = [columnName for columnName, _ in self.RESULTS_COLUMNS if columnName not in columns]
+        if missingColumns or len(columns["Method"]) != len(self._loadingOrder):
+            print(f"Previous results in {path} do not match this experiment, they are not restored")
+            return 0
+
+        try:
+            methods = columns["Method"].astype(np.int64)
+            sequences = columns["Sequence"].astype(np.int64)
+        except ValueError as e:
+            print(f"Failed to read previous results from {path}: {e}")
+            return 0
+        saved = methods >= 0
+        savedRows = np.flatnonzero(saved)
+        if not self._matchesExperiment(savedRows, methods[saved], sequences[saved],
+                                       columns["Volume File"][saved], columns["Segmentation File"][saved]).all():
+            print(f"Previous results in {path} were made with other datasets or another order seed, "
+                  f"they are not restored")
+            return 0
+
+        for columnName, columnType in self.RESULTS_COLUMNS:
+            column = self._resultsColumns[columnName]
+            if columnType == vtk.VTK_STRING:
+                for row in savedRows:
+                    column.SetValue(int(row), columns[columnName][row])
+            else:
+                # Integer columns are written through a view of their memory
+                numpy_support.vtk_to_numpy(column)[saved] = columns[columnName][saved].astype(np.int64)
+                column.Modified()
         self._resultsTable.Modified()
+        logging.info(f"Restored {savedRows.size} evaluations from {path}")
+        return int(savedRows.size)
 
-        # Save the table to the CSV file
-        fileName = self._parameterNode.outputFileName
-        slicer.util.saveNode(self._parameterNode.resultsTableNode, fileName)
+    def _matchesExperiment(self, rows, methods, sequences, volumeFiles, segmentationFiles) -> np.ndarray:
+        """
+        Returns, for each saved evaluation, whether it is at its row of the loading order (i.e. it was made with the
+        same seed) and was made on the current files
+        """
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        methods = np.atleast_1d(np.asarray(methods, dtype=np.int64))
+        sequences = np.atleast_1d(np.asarray(sequences, dtype=np.int64))
+        loadingOrder = np.array(self._loadingOrder, dtype=np.int64).reshape(-1, 2)
+        inOrder = np.zeros(len(rows), dtype=bool)
+        valid = (rows >= 0) & (rows < len(loadingOrder))
+        inOrder[valid] = ((loadingOrder[rows[valid], 0] == methods[valid])
+                          & (loadingOrder[rows[valid], 1] == sequences[valid]))
+        return inOrder & self._registry.matches(
+            methods, sequences, np.asarray(volumeFiles, dtype=object), np.asarray(segmentationFiles, dtype=object))
+
+    def sessionRaterName(self) -> str:
+        """
+        Name of the rater of this session, in the results database and in the analytics
+        """
+        return self._parameterNode.raterName
+
+    def _addTableToAnalytics(self) -> None:
+        methods = numpy_support.vtk_to_numpy(self._resultsColumns["Method"])
+        saved = methods >= 0
+        scores = np.column_stack([numpy_support.vtk_to_numpy(self._resultsColumns[columnName])
+                                  for columnName in self.scoreColumns()])
+        rater = self.analytics.raterIndex(self.sessionRaterName())
+        self.analytics.add(np.full(np.count_nonzero(saved), rater), methods[saved],
+                           numpy_support.vtk_to_numpy(self._resultsColumns["Sequence"])[saved], scores[saved])
+
+    def analyzeResultsFiles(self, paths) -> list:
+        """
+        Replaces the ratings of the analytics by the ones of results files (one rater per file, or per shard for
+        merged shard results), followed by the ratings of this session if an experiment is running. The results
+        file of the running session is skipped, its ratings are the ones of the session.
+        Returns the files that could not be read, the others are analyzed.
+        """
+        self.analytics.clear()
+        problems = []
+        sessionResultsFile = os.path.normcase(os.path.abspath(self.resultsFileName())) if self._resultsColumns else None
+        for path in paths:
+            if os.path.normcase(os.path.abspath(path)) == sessionResultsFile:
+                continue
+            try:
+                self.analytics.addResultsFile(path)
+            except (OSError, ValueError, csv.Error) as e:
+                problems.append(f"{path}: {e}")
+                print(f"Failed to read results from {path}: {e}")
+        if self._resultsColumns:
+            self._addTableToAnalytics()
+        return problems
+
+    def firstUnscoredIndex(self) -> int:
+        """
+        Returns the index of the first evaluation not saved yet, or of the last one if all are
+        """
+        methods = numpy_support.vtk_to_numpy(self._resultsColumns["Method"])
+        unscored = np.flatnonzero(methods < 0)
+        return int(unscored[0]) if unscored.size else len(self._loadingOrder) - 1
+
+    def _restoreResultsFromRecords(self, records: list) -> None:
+        """
+        Fills the results table with the journaled or stored evaluations matching the current datasets
+        """
+        rowIndices = {datasetKey: rowIndex for rowIndex, datasetKey in enumerate(self._loadingOrder)}
+
+        # Records of evaluations out of the loading order are dropped, the others are checked at once
+        records = [(rowIndices[(record.get("Method"), record.get("Sequence"))], record) for record in records
+                   if (record.get("Method"), record.get("Sequence")) in rowIndices]
+        if not records:
+            return
+        matching = self._matchesExperiment(
+            [rowIndex for rowIndex, _ in records],
+            [record["Method"] for _, record in records],
+            [record["Sequence"] for _, record in records],
+            [record.get("Volume File") for _, record in records],
+            [record.get("Segmentation File") for _, record in records])
+
+        # Later records of an evaluation replace the earlier ones
+        for (rowIndex, record), matches in zip(records, matching):
+            if not matches:
+                continue
+            for columnName, value in record.items():
+                column = self._resultsColumns.get(columnName)
+                if column is not None:
+                    column.SetValue(rowIndex, value)
+
+        self._resultsTable.Modified()
 
     def loadDataFromTable(self):
         currentRowIndex = self._currentDatasetIndex
@@ -679,10 +2100,10 @@ class SlicerLiverSegmentsLogic(ScriptedLoadableModuleLogic):
             except ValueError:
                 return -1
 
-        q1Score = safeInt(self._resultsTable.GetColumnByName("Q1 Scoring").GetValue(currentRowIndex))
-        q2Score = safeInt(self._resultsTable.GetColumnByName("Q2 Scoring").GetValue(currentRowIndex))
-        q3Score = safeInt(self._resultsTable.GetColumnByName("Q3 Scoring").GetValue(currentRowIndex))
-        q4Score = safeInt(self._resultsTable.GetColumnByName("Q4 Scoring").GetValue(currentRowIndex))
+        q1Score = safeInt(self._resultsColumns["Q1 Scoring"].GetValue(currentRowIndex))
+        q2Score = safeInt(self._resultsColumns["Q2 Scoring"].GetValue(currentRowIndex))
+        q3Score = safeInt(self._resultsColumns["Q3 Scoring"].GetValue(currentRowIndex))
+        q4Score = safeInt(self._resultsColumns["Q4 Scoring"].GetValue(currentRowIndex))
 
         if q1Score == -1:
             # No data saved previously
@@ -711,57 +2132,217 @@ class SlicerLiverSegmentsTest(ScriptedLoadableModuleTest):
 
     def setUp(self):
         """ Do whatever is needed to reset the state - typically a scene clear will be enough.
+        Each test gets a small synthetic study with 2 cases and 4 methods, and a logic configured to evaluate it.
         """
+        import tempfile
+        from SlicerLiverSegmentsLib import writeSyntheticStudy
+
         slicer.mrmlScene.Clear()
+        self.studyDirectory = tempfile.mkdtemp(prefix="SlicerLiverSegmentsTest")
+        self.volumesDirectory, self.methodDirectories = writeSyntheticStudy(
+            self.studyDirectory, numberOfCases=2, shape=(24, 32, 32))
+
+        self.logic = SlicerLiverSegmentsLogic()
+        self.parameterNode = self.logic.getParameterNode()
+        self.parameterNode.volumesDirectory = self.volumesDirectory
+        self.parameterNode.methodDirectories = list(self.methodDirectories)
+        self.parameterNode.orderSeed = "1234"
+        self.parameterNode.outputFileName = os.path.join(self.studyDirectory, "results.csv")
+        self.parameterNode.raterName = "Rater A"
+        self.parameterNode.resultsBackend = "CSV"
+        self.parameterNode.agreementMetrics = False
+        self.parameterNode.cacheDirectory = os.path.join(self.studyDirectory, "Cache")
+        self.parameterNode.resultsTableNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode")
+
+    def tearDown(self):
+        self.logic.cleanup()
+        slicer.mrmlScene.Clear()
+        shutil.rmtree(self.studyDirectory, ignore_errors=True)
 
     def runTest(self):
         """Run as few or as many tests as needed here.
         """
-        self.setUp()
-        self.test_SlicerLiverSegments1()
+        for test in [
+            self.test_Navigation,
+            self.test_ResultsFile,
+            self.test_AgreementMetrics,
+            self.test_NumberOfMethods,
+            self.test_ResumeFromResultsFile,
+            self.test_ResultsDatabase,
+        ]:
+            self.setUp()
+            try:
+                test()
+            finally:
+                self.tearDown()
 
-    def test_SlicerLiverSegments1(self):
-        """ Ideally you should have several levels of tests.  At the lowest level
-        tests should exercise the functionality of the logic with different inputs
-        (both valid and invalid).  At higher levels your tests should emulate the
-        way the user would interact with your code and confirm that it still works
-        the way you intended.
-        One of the most important features of the tests is that it should alert other
-        developers when their changes will have an impact on the behavior of your
-        module.  For example, if a developer removes a feature that you depend on,
-        your test should break so they know that the feature is needed.
+    def startNewSession(self) -> None:
         """
+        Replaces the logic by a new one and starts the experiment, as when Slicer is started again
+        """
+        self.logic.cleanup()
+        self.logic = SlicerLiverSegmentsLogic()
+        self.assertTrue(self.logic.initializeExperiment())
+        self.logic.startExperiment()
 
-        self.delayDisplay("Starting the test")
-
-        # Get/create input data
-
-        import SampleData
-        registerSampleData()
-        inputVolume = SampleData.downloadSample('SlicerLiverSegments1')
-        self.delayDisplay('Loaded test data set')
+    def waitForLoad(self, timeout: float = 30.0) -> None:
+        """
+        Processes events until the pending asynchronous load, if any, has finished
+        """
+        deadline = time.perf_counter() + timeout
+        while self.logic.isLoading():
+            self.assertLess(time.perf_counter(), deadline)
+            slicer.app.processEvents()
+            time.sleep(0.01)
 
-        inputScalarRange = inputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(inputScalarRange[0], 0)
-        self.assertEqual(inputScalarRange[1], 695)
+    def scoreAllDatasets(self) -> None:
+        """
+        Scores every dataset from the current one on with its position in the loading order
+        """
+        while True:
+            score = self.logic._currentDatasetIndex % 5 + 1
+            self.parameterNode.question1Score = score
+            self.parameterNode.question2Score = score
+            self.parameterNode.question3Score = score
+            self.parameterNode.question4Score = score
+            self.logic.saveCurrentDataToTable()
+            if self.logic.isLastDataset():
+                break
+            self.logic.nextDataset()
 
-        outputVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
-        threshold = 100
+    def test_Navigation(self):
+        """ The datasets are loaded in the seeded order, and saved scores are restored when navigating back.
+        """
+        self.delayDisplay("Starting the navigation test")
+        logic, parameterNode = self.logic, self.parameterNode
+        self.assertTrue(logic.canExperimentStart())
+
+        self.assertTrue(logic.initializeExperiment())
+        self.assertEqual(parameterNode.totalEvaluations, 8)
+        logic.startExperiment()
+        self.assertIsNotNone(logic._currentVolumeNode)
+        self.assertEqual(logic._currentSegmentationNode.GetSegmentation().GetNumberOfSegments(), 8)
+        volumeNode, segmentationNode = logic._currentVolumeNode, logic._currentSegmentationNode
+        self.scoreAllDatasets()
+
+        # The nodes are reused from one dataset to the next
+        self.assertIs(logic._currentVolumeNode, volumeNode)
+        self.assertIs(logic._currentSegmentationNode, segmentationNode)
+        self.assertEqual(segmentationNode.GetSegmentation().GetNumberOfSegments(), 8)
+
+        # The dataset shown is accounted for and pinned, whatever the budget
+        logic.updateMemoryUsage()
+        usage, totalBytes, budgetBytes = logic.memoryUsage()
+        self.assertGreater(usage["Volumes"], 0)
+        self.assertGreater(usage["Labelmaps"], 0)
+        self.assertEqual(totalBytes, sum(usage.values()))
+
+        # Saved scores are shown again when going back
+        logic.previousDataset()
+        self.assertEqual(parameterNode.question1Score, logic._currentDatasetIndex % 5 + 1)
+        logic.firstDataset()
+        self.assertTrue(logic.isPreviousFirstDataset())
+        self.assertEqual(parameterNode.question4Score, 1)
+
+        # Going back while the next dataset is loading steps back from the dataset shown
+        logic.nextDataset()
+        logic.nextDatasetAsync()
+        shownIndex = logic._currentDatasetIndex
+        logic.previousDatasetAsync()
+        self.waitForLoad()
+        self.assertEqual(logic._currentDatasetIndex, shownIndex - 1)
+        self.assertEqual(parameterNode.currentEvaluation, shownIndex)
+
+        # On the first dataset, it only cancels the load
+        logic.firstDataset()
+        logic.nextDatasetAsync()
+        logic.previousDatasetAsync()
+        self.waitForLoad()
+        self.assertEqual(logic._currentDatasetIndex, 0)
+        self.delayDisplay('Test passed')
 
-        # Test the module logic
+    def test_ResultsFile(self):
+        """ All evaluations are written to the results file, and are in the analytics.
+        """
+        self.delayDisplay("Starting the results file test")
+        logic, parameterNode = self.logic, self.parameterNode
+        self.assertTrue(logic.initializeExperiment())
+        logic.startExperiment()
+        self.scoreAllDatasets()
+
+        with open(parameterNode.outputFileName) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(sorted((int(row["Method"]), int(row["Sequence"])) for row in rows),
+                         [(method, sequence) for method in range(4) for sequence in range(2)])
+        self.assertTrue(all(int(row["Q1 Scoring"]) > 0 for row in rows))
+        # Without agreement metrics, the results file has no metrics columns
+        self.assertEqual(list(rows[0]), [columnName for columnName, _ in logic.RESULTS_COLUMNS])
+
+        # Saved evaluations are in the analytics, also when analyzing the results file again
+        self.assertEqual(len(logic.analytics), 8)
+        self.assertEqual(logic.analyzeResultsFiles([parameterNode.outputFileName]), [])
+        self.assertEqual(len(logic.analytics), 8)
+        self.assertEqual(logic.analytics.numberOfRaters, 1)
+        self.delayDisplay('Test passed')
 
-        logic = SlicerLiverSegmentsLogic()
+    def test_AgreementMetrics(self):
+        """ Every method fully agrees with itself, and the agreement between methods is symmetric.
+        """
+        self.delayDisplay("Starting the agreement metrics test")
+        self.assertTrue(self.logic.initializeDatasets())
+        metrics = caseAgreementMetrics(self.logic.getSegmentationPaths(0))
+        self.assertEqual(len(metrics["volumes"]), 4)
+        dice = np.array(metrics["dice"])
+        self.assertTrue(np.allclose(dice, dice.transpose(0, 2, 1), equal_nan=True))
+        self.assertTrue(np.all(dice[:, range(4), range(4)] == 1.0))
+        self.delayDisplay('Test passed')
 
-        # Test algorithm with non-inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, True)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], threshold)
+    def test_NumberOfMethods(self):
+        """ Any number of methods can be compared, the loading order covers all of them.
+        """
+        self.delayDisplay("Starting the number of methods test")
+        self.parameterNode.methodDirectories = list(self.methodDirectories[:3])
+        self.assertTrue(self.logic.initializeDatasets())
+        self.logic.computeLoadingOrder()
+        self.assertEqual(sorted(self.logic._loadingOrder),
+                         [(method, sequence) for method in range(3) for sequence in range(2)])
+        self.assertEqual(len(self.logic.getSegmentationPaths(1)), 3)
+        self.delayDisplay('Test passed')
 
-        # Test algorithm with inverted threshold
-        logic.process(inputVolume, outputVolume, threshold, False)
-        outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-        self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-        self.assertEqual(outputScalarRange[1], inputScalarRange[1])
+    def test_ResumeFromResultsFile(self):
+        """ A new session resumes from the results file.
+        """
+        self.delayDisplay("Starting the resume test")
+        self.assertTrue(self.logic.initializeExperiment())
+        self.logic.startExperiment()
+        self.assertEqual(self.logic.resumedEvaluations, 0)
+        self.scoreAllDatasets()
+
+        self.startNewSession()
+        self.assertEqual(self.logic.resumedEvaluations, 8)
+        self.assertTrue(self.logic.isLastDataset())
+        self.delayDisplay('Test passed')
 
+    def test_ResultsDatabase(self):
+        """ Evaluations saved to the results database are exported with their rater, and resumed from it.
+        """
+        self.delayDisplay("Starting the results database test")
+        logic, parameterNode = self.logic, self.parameterNode
+        parameterNode.resultsBackend = "SQLite"
+        self.assertTrue(logic.initializeExperiment())
+        logic.startExperiment()
+        self.scoreAllDatasets()
+        exportPath = os.path.join(self.studyDirectory, "export.csv")
+        self.assertEqual(logic.exportResultsDatabase(exportPath), 8)
+        logic.cleanup()
+        with open(exportPath) as f:
+            self.assertEqual({row["Rater"] for row in csv.DictReader(f)}, {"Rater A"})
+        self.assertEqual(logic.analyzeResultsFiles([exportPath]), [])
+        self.assertEqual(logic.analytics.numberOfRaters, 1)
+
+        # Without the results file, the evaluations are resumed from the database
+        os.remove(parameterNode.outputFileName)
+        self.startNewSession()
+        self.assertEqual(self.logic.resumedEvaluations, 8)
         self.delayDisplay('Test passed')
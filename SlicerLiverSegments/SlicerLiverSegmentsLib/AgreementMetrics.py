@@ -0,0 +1,268 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import SimpleITK as sitk
+
+from .Cropping import _boxCorners, labelBounds
+from .ImageIO import DecodedImage, readImage
+from .SurfaceCache import fileContentHash
+
+__all__ = ["AGREEMENT_METRICS", "AgreementMetricsCache", "caseAgreementMetrics", "methodAgreement"]
+
+# Agreement of a method with the other methods of a case, averaged over segments, in results table order
+AGREEMENT_METRICS = (
+    "Dice",
+    "Volume Difference (%)",
+    "Hausdorff (mm)",
+    "Hausdorff 95 (mm)",
+    "Mean Surface Distance (mm)",
+)
+
+
+def _commonGrid(images: list):
+    """
+    Returns the origin, spacing, direction and size of a grid covering the labels of all images, aligned with the
+    first one, as fine as the finest one and with a margin of one voxel, or None if all images are empty.
+    """
+    bounds = [imageBounds for imageBounds in (labelBounds(image) for image in images) if imageBounds is not None]
+    if not bounds:
+        return None
+    lower = np.min([imageBounds[0] for imageBounds in bounds], axis=0)
+    upper = np.max([imageBounds[1] for imageBounds in bounds], axis=0)
+    direction = np.array(images[0].direction, dtype=float).reshape(3, 3)
+    spacing = np.min([image.spacing for image in images], axis=0)
+    # Extent of the labels along the axes of the grid
+    extent = _boxCorners(lower, upper) @ direction
+    start = extent.min(axis=0) - spacing
+    size = np.ceil((extent.max(axis=0) + spacing - start) / spacing).astype(int)
+    origin = direction @ (start + spacing / 2)
+    return tuple(origin.tolist()), tuple(spacing.tolist()), tuple(direction.ravel().tolist()), tuple(size.tolist())
+
+
+def _resampleLabelmap(decoded: DecodedImage, grid: tuple) -> np.ndarray:
+    """
+    Returns the KJI labels of a labelmap on a grid, by nearest neighbour interpolation
+    """
+    array = decoded.array
+    if array.ndim != 3:
+        # Multi-layer labelmaps are flattened, overlapping voxels keep the highest label
+        array = array.reshape(array.shape[:3] + (-1,)).max(axis=3)
+    image = sitk.GetImageFromArray(np.ascontiguousarray(array))
+    image.SetOrigin(decoded.origin)
+    image.SetSpacing(decoded.spacing)
+    image.SetDirection(decoded.direction)
+    origin, spacing, direction, size = grid
+    resampled = sitk.Resample(image, size, sitk.Transform(), sitk.sitkNearestNeighbor,
+                              origin, spacing, direction, 0, image.GetPixelID())
+    return sitk.GetArrayFromImage(resampled)
+
+
+def _surfaceVoxels(mask: np.ndarray) -> np.ndarray:
+    """
+    Returns the voxels of a KJI mask with a face neighbour outside of it. The mask must not touch its borders.
+    """
+    interior = np.zeros_like(mask)
+    interior[1:-1, 1:-1, 1:-1] = (
+        mask[1:-1, 1:-1, 1:-1]
+        & mask[:-2, 1:-1, 1:-1] & mask[2:, 1:-1, 1:-1]
+        & mask[1:-1, :-2, 1:-1] & mask[1:-1, 2:, 1:-1]
+        & mask[1:-1, 1:-1, :-2] & mask[1:-1, 1:-1, 2:]
+    )
+    return mask & ~interior
+
+
+def _distanceToSurface(mask: np.ndarray, spacing: tuple) -> np.ndarray:
+    """
+    Returns the distance in millimeters from every voxel to the surface of a KJI mask
+    """
+    image = sitk.GetImageFromArray(mask.astype(np.uint8))
+    image.SetSpacing(spacing)
+    distances = sitk.SignedMaurerDistanceMap(image, insideIsPositive=False, squaredDistance=False,
+                                             useImageSpacing=True)
+    return np.abs(sitk.GetArrayFromImage(distances))
+
+
+def _nanMean(values) -> float:
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if values.size else float("nan")
+
+
+def caseAgreementMetrics(segmentationPaths: list) -> dict:
+    """
+    Computes the agreement between the segmentations of a case by several methods, segment by segment.
+
+    The labelmaps are resampled to a common grid covering all their labels. Returns the label values, their
+    volumes in ml indexed [method][label], and the Dice coefficients and the symmetric Hausdorff, 95th percentile
+    Hausdorff and mean surface distances in mm between methods, indexed [label][method][method]. Distances are
+    NaN when a segment is missing from one of the methods.
+    """
+    images = [readImage(path) for path in segmentationPaths]
+    numberOfMethods = len(images)
+    grid = _commonGrid(images)
+    if grid is None:
+        labels = np.empty(0, dtype=int)
+        labelmaps = np.zeros((numberOfMethods, 1, 1, 1), dtype=np.uint8)
+        spacing = (1.0, 1.0, 1.0)
+    else:
+        labelmaps = np.stack([_resampleLabelmap(image, grid) for image in images])
+        labels = np.unique(labelmaps)
+        labels = labels[labels != 0]
+        spacing = grid[1]
+    voxelVolume = float(np.prod(spacing)) / 1000.0
+
+    shape = (len(labels), numberOfMethods, numberOfMethods)
+    volumes = np.zeros((numberOfMethods, len(labels)))
+    dice = np.full(shape, np.nan)
+    hausdorff = np.full(shape, np.nan)
+    hausdorff95 = np.full(shape, np.nan)
+    meanSurfaceDistance = np.full(shape, np.nan)
+    for labelIndex, label in enumerate(labels):
+        masks = labelmaps == label
+        # Crop to the segment in all methods, keeping a margin of one voxel
+        union = masks.any(axis=0)
+        box = []
+        for axis in range(3):
+            indices = np.flatnonzero(union.any(axis=tuple(a for a in range(3) if a != axis)))
+            box.append(slice(max(indices[0] - 1, 0), indices[-1] + 2))
+        masks = masks[(slice(None),) + tuple(box)]
+
+        voxelCounts = masks.reshape(numberOfMethods, -1).sum(axis=1)
+        volumes[:, labelIndex] = voxelCounts * voxelVolume
+        surfaces = [_surfaceVoxels(mask) for mask in masks]
+        distances = [_distanceToSurface(mask, spacing) if count else None for mask, count in zip(masks, voxelCounts)]
+
+        for first, second in itertools.combinations(range(numberOfMethods), 2):
+            indices = (labelIndex, [first, second], [second, first])
+            if voxelCounts[first] + voxelCounts[second]:
+                dice[indices] = (2.0 * np.count_nonzero(masks[first] & masks[second])
+                                 / (voxelCounts[first] + voxelCounts[second]))
+            if distances[first] is None or distances[second] is None:
+                continue
+            forward = distances[second][surfaces[first]]
+            backward = distances[first][surfaces[second]]
+            hausdorff[indices] = max(forward.max(), backward.max())
+            hausdorff95[indices] = max(np.percentile(forward, 95), np.percentile(backward, 95))
+            meanSurfaceDistance[indices] = (forward.sum() + backward.sum()) / (forward.size + backward.size)
+        present = voxelCounts > 0
+        dice[labelIndex, present, present] = 1.0
+        hausdorff[labelIndex, present, present] = 0.0
+        hausdorff95[labelIndex, present, present] = 0.0
+        meanSurfaceDistance[labelIndex, present, present] = 0.0
+
+    return {
+        "labels": labels.tolist(),
+        "volumes": volumes.tolist(),
+        "dice": dice.tolist(),
+        "hausdorff": hausdorff.tolist(),
+        "hausdorff95": hausdorff95.tolist(),
+        "meanSurfaceDistance": meanSurfaceDistance.tolist(),
+    }
+
+
+def methodAgreement(metrics: dict, method: int) -> tuple:
+    """
+    Returns the agreement of a method with the other methods of a case, as the mean over the other methods and
+    the segments of each metric of AGREEMENT_METRICS. The volume difference is relative to the mean of both
+    volumes. Values are NaN when undefined.
+    """
+    volumes = np.array(metrics["volumes"], dtype=float)
+    numberOfMethods = len(volumes)
+    others = [other for other in range(numberOfMethods) if other != method]
+    if not metrics["labels"] or not others:
+        return tuple(float("nan") for _ in AGREEMENT_METRICS)
+
+    methodVolumes = volumes[method][:, np.newaxis]
+    otherVolumes = volumes[others].T
+    totalVolumes = methodVolumes + otherVolumes
+    with np.errstate(invalid="ignore", divide="ignore"):
+        volumeDifference = np.where(totalVolumes > 0,
+                                    200.0 * np.abs(methodVolumes - otherVolumes) / totalVolumes, np.nan)
+    return (
+        _nanMean(np.array(metrics["dice"], dtype=float)[:, method, others]),
+        _nanMean(volumeDifference),
+        _nanMean(np.array(metrics["hausdorff"], dtype=float)[:, method, others]),
+        _nanMean(np.array(metrics["hausdorff95"], dtype=float)[:, method, others]),
+        _nanMean(np.array(metrics["meanSurfaceDistance"], dtype=float)[:, method, others]),
+    )
+
+
+def _computeCaseMetrics(directory: str, segmentationPaths: list) -> dict:
+    """
+    Worker process entry point
+    """
+    return AgreementMetricsCache(directory).read(segmentationPaths)
+
+
+class AgreementMetricsCache:
+    """
+    Keeps the agreement metrics of the cases of a study, as one .json file per case.
+
+    Entries are keyed by the content hashes of the segmentations of the case, in method order, so that the metrics
+    are computed again when any segmentation changes. Cases are computed in a pool of worker processes, which also
+    hash the segmentations.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._executor = None
+
+    def _entryPath(self, segmentationPaths: list) -> str:
+        key = hashlib.sha256("|".join(fileContentHash(path) for path in segmentationPaths).encode("utf-8"))
+        return os.path.join(self.directory, f"{key.hexdigest()}.json")
+
+    def load(self, segmentationPaths: list):
+        """
+        Returns the cached metrics of a case, or None if not cached.
+        """
+        try:
+            with open(self._entryPath(segmentationPaths), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, segmentationPaths: list, metrics: dict) -> None:
+        path = self._entryPath(segmentationPaths)
+        os.makedirs(self.directory, exist_ok=True)
+        temporaryPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporaryPath, "w", encoding="utf-8") as f:
+            json.dump(metrics, f)
+        os.replace(temporaryPath, path)
+
+    def read(self, segmentationPaths: list) -> dict:
+        """
+        Returns the metrics of a case from the cache, computing them first if needed.
+        """
+        metrics = self.load(segmentationPaths)
+        if metrics is not None:
+            return metrics
+        metrics = caseAgreementMetrics(segmentationPaths)
+        try:
+            self.store(segmentationPaths, metrics)
+        except OSError as e:
+            print(f"Failed to cache the agreement metrics of {', '.join(segmentationPaths)}: {e}")
+        return metrics
+
+    def computeInBackground(self, cases: dict, maxWorkers: int, executable: str = None) -> dict:
+        """
+        Reads the metrics of the given cases (mapping a case key to its segmentation paths) in a pool of worker
+        processes, and returns a dictionary mapping each case key to its future.
+        """
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            if executable:
+                context.set_executable(executable)
+            self._executor = ProcessPoolExecutor(max_workers=maxWorkers, mp_context=context)
+        return {caseKey: self._executor.submit(_computeCaseMetrics, self.directory, list(segmentationPaths))
+                for caseKey, segmentationPaths in cases.items()}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
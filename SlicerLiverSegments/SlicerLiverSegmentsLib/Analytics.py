@@ -0,0 +1,385 @@
+import csv
+import itertools
+import math
+import os
+
+import numpy as np
+
+from .ResultsDatabase import RATER_COLUMN
+
+__all__ = ["RatingsAnalytics", "readResultsColumns"]
+
+# Columns identifying an evaluation in results files, and the rater in merged shard results files
+KEY_COLUMNS = ("Method", "Sequence")
+SHARD_COLUMN = "Shard"
+
+
+def readResultsColumns(path: str) -> dict:
+    """
+    Reads a results file by columns, returns a dictionary mapping each column name to a NumPy array of strings.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        columns = list(zip(*reader))
+    if not columns:
+        return {name: np.array([], dtype=str) for name in header}
+    return {name: np.array(values) for name, values in zip(header, columns)}
+
+
+def _averageRanks(values: np.ndarray) -> tuple:
+    """
+    Returns the ranks of values starting at 1, tied values getting the mean of their ranks, and the sizes of the
+    groups of tied values.
+    """
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    groupStarts = np.cumsum(counts) - counts
+    return (groupStarts + (counts + 1) / 2.0)[inverse.ravel()], counts
+
+
+def _rowRanks(matrix: np.ndarray) -> np.ndarray:
+    """
+    Returns the ranks of the values of each row of matrix, tied values getting the mean of their ranks.
+    Meant for a few columns, as all pairs of columns are compared.
+    """
+    lower = (matrix[:, :, np.newaxis] > matrix[:, np.newaxis, :]).sum(axis=2)
+    equal = (matrix[:, :, np.newaxis] == matrix[:, np.newaxis, :]).sum(axis=2)
+    return lower + (equal + 1) / 2.0
+
+
+def _chiSquareSurvival(statistic: float, degreesOfFreedom: int) -> float:
+    """
+    Returns P(X >= statistic) for a chi-square variable X with an integer number of degrees of freedom.
+    """
+    if statistic <= 0:
+        return 1.0
+    half = statistic / 2.0
+    if degreesOfFreedom % 2 == 0:
+        term = total = 1.0
+        for i in range(1, degreesOfFreedom // 2):
+            term *= half / i
+            total += term
+        return min(1.0, math.exp(-half) * total)
+    # Odd degrees of freedom start from one, whose distribution is the one of a squared normal variable
+    total = math.erfc(math.sqrt(half))
+    term = 2.0 * math.sqrt(half / math.pi)
+    for i in range(1, (degreesOfFreedom + 1) // 2):
+        total += term * math.exp(-half)
+        term *= half / (i + 0.5)
+    return min(1.0, total)
+
+
+class RatingsAnalytics:
+    """
+    Scores given by raters to the (method, sequence) evaluations of a study, kept in NumPy arrays.
+
+    Ratings are added in bulk from results files or one at a time as they are saved. Saving an evaluation again
+    replaces its previous scores. Score distributions are updated incrementally, while the comparisons between
+    methods and the agreement between raters are computed on demand, with vectorized operations over all ratings.
+    Scores are integers from 0 to maxScore, negative ones stand for questions not answered.
+    """
+
+    def __init__(self, scoreColumns: tuple, numberOfMethods: int = 4, maxScore: int = 5) -> None:
+        self.scoreColumns = tuple(scoreColumns)
+        self.numberOfMethods = numberOfMethods
+        self.maxScore = maxScore
+        self.clear()
+
+    @property
+    def numberOfQuestions(self) -> int:
+        return len(self.scoreColumns)
+
+    @property
+    def numberOfRaters(self) -> int:
+        return len(self.raterNames)
+
+    def clear(self) -> None:
+        self.raterNames = []
+        self._size = 0
+        self._raters = np.empty(0, dtype=np.int32)
+        self._methods = np.empty(0, dtype=np.int32)
+        self._sequences = np.empty(0, dtype=np.int64)
+        self._scores = np.empty((0, self.numberOfQuestions), dtype=np.int16)
+        # Row of each (rater, method, sequence) rating
+        self._rows = {}
+        # Number of ratings of each score, by method and question
+        self._counts = np.zeros((self.numberOfMethods, self.numberOfQuestions, self.maxScore + 1), dtype=np.int64)
+        # Score matrices of the statistics, until ratings are added
+        self._matrices = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def raterIndex(self, raterName: str) -> int:
+        """
+        Returns the index of a rater, adding it if it is new
+        """
+        if raterName not in self.raterNames:
+            self.raterNames.append(raterName)
+        return self.raterNames.index(raterName)
+
+    def _reserve(self, size: int) -> None:
+        if size <= len(self._raters):
+            return
+        capacity = max(size, 2 * len(self._raters), 1024)
+        for name in ("_raters", "_methods", "_sequences", "_scores"):
+            array = getattr(self, name)
+            grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _reserveMethods(self, numberOfMethods: int) -> None:
+        if numberOfMethods <= self.numberOfMethods:
+            return
+        counts = np.zeros((numberOfMethods,) + self._counts.shape[1:], dtype=self._counts.dtype)
+        counts[:self.numberOfMethods] = self._counts
+        self._counts = counts
+        self.numberOfMethods = numberOfMethods
+
+    def _countScores(self, methods: np.ndarray, scores: np.ndarray, increment: int) -> None:
+        answered = (scores >= 0) & (scores <= self.maxScore)
+        methodIndices = np.broadcast_to(methods[:, np.newaxis], scores.shape)[answered]
+        questionIndices = np.broadcast_to(np.arange(self.numberOfQuestions), scores.shape)[answered]
+        np.add.at(self._counts, (methodIndices, questionIndices, scores[answered]), increment)
+
+    def add(self, raters, methods, sequences, scores) -> None:
+        """
+        Adds or replaces ratings. raters (indices from raterIndex), methods and sequences have one value per
+        rating, scores one row of question scores per rating. Methods beyond numberOfMethods are added.
+        """
+        raters = np.atleast_1d(np.asarray(raters, dtype=np.int32))
+        methods = np.atleast_1d(np.asarray(methods, dtype=np.int32))
+        sequences = np.atleast_1d(np.asarray(sequences, dtype=np.int64))
+        scores = np.asarray(scores, dtype=np.int16).reshape(len(raters), self.numberOfQuestions)
+
+        if len(methods):
+            self._reserveMethods(int(methods.max()) + 1)
+        previousSize = self._size
+        rows = np.empty(len(raters), dtype=np.int64)
+        for i, key in enumerate(zip(raters.tolist(), methods.tolist(), sequences.tolist())):
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = self._size
+                self._size += 1
+            rows[i] = row
+        # The last of several ratings of the same evaluation wins
+        _, lastPositions = np.unique(rows[::-1], return_index=True)
+        keep = len(rows) - 1 - lastPositions
+        rows, raters, methods = rows[keep], raters[keep], methods[keep]
+        sequences, scores = sequences[keep], scores[keep]
+
+        replacedRows = rows[rows < previousSize]
+        self._countScores(self._methods[replacedRows], self._scores[replacedRows], -1)
+        self._reserve(self._size)
+        self._raters[rows] = raters
+        self._methods[rows] = methods
+        self._sequences[rows] = sequences
+        self._scores[rows] = scores
+        self._countScores(methods, scores, 1)
+        self._matrices.clear()
+
+    def addResultsFile(self, path: str) -> int:
+        """
+        Adds the ratings of a results file, rated by a rater named after the file, of a merged shard results file,
+        rated by one rater per shard, or of a results database export, rated by the raters it names. Returns the
+        number of ratings added.
+        """
+        columns = readResultsColumns(path)
+        missingColumns = [name for name in KEY_COLUMNS + self.scoreColumns if name not in columns]
+        if missingColumns:
+            raise ValueError(f"{path} has no {', '.join(missingColumns)} column")
+
+        methods = columns["Method"].astype(np.int64)
+        sequences = columns["Sequence"].astype(np.int64)
+        scores = np.column_stack([np.char.strip(columns[name]) for name in self.scoreColumns]) \
+            if len(methods) else np.empty((0, self.numberOfQuestions), dtype=str)
+        scores = np.where(scores == "", "-1", scores).astype(np.int64)
+        # Rows of evaluations never saved
+        saved = (methods >= 0) & (sequences >= 0)
+
+        fileName = os.path.basename(path)
+        if RATER_COLUMN in columns:
+            raterNames, raterIndices = np.unique(columns[RATER_COLUMN][saved], return_inverse=True)
+            fileRaters = np.array([self.raterIndex(str(name)) for name in raterNames], dtype=np.int32)
+            raters = fileRaters[raterIndices.ravel()]
+        elif SHARD_COLUMN in columns:
+            shards, shardIndices = np.unique(columns[SHARD_COLUMN][saved], return_inverse=True)
+            shardRaters = np.array([self.raterIndex(f"{fileName} shard {shard}") for shard in shards], dtype=np.int32)
+            raters = shardRaters[shardIndices.ravel()]
+        else:
+            raters = np.full(np.count_nonzero(saved), self.raterIndex(fileName), dtype=np.int32)
+        self.add(raters, methods[saved], sequences[saved], scores[saved])
+        return int(np.count_nonzero(saved))
+
+    def _answered(self, question: int) -> np.ndarray:
+        scores = self._scores[:self._size, question]
+        return np.flatnonzero((scores >= 0) & (scores <= self.maxScore))
+
+    def _pivot(self, question: int, groups: np.ndarray, columns: np.ndarray, numberOfColumns: int) -> np.ndarray:
+        """
+        Returns the scores of a question as a matrix with one row per distinct value of groups and one column per
+        value of columns, missing scores being NaN.
+        """
+        answered = self._answered(question)
+        if answered.size == 0:
+            return np.empty((0, numberOfColumns))
+        _, rowIndices = np.unique(groups[answered], return_inverse=True)
+        rowIndices = rowIndices.ravel()
+        matrix = np.full((rowIndices.max() + 1, numberOfColumns), np.nan)
+        matrix[rowIndices, columns[answered]] = self._scores[answered, question]
+        return matrix
+
+    def _methodMatrix(self, question: int) -> np.ndarray:
+        """
+        Scores of a question with one row per (rater, sequence) and one column per method
+        """
+        key = ("methods", question)
+        if key not in self._matrices:
+            sequences = self._sequences[:self._size]
+            groups = self._raters[:self._size].astype(np.int64) * (int(sequences.max(initial=0)) + 1) + sequences
+            self._matrices[key] = self._pivot(question, groups, self._methods[:self._size], self.numberOfMethods)
+        return self._matrices[key]
+
+    def _raterMatrix(self, question: int) -> np.ndarray:
+        """
+        Scores of a question with one row per (method, sequence) and one column per rater
+        """
+        key = ("raters", question)
+        if key not in self._matrices:
+            sequences = self._sequences[:self._size]
+            groups = self._methods[:self._size].astype(np.int64) * (int(sequences.max(initial=0)) + 1) + sequences
+            self._matrices[key] = self._pivot(question, groups, self._raters[:self._size], self.numberOfRaters)
+        return self._matrices[key]
+
+    def scoreDistributions(self) -> np.ndarray:
+        """
+        Returns the number of ratings of each score, indexed by method, question and score
+        """
+        return self._counts.copy()
+
+    def meanScores(self) -> np.ndarray:
+        """
+        Returns the mean score by method and question, NaN where there are no ratings
+        """
+        counts = self._counts.sum(axis=2)
+        total = (self._counts * np.arange(self.maxScore + 1)).sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, total / np.maximum(counts, 1), np.nan)
+
+    def friedman(self, question: int) -> tuple:
+        """
+        Friedman test of the differences between methods on a question, over the (rater, sequence) blocks
+        where all methods were scored. Returns the tie-corrected statistic, its p-value and the number of blocks.
+        """
+        matrix = self._methodMatrix(question)
+        matrix = matrix[~np.isnan(matrix).any(axis=1)]
+        numberOfBlocks, numberOfMethods = matrix.shape
+        if numberOfBlocks == 0 or numberOfMethods < 2:
+            return float("nan"), float("nan"), numberOfBlocks
+        ranks = _rowRanks(matrix)
+        expectedRankSum = numberOfBlocks * (numberOfMethods + 1) / 2.0
+        denominator = (ranks ** 2).sum() - numberOfBlocks * numberOfMethods * (numberOfMethods + 1) ** 2 / 4.0
+        if denominator <= 0:
+            # All methods tied in every block
+            return 0.0, 1.0, numberOfBlocks
+        statistic = (numberOfMethods - 1) * ((ranks.sum(axis=0) - expectedRankSum) ** 2).sum() / denominator
+        return float(statistic), _chiSquareSurvival(statistic, numberOfMethods - 1), numberOfBlocks
+
+    def wilcoxon(self, question: int, firstMethod: int, secondMethod: int) -> tuple:
+        """
+        Wilcoxon signed-rank test of the differences between two methods on a question, over the (rater,
+        sequence) blocks where both were scored. Returns the sum of the ranks of the positive differences, its
+        two-sided p-value from the tie-corrected normal approximation, and the number of non-zero differences.
+        """
+        matrix = self._methodMatrix(question)
+        differences = matrix[:, firstMethod] - matrix[:, secondMethod]
+        differences = differences[~np.isnan(differences) & (differences != 0)]
+        n = differences.size
+        if n == 0:
+            return float("nan"), float("nan"), 0
+        ranks, tieSizes = _averageRanks(np.abs(differences))
+        positiveRankSum = float(ranks[differences > 0].sum())
+        variance = n * (n + 1) * (2 * n + 1) / 24.0 - (tieSizes ** 3 - tieSizes).sum() / 48.0
+        if variance <= 0:
+            return positiveRankSum, 1.0, n
+        z = (positiveRankSum - n * (n + 1) / 4.0) / math.sqrt(variance)
+        return positiveRankSum, math.erfc(abs(z) / math.sqrt(2.0)), n
+
+    def pairwiseWilcoxon(self, question: int) -> list:
+        """
+        Returns (first method, second method, rank sum, p-value, n) for every pair of methods
+        """
+        return [(first, second) + self.wilcoxon(question, first, second)
+                for first, second in itertools.combinations(range(self.numberOfMethods), 2)]
+
+    def cohensKappa(self, question: int, firstRater: int, secondRater: int, weighted: bool = False) -> float:
+        """
+        Cohen's kappa between two raters on a question, over the evaluations both scored, with quadratic weights
+        if weighted. NaN if undefined.
+        """
+        matrix = self._raterMatrix(question)
+        if max(firstRater, secondRater) >= matrix.shape[1]:
+            return float("nan")
+        pairs = matrix[:, [firstRater, secondRater]]
+        pairs = pairs[~np.isnan(pairs).any(axis=1)].astype(np.int64)
+        if pairs.shape[0] == 0:
+            return float("nan")
+        numberOfCategories = self.maxScore + 1
+        observed = np.bincount(pairs[:, 0] * numberOfCategories + pairs[:, 1],
+                               minlength=numberOfCategories ** 2).reshape(numberOfCategories, numberOfCategories)
+        observed = observed / pairs.shape[0]
+        expected = np.outer(observed.sum(axis=1), observed.sum(axis=0))
+        categories = np.arange(numberOfCategories)
+        disagreement = categories[:, np.newaxis] - categories[np.newaxis, :]
+        weights = (disagreement ** 2).astype(float) if weighted else (disagreement != 0).astype(float)
+        expectedDisagreement = (weights * expected).sum()
+        if expectedDisagreement == 0:
+            return float("nan")
+        return float(1.0 - (weights * observed).sum() / expectedDisagreement)
+
+    def fleissKappa(self, question: int) -> float:
+        """
+        Fleiss' kappa between all raters on a question, over the evaluations scored by at least two raters
+        (raters may differ between evaluations). NaN if undefined.
+        """
+        matrix = self._raterMatrix(question)
+        rated = ~np.isnan(matrix)
+        matrix, rated = matrix[rated.sum(axis=1) >= 2], rated[rated.sum(axis=1) >= 2]
+        if matrix.shape[0] == 0:
+            return float("nan")
+        numberOfCategories = self.maxScore + 1
+        itemIndices = np.broadcast_to(np.arange(matrix.shape[0])[:, np.newaxis], matrix.shape)[rated]
+        categoryCounts = np.bincount(itemIndices * numberOfCategories + matrix[rated].astype(np.int64),
+                                     minlength=matrix.shape[0] * numberOfCategories)
+        categoryCounts = categoryCounts.reshape(matrix.shape[0], numberOfCategories)
+        ratingsPerItem = rated.sum(axis=1)
+        itemAgreement = ((categoryCounts ** 2).sum(axis=1) - ratingsPerItem) / (ratingsPerItem * (ratingsPerItem - 1))
+        categoryProportions = categoryCounts.sum(axis=0) / ratingsPerItem.sum()
+        chanceAgreement = (categoryProportions ** 2).sum()
+        if chanceAgreement >= 1:
+            return float("nan")
+        return float((itemAgreement.mean() - chanceAgreement) / (1 - chanceAgreement))
+
+    def icc(self, question: int) -> tuple:
+        """
+        Two-way random effects, absolute agreement, single rater intraclass correlation, ICC(2,1), on a question
+        over the evaluations scored by all raters. Returns the ICC (NaN if undefined) and the number of
+        evaluations.
+        """
+        matrix = self._raterMatrix(question)
+        matrix = matrix[~np.isnan(matrix).any(axis=1)]
+        n, k = matrix.shape
+        if n < 2 or k < 2:
+            return float("nan"), n
+        grandMean = matrix.mean()
+        rowMeans = matrix.mean(axis=1)
+        columnMeans = matrix.mean(axis=0)
+        rowsMeanSquare = k * ((rowMeans - grandMean) ** 2).sum() / (n - 1)
+        columnsMeanSquare = n * ((columnMeans - grandMean) ** 2).sum() / (k - 1)
+        residuals = matrix - rowMeans[:, np.newaxis] - columnMeans[np.newaxis, :] + grandMean
+        errorMeanSquare = (residuals ** 2).sum() / ((n - 1) * (k - 1))
+        denominator = (rowsMeanSquare + (k - 1) * errorMeanSquare
+                       + k * (columnsMeanSquare - errorMeanSquare) / n)
+        if denominator == 0:
+            return float("nan"), n
+        return float((rowsMeanSquare - errorMeanSquare) / denominator), n
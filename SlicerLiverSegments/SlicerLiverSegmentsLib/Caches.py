@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+
+__all__ = ["MemoryBudget"]
+
+
+@dataclass
+class _MemoryEntry:
+    category: str
+    nbytes: int
+    priority: int
+    value: object = None
+    release: object = None
+
+
+class MemoryBudget:
+    """
+    Accounts for the memory retained by a session and keeps it within a single budget.
+
+    Each entry has a category, used for reporting, a size in bytes, a priority and optionally a value and a
+    function releasing it. When the total exceeds the budget, entries are evicted from the least to the most
+    recently used, CACHED ones first, then PREFETCHED ones. PINNED entries (the dataset being shown) are counted
+    but never evicted.
+    """
+
+    PINNED = 0
+    PREFETCHED = 1
+    CACHED = 2
+
+    def __init__(self, budgetBytes: int) -> None:
+        self._entries = OrderedDict()
+        self._budgetBytes = budgetBytes
+        self._totalBytes = 0
+
+    @property
+    def budgetBytes(self) -> int:
+        return self._budgetBytes
+
+    @budgetBytes.setter
+    def budgetBytes(self, value: int) -> None:
+        self._budgetBytes = value
+        self._evict()
+
+    @property
+    def totalBytes(self) -> int:
+        return self._totalBytes
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list:
+        return list(self._entries)
+
+    def usage(self) -> dict:
+        """
+        Returns the bytes retained by category
+        """
+        usage = {}
+        for entry in self._entries.values():
+            usage[entry.category] = usage.get(entry.category, 0) + entry.nbytes
+        return usage
+
+    def get(self, key):
+        """
+        Returns the value of the entry for key and marks it as most recently used, or None if not tracked.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def put(self, key, category: str, nbytes: int, priority: int, value=None, release=None) -> None:
+        """
+        Tracks an entry as the most recently used one, replacing any previous entry for key, and evicts entries
+        if the budget is exceeded. release is called without arguments if the entry is evicted.
+        """
+        self.pop(key)
+        self._entries[key] = _MemoryEntry(category, nbytes, priority, value, release)
+        self._totalBytes += nbytes
+        self._evict()
+
+    def setPriority(self, key, priority: int) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.priority != priority:
+            entry.priority = priority
+            self._evict()
+
+    def pop(self, key):
+        """
+        Stops tracking the entry for key without releasing it, and returns its value.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._totalBytes -= entry.nbytes
+        return entry.value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._totalBytes = 0
+
+    def _evict(self) -> None:
+        for priority in (self.CACHED, self.PREFETCHED):
+            for key in [key for key, entry in self._entries.items() if entry.priority == priority]:
+                if self._totalBytes <= self._budgetBytes:
+                    return
+                # Releasing an entry may have dropped others
+                entry = self._entries.pop(key, None)
+                if entry is None:
+                    continue
+                self._totalBytes -= entry.nbytes
+                if entry.release is not None:
+                    entry.release()
@@ -0,0 +1,101 @@
+import hashlib
+import itertools
+import os
+
+import numpy as np
+
+from .DicomIndex import isDicomSeriesPath
+from .ImageIO import DecodedImage, loadDecodedImage, saveDecodedImage
+
+__all__ = ["CroppedVolumeCache", "cropToBounds", "labelBounds"]
+
+
+def _indexToPhysical(decoded: DecodedImage, indices: np.ndarray) -> np.ndarray:
+    """
+    Maps IJK indices (one per row) to LPS coordinates.
+    """
+    direction = np.array(decoded.direction, dtype=float).reshape(3, 3)
+    return np.array(decoded.origin, dtype=float) + (indices * np.array(decoded.spacing, dtype=float)) @ direction.T
+
+
+def _physicalToIndex(decoded: DecodedImage, points: np.ndarray) -> np.ndarray:
+    """
+    Maps LPS coordinates (one per row) to continuous IJK indices.
+    """
+    direction = np.array(decoded.direction, dtype=float).reshape(3, 3)
+    return ((points - np.array(decoded.origin, dtype=float)) @ np.linalg.inv(direction).T
+            / np.array(decoded.spacing, dtype=float))
+
+
+def _boxCorners(lower, upper) -> np.ndarray:
+    return np.array(list(itertools.product(*zip(lower, upper))), dtype=float)
+
+
+def labelBounds(decoded: DecodedImage):
+    """
+    Returns the LPS bounding box (lower corner, upper corner) of the non-zero voxels of a labelmap, including
+    the extent of the boundary voxels, or None if the labelmap is empty.
+    """
+    array = decoded.array
+    if array.ndim != 3:
+        # Multi-layer labelmaps are stored with the layers as the last axis
+        array = array.reshape(array.shape[:3] + (-1,)).any(axis=3)
+    indexBounds = []
+    # KJI axes of the array, reversed to IJK
+    for axis in (2, 1, 0):
+        indices = np.flatnonzero(array.any(axis=tuple(a for a in range(3) if a != axis)))
+        if indices.size == 0:
+            return None
+        indexBounds.append((indices[0] - 0.5, indices[-1] + 0.5))
+    corners = _indexToPhysical(decoded, _boxCorners(*zip(*indexBounds)))
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def cropToBounds(decoded: DecodedImage, lower, upper, margin: float = 0.0) -> DecodedImage:
+    """
+    Returns the part of an image inside an LPS bounding box grown by margin millimeters, with its origin moved
+    accordingly. The voxels are copied, so that the full image can be released.
+    """
+    lower = np.asarray(lower, dtype=float) - margin
+    upper = np.asarray(upper, dtype=float) + margin
+    corners = _physicalToIndex(decoded, _boxCorners(lower, upper))
+    shape = np.array(decoded.array.shape[:3][::-1])
+    start = np.clip(np.floor(corners.min(axis=0) + 0.5).astype(int), 0, shape)
+    stop = np.clip(np.ceil(corners.max(axis=0) + 0.5).astype(int), start, shape)
+    (i0, j0, k0), (i1, j1, k1) = start, stop
+    return DecodedImage(
+        array=np.array(decoded.array[k0:k1, j0:j1, i0:i1]),
+        origin=tuple(_indexToPhysical(decoded, start[np.newaxis].astype(float))[0]),
+        spacing=decoded.spacing,
+        direction=decoded.direction,
+        metadata=decoded.metadata,
+    )
+
+
+class CroppedVolumeCache:
+    """
+    Keeps volumes cropped to the extent of their segmentations, as memory-mapped .npy files.
+
+    Entries are keyed by the volume and segmentation paths, sizes and modification times and the margin, so that
+    modifying any of the inputs crops the volume again.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def key(self, volumePath: str, segmentationPaths: list, margin: float) -> str:
+        digest = hashlib.sha1(f"{margin}".encode("utf-8"))
+        for path in [volumePath] + list(segmentationPaths):
+            # DICOM series are identified by their directory
+            stat = os.stat(os.path.dirname(path) if isDicomSeriesPath(path) else path)
+            digest.update(f"|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, key: str):
+        """
+        Returns the cropped volume stored under key with a memory-mapped voxel array, or None if not cached.
+        """
+        return loadDecodedImage(os.path.join(self.directory, key))
+
+    def store(self, key: str, decoded: DecodedImage) -> None:
+        saveDecodedImage(os.path.join(self.directory, key), decoded)
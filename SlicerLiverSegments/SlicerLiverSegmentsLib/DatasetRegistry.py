@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+__all__ = ["DatasetRegistry"]
+
+
+class DatasetRegistry:
+    """
+    Files of a study: one volume per case, and one segmentation per method and case, for any number of methods.
+
+    The registry is built once when the experiment is initialized. File names and paths are kept in NumPy object
+    arrays indexed by case, and by (method, case) for the segmentations, so that lookups do not rebuild lists and
+    the evaluations of a whole results file can be checked at once.
+    """
+
+    def __init__(self, volumesDirectory: str, volumeFiles: list, methodDirectories: list,
+                 segmentationFiles: list) -> None:
+        """
+        volumeFiles and the segmentationFiles of each method are file names relative to their directory, in case
+        order.
+        """
+        numberOfCases = len(volumeFiles)
+        self._volumeFiles = np.empty(numberOfCases, dtype=object)
+        self._volumeFiles[:] = volumeFiles
+        self._volumePaths = np.empty(numberOfCases, dtype=object)
+        self._volumePaths[:] = [os.path.join(volumesDirectory, fileName) for fileName in volumeFiles]
+
+        self._segmentationFiles = np.empty((len(methodDirectories), numberOfCases), dtype=object)
+        self._segmentationPaths = np.empty((len(methodDirectories), numberOfCases), dtype=object)
+        for methodIndex, (directory, files) in enumerate(zip(methodDirectories, segmentationFiles)):
+            if len(files) != numberOfCases:
+                raise ValueError(f"Method {methodIndex + 1} has {len(files)} segmentations for {numberOfCases} cases")
+            self._segmentationFiles[methodIndex] = files
+            self._segmentationPaths[methodIndex] = [os.path.join(directory, fileName) for fileName in files]
+
+    @property
+    def numberOfMethods(self) -> int:
+        return self._segmentationFiles.shape[0]
+
+    @property
+    def numberOfCases(self) -> int:
+        return self._segmentationFiles.shape[1]
+
+    def volumeFile(self, case: int) -> str:
+        return self._volumeFiles[case]
+
+    def volumePath(self, case: int) -> str:
+        return self._volumePaths[case]
+
+    def segmentationFile(self, method: int, case: int) -> str:
+        return self._segmentationFiles[method, case]
+
+    def segmentationPath(self, method: int, case: int) -> str:
+        return self._segmentationPaths[method, case]
+
+    def segmentationPaths(self, case: int) -> list:
+        """
+        Returns the segmentation paths of all methods for a case, in method order
+        """
+        return self._segmentationPaths[:, case].tolist()
+
+    def matches(self, methods, cases, volumeFiles, segmentationFiles) -> np.ndarray:
+        """
+        Returns, for each (method, case) evaluation given by the arguments, whether it was made on the given
+        volume and segmentation files. Evaluations out of the registry never match.
+        """
+        methods = np.atleast_1d(np.asarray(methods, dtype=np.int64))
+        cases = np.atleast_1d(np.asarray(cases, dtype=np.int64))
+        volumeFiles = np.atleast_1d(np.asarray(volumeFiles, dtype=object))
+        segmentationFiles = np.atleast_1d(np.asarray(segmentationFiles, dtype=object))
+        valid = (methods >= 0) & (methods < self.numberOfMethods) & (cases >= 0) & (cases < self.numberOfCases)
+        matching = np.zeros(len(methods), dtype=bool)
+        matching[valid] = ((self._volumeFiles[cases[valid]] == volumeFiles[valid])
+                           & (self._segmentationFiles[methods[valid], cases[valid]] == segmentationFiles[valid]))
+        return matching
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import SimpleITK as sitk
+
+from .ImageIO import DecodedImage, loadDecodedImage, saveDecodedImage
+
+__all__ = ["DICOM_SERIES_EXTENSION", "DicomSeries", "DicomSeriesIndex", "isDicomSeriesPath"]
+
+# Extension of the virtual paths standing for the DICOM series of a directory
+DICOM_SERIES_EXTENSION = ".dcmseries"
+
+
+def isDicomSeriesPath(path: str) -> bool:
+    return path.endswith(DICOM_SERIES_EXTENSION)
+
+
+@dataclass
+class DicomSeries:
+    seriesInstanceUid: str
+    # Directory of the files, relative to the indexed directory
+    directory: str
+    # File names in slice order
+    files: list
+    patientId: str
+    size: int
+    origin: list
+    spacing: list
+    direction: list
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the series relative to the indexed directory, used as its file name
+        """
+        return os.path.normpath(os.path.join(self.directory, self.seriesInstanceUid + DICOM_SERIES_EXTENSION))
+
+    @property
+    def caseDirectory(self) -> str:
+        """
+        Top-level directory of the series under the indexed directory, i.e. the patient directory of the usual
+        patient/study/series layouts, or "" for series directly in the indexed directory
+        """
+        topDirectory = os.path.normpath(self.directory).split(os.sep)[0]
+        return "" if topDirectory == os.curdir else topDirectory
+
+
+def _readSlices(paths: list) -> np.ndarray:
+    """
+    Worker process entry point, returns the KJI voxels of consecutive slices
+    """
+    reader = sitk.ImageSeriesReader()
+    reader.SetFileNames(paths)
+    return sitk.GetArrayFromImage(reader.Execute())
+
+
+def _seriesGeometry(paths: list) -> tuple:
+    """
+    Returns the LPS origin, spacing and direction and the patient ID of a series, from the headers of its first
+    and last slices
+    """
+    def header(path):
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(path)
+        reader.ReadImageInformation()
+        return reader
+
+    first = header(paths[0])
+    origin = np.array([float(v) for v in first.GetMetaData("0020|0032").split("\\")])
+    orientation = np.array([float(v) for v in first.GetMetaData("0020|0037").split("\\")])
+    rowSpacing, columnSpacing = (float(v) for v in first.GetMetaData("0028|0030").split("\\"))
+    rowDirection, columnDirection = orientation[:3], orientation[3:]
+
+    sliceDirection = np.cross(rowDirection, columnDirection)
+    sliceSpacing = float(first.GetMetaData("0018|0050")) if first.HasMetaDataKey("0018|0050") else 1.0
+    if len(paths) > 1:
+        # Slices are sorted along their normal, their actual spacing is the distance between their positions
+        last = header(paths[-1])
+        offset = np.array([float(v) for v in last.GetMetaData("0020|0032").split("\\")]) - origin
+        if np.linalg.norm(offset) > 0:
+            sliceSpacing = float(np.linalg.norm(offset)) / (len(paths) - 1)
+            sliceDirection = offset / np.linalg.norm(offset)
+
+    direction = np.column_stack([rowDirection, columnDirection, sliceDirection])
+    patientId = first.GetMetaData("0010|0020").strip() if first.HasMetaDataKey("0010|0020") else ""
+    return origin.tolist(), [columnSpacing, rowSpacing, sliceSpacing], direction.ravel().tolist(), patientId
+
+
+class DicomSeriesIndex:
+    """
+    Indexes the DICOM series found under a directory, so that each series can be loaded as one volume.
+
+    The index of a directory maps each series instance UID to its files in slice order and its geometry. It is
+    stored in a database directory and only rebuilt when a subdirectory is modified. Series are addressed by
+    virtual paths (the series directory joined with "<UID>.dcmseries"). Their voxels are read in parallel chunks
+    of slices by worker processes, and cached as memory-mapped .npy files.
+    """
+
+    def __init__(self, databaseDirectory: str) -> None:
+        self.databaseDirectory = databaseDirectory
+        self.maxWorkers = 1
+        self.executable = None
+        self._series = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _indexPath(self, dirPath: str) -> str:
+        directoryKey = hashlib.sha1(os.path.abspath(dirPath).encode("utf-8")).hexdigest()
+        return os.path.join(self.databaseDirectory, f"{directoryKey}.json")
+
+    @staticmethod
+    def _directoryFingerprint(dirPath: str) -> dict:
+        return {os.path.relpath(root, dirPath): os.stat(root).st_mtime_ns for root, _, _ in os.walk(dirPath)}
+
+    def scan(self, dirPath: str) -> list:
+        """
+        Returns the series found under dirPath, sorted by name, indexing the directory if it changed since the
+        last scan.
+        """
+        fingerprint = self._directoryFingerprint(dirPath)
+        indexPath = self._indexPath(dirPath)
+        series = None
+        try:
+            with open(indexPath, encoding="utf-8") as f:
+                index = json.load(f)
+            if index["fingerprint"] == fingerprint:
+                series = [DicomSeries(**entry) for entry in index["series"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        if series is None:
+            series = self._index(dirPath)
+            try:
+                os.makedirs(self.databaseDirectory, exist_ok=True)
+                temporaryPath = f"{indexPath}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporaryPath, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "directory": os.path.abspath(dirPath),
+                        "fingerprint": fingerprint,
+                        "series": [asdict(entry) for entry in series],
+                    }, f)
+                os.replace(temporaryPath, indexPath)
+            except OSError as e:
+                print(f"Failed to write the DICOM index of {dirPath}: {e}")
+
+        for entry in series:
+            self._series[os.path.abspath(os.path.join(dirPath, entry.name))] = entry
+        return series
+
+    def _index(self, dirPath: str) -> list:
+        series = []
+        for root, _, fileNames in os.walk(dirPath):
+            if not fileNames:
+                continue
+            for seriesInstanceUid in sitk.ImageSeriesReader.GetGDCMSeriesIDs(root):
+                paths = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(root, seriesInstanceUid)
+                if not paths:
+                    continue
+                try:
+                    origin, spacing, direction, patientId = _seriesGeometry(paths)
+                except (RuntimeError, ValueError, KeyError) as e:
+                    print(f"Skipping DICOM series {seriesInstanceUid} in {root}: {e}")
+                    continue
+                series.append(DicomSeries(
+                    seriesInstanceUid=seriesInstanceUid,
+                    directory=os.path.relpath(root, dirPath),
+                    files=[os.path.basename(path) for path in paths],
+                    patientId=patientId,
+                    size=sum(os.path.getsize(path) for path in paths),
+                    origin=origin,
+                    spacing=spacing,
+                    direction=direction,
+                ))
+        series.sort(key=lambda entry: entry.name)
+        return series
+
+    def series(self, seriesPath: str) -> DicomSeries:
+        """
+        Returns the indexed series of a virtual series path. The directory holding it must have been scanned.
+        """
+        return self._series[os.path.abspath(seriesPath)]
+
+    def _getExecutor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                if self.executable:
+                    context.set_executable(self.executable)
+                self._executor = ProcessPoolExecutor(max_workers=self.maxWorkers, mp_context=context)
+            return self._executor
+
+    def read(self, seriesPath: str) -> DecodedImage:
+        """
+        Returns the volume of a series, from the pixel data cache if possible.
+        """
+        series = self.series(seriesPath)
+        directory = os.path.dirname(os.path.abspath(seriesPath))
+        cachePath = os.path.join(self.databaseDirectory, "Pixels", hashlib.sha1(
+            f"{directory}|{series.seriesInstanceUid}|{len(series.files)}|{series.size}".encode("utf-8")).hexdigest())
+        decoded = loadDecodedImage(cachePath)
+        if decoded is not None:
+            return decoded
+
+        paths = [os.path.join(directory, fileName) for fileName in series.files]
+        if self.maxWorkers > 1 and len(paths) > 1:
+            chunkSize = -(-len(paths) // self.maxWorkers)
+            executor = self._getExecutor()
+            futures = [executor.submit(_readSlices, paths[start:start + chunkSize])
+                       for start in range(0, len(paths), chunkSize)]
+            array = np.concatenate([future.result() for future in futures])
+        else:
+            array = _readSlices(paths)
+
+        decoded = DecodedImage(
+            array=array,
+            origin=tuple(series.origin),
+            spacing=tuple(series.spacing),
+            direction=tuple(series.direction),
+            metadata={"SeriesInstanceUID": series.seriesInstanceUid, "PatientID": series.patientId},
+        )
+        try:
+            saveDecodedImage(cachePath, decoded, series=series.seriesInstanceUid)
+        except OSError as e:
+            print(f"Failed to cache the pixel data of series {series.seriesInstanceUid}: {e}")
+            return decoded
+        return loadDecodedImage(cachePath) or decoded
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
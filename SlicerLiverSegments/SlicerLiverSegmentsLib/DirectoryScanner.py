@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from .SurfaceCache import fileContentHash
+
+__all__ = ["DEFAULT_CASE_ID_PATTERN", "ManifestEntry", "DirectoryScanner", "pairByCaseId"]
+
+# The last number of a file name, so that prefixes such as "3D" or "v2" are not taken for the case ID
+DEFAULT_CASE_ID_PATTERN = r"[0-9]+(?=\D*$)"
+
+
+@dataclass
+class ManifestEntry:
+    name: str
+    size: int
+    mtime: int
+    caseId: Optional[str]
+    contentHash: Optional[str] = None
+
+
+class DirectoryScanner:
+    """
+    Lists the dataset files of directories and remembers them in manifests stored in a cache directory.
+
+    A directory is only listed again when its modification time changes (i.e. files were added, removed or renamed),
+    which avoids one stat per file on slow network file systems. Each entry gets a case ID, extracted from the file
+    name with a regular expression (its first group if it has one, the whole match otherwise).
+    """
+
+    def __init__(self, manifestDirectory: str, validExtensions: tuple, caseIdPattern: str) -> None:
+        self.manifestDirectory = manifestDirectory
+        self.validExtensions = tuple(validExtensions)
+        self.caseIdPattern = caseIdPattern
+
+    def _manifestPath(self, dirPath: str) -> str:
+        directoryKey = hashlib.sha1(os.path.abspath(dirPath).encode("utf-8")).hexdigest()
+        return os.path.join(self.manifestDirectory, f"{directoryKey}.json")
+
+    def caseId(self, fileName: str) -> Optional[str]:
+        match = re.search(self.caseIdPattern, fileName)
+        if match is None:
+            return None
+        return match.group(1) if match.groups() else match.group(0)
+
+    def scan(self, dirPath: str, hashContents: bool = False) -> list:
+        """
+        Returns the manifest entries of the files in dirPath with a valid extension, sorted by file name.
+        """
+        directoryMtime = os.stat(dirPath).st_mtime_ns
+        manifestPath = self._manifestPath(dirPath)
+        manifestSettings = {"extensions": list(self.validExtensions), "caseIdPattern": self.caseIdPattern}
+
+        try:
+            with open(manifestPath, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["directoryMtime"] == directoryMtime and manifest["settings"] == manifestSettings:
+                entries = [ManifestEntry(**entry) for entry in manifest["entries"]]
+                if not hashContents or all(entry.contentHash for entry in entries):
+                    return entries
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        entries = []
+        with os.scandir(dirPath) as directoryEntries:
+            for directoryEntry in directoryEntries:
+                if not directoryEntry.name.endswith(self.validExtensions) or not directoryEntry.is_file():
+                    continue
+                stat = directoryEntry.stat()
+                entries.append(ManifestEntry(
+                    name=directoryEntry.name,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime_ns,
+                    caseId=self.caseId(directoryEntry.name),
+                    contentHash=fileContentHash(directoryEntry.path) if hashContents else None,
+                ))
+        entries.sort(key=lambda entry: entry.name)
+
+        try:
+            os.makedirs(self.manifestDirectory, exist_ok=True)
+            temporaryPath = f"{manifestPath}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporaryPath, "w", encoding="utf-8") as f:
+                json.dump({
+                    "directory": os.path.abspath(dirPath),
+                    "directoryMtime": directoryMtime,
+                    "settings": manifestSettings,
+                    "entries": [asdict(entry) for entry in entries],
+                }, f)
+            os.replace(temporaryPath, manifestPath)
+        except OSError as e:
+            print(f"Failed to write manifest of {dirPath}: {e}")
+
+        return entries
+
+
+def pairByCaseId(referenceEntries: list, otherEntries: list) -> tuple:
+    """
+    Orders otherEntries so that they match referenceEntries case by case.
+    Returns the ordered entries, or None and a list of problems if the entries cannot be paired one-to-one.
+
+    If no file name of either list has a case ID, the entries are paired by their position in name order instead.
+    """
+    allEntries = list(referenceEntries) + list(otherEntries)
+    if allEntries and all(entry.caseId is None for entry in allEntries):
+        if len(referenceEntries) != len(otherEntries):
+            return None, [
+                f"{len(otherEntries)} files for {len(referenceEntries)} volumes, and no case IDs to pair them"]
+        print(f"No case ID in the names of {len(otherEntries)} files, paired with the volumes in name order")
+        return sorted(otherEntries, key=lambda entry: entry.name), []
+
+    problems = []
+    referenceCaseIds = {}
+    for entry in referenceEntries:
+        if entry.caseId is None:
+            problems.append(f"{entry.name}: no case ID")
+        elif entry.caseId in referenceCaseIds:
+            problems.append(f"{entry.name}: case ID {entry.caseId} also used by {referenceCaseIds[entry.caseId].name}")
+        else:
+            referenceCaseIds[entry.caseId] = entry
+
+    entriesByCaseId = {}
+    for entry in otherEntries:
+        if entry.caseId is None:
+            problems.append(f"{entry.name}: no case ID")
+        elif entry.caseId in entriesByCaseId:
+            problems.append(f"{entry.name}: case ID {entry.caseId} also used by {entriesByCaseId[entry.caseId].name}")
+        else:
+            entriesByCaseId[entry.caseId] = entry
+
+    pairedEntries = []
+    for entry in referenceEntries:
+        pairedEntry = entriesByCaseId.pop(entry.caseId, None) if entry.caseId is not None else None
+        if pairedEntry is None and referenceCaseIds.get(entry.caseId) is entry:
+            problems.append(f"{entry.name}: no file for case ID {entry.caseId}")
+        pairedEntries.append(pairedEntry)
+    problems.extend(f"{entry.name}: case ID {caseId} has no volume" for caseId, entry in entriesByCaseId.items())
+
+    if problems:
+        return None, problems
+    return pairedEntries, []
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+import SimpleITK as sitk
+
+__all__ = ["DecodedImage", "readImage", "imageSizeInBytes", "ijkToRasMatrix", "saveDecodedImage", "loadDecodedImage"]
+
+
+@dataclass
+class DecodedImage:
+    """
+    Voxels and geometry of an image file, decoded outside of the MRML scene.
+    The voxel array is stored in KJI order and the geometry in LPS, as read by SimpleITK.
+    """
+    array: np.ndarray
+    origin: tuple
+    spacing: tuple
+    direction: tuple
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+
+def readImage(path: str) -> DecodedImage:
+    """
+    Reads and decodes an image file. Safe to call from a worker thread, as it does not touch the MRML scene.
+    """
+    image = sitk.ReadImage(path)
+    return DecodedImage(
+        array=sitk.GetArrayFromImage(image),
+        origin=image.GetOrigin(),
+        spacing=image.GetSpacing(),
+        direction=image.GetDirection(),
+        metadata={key: image.GetMetaData(key) for key in image.GetMetaDataKeys()},
+    )
+
+
+def imageSizeInBytes(path: str) -> int:
+    """
+    Returns the size of the voxels of an image file once decoded, reading only its header
+    """
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    # Size of a voxel, from a one voxel image of the same pixel type
+    voxel = sitk.Image([1] * reader.GetDimension(), reader.GetPixelID(), reader.GetNumberOfComponents())
+    return int(np.prod(reader.GetSize())) * sitk.GetArrayViewFromImage(voxel).nbytes
+
+
+def ijkToRasMatrix(decoded: DecodedImage) -> np.ndarray:
+    """
+    Returns the 4x4 IJK to RAS matrix corresponding to the LPS geometry of a decoded image.
+    """
+    lpsToRas = np.diag([-1.0, -1.0, 1.0])
+    direction = np.array(decoded.direction, dtype=float).reshape(3, 3)
+    matrix = np.eye(4)
+    matrix[:3, :3] = lpsToRas @ direction @ np.diag(decoded.spacing)
+    matrix[:3, 3] = lpsToRas @ np.array(decoded.origin, dtype=float)
+    return matrix
+
+
+def saveDecodedImage(basePath: str, decoded: DecodedImage, **header) -> None:
+    """
+    Writes a decoded image as an uncompressed .npy voxel buffer and a .json file with its geometry, metadata and
+    the given header fields. Both files are replaced atomically, the header last, so that an image is only
+    visible to loadDecodedImage once its voxels are complete.
+    """
+    os.makedirs(os.path.dirname(basePath), exist_ok=True)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(basePath + ".npy" + suffix, "wb") as f:
+        np.save(f, np.ascontiguousarray(decoded.array))
+    os.replace(basePath + ".npy" + suffix, basePath + ".npy")
+    with open(basePath + ".json" + suffix, "w", encoding="utf-8") as f:
+        json.dump({
+            **header,
+            "origin": list(decoded.origin),
+            "spacing": list(decoded.spacing),
+            "direction": list(decoded.direction),
+            "metadata": decoded.metadata,
+        }, f)
+    os.replace(basePath + ".json" + suffix, basePath + ".json")
+
+
+def loadDecodedImage(basePath: str):
+    """
+    Returns the image written by saveDecodedImage with a memory-mapped voxel array, or None if it is missing.
+    """
+    try:
+        with open(basePath + ".json", encoding="utf-8") as f:
+            header = json.load(f)
+        array = np.load(basePath + ".npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return DecodedImage(
+        array=array,
+        origin=tuple(header["origin"]),
+        spacing=tuple(header["spacing"]),
+        direction=tuple(header["direction"]),
+        metadata=header["metadata"],
+    )
@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__all__ = ["Instrumentation", "currentMemoryUsage", "peakMemoryUsage"]
+
+
+def currentMemoryUsage() -> int:
+    """
+    Returns the resident memory of the process in bytes, or 0 if it cannot be determined.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def peakMemoryUsage() -> int:
+    """
+    Returns the peak resident memory of the process since it started in bytes, or 0 if it cannot be determined.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        # Peak working set on Windows
+        return getattr(psutil.Process().memory_info(), "peak_wset", 0)
+    return 0
+
+
+class Instrumentation:
+    """
+    Records the wall time and resident memory change of named stages.
+
+    Records are kept in a bounded history for summaries and, if a log path is set, appended to it as JSON lines.
+    Stages can be measured from any thread.
+    """
+
+    def __init__(self, historySize: int = 1000) -> None:
+        self._records = deque(maxlen=historySize)
+        self._lock = threading.Lock()
+        self._logFile = None
+
+    def setLogPath(self, path: str) -> None:
+        self.close()
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._logFile = open(path, "a", encoding="utf-8")
+
+    @contextmanager
+    def measure(self, stage: str, **tags):
+        """
+        Measures the enclosed block. The yielded dictionary holds the tags of the record and can be extended
+        from within the block.
+        """
+        startTime = time.perf_counter()
+        startMemory = currentMemoryUsage()
+        try:
+            yield tags
+        finally:
+            record = {
+                "stage": stage,
+                "seconds": time.perf_counter() - startTime,
+                "memoryDelta": currentMemoryUsage() - startMemory,
+                "timestamp": time.time(),
+                "thread": threading.current_thread().name,
+                **tags,
+            }
+            with self._lock:
+                self._records.append(record)
+                if self._logFile is not None:
+                    self._logFile.write(json.dumps(record) + "\n")
+                    self._logFile.flush()
+
+    def records(self) -> list:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> list:
+        """
+        Returns (stage, count, mean seconds, median seconds, 95th percentile seconds, max seconds) for each stage
+        in the history, in order of first appearance.
+        """
+        durations = {}
+        for record in self.records():
+            durations.setdefault(record["stage"], []).append(record["seconds"])
+        rows = []
+        for stage, values in durations.items():
+            values.sort()
+            rows.append((
+                stage,
+                len(values),
+                sum(values) / len(values),
+                values[len(values) // 2],
+                values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+                values[-1],
+            ))
+        return rows
+
+    def close(self) -> None:
+        with self._lock:
+            if self._logFile is not None:
+                self._logFile.close()
+                self._logFile = None
@@ -0,0 +1,86 @@
+"""
+Precomputes the derived data of an experiment without the GUI, so that rater sessions start with warm caches.
+
+Usage:
+
+    Slicer --no-main-window --python-script SlicerLiverSegmentsLib/Precompute.py \\
+        --volumes VOLUMES_DIR --methods METHOD_DIR [METHOD_DIR ...] \\
+        [--seed SEED] [--loading-order {Shuffled,Blocked}] [--window N] [--cache-dir DIR] [--workers N] \\
+        [--smoothing FACTOR] [--decimation FACTOR] [--crop-margin MM] [--metrics]
+
+The seed and loading order options should match the ones of the rater session, so that datasets are processed in
+the order they will be shown. The surface options must match for the cached surfaces to be used.
+"""
+
+import argparse
+import os
+import sys
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="Precompute the derived data of a SlicerLiverSegments experiment")
+    parser.add_argument("--volumes", required=True, help="directory of the volumes")
+    parser.add_argument("--methods", required=True, nargs="+", metavar="DIR", help="segmentation directories of the methods")
+    parser.add_argument("--seed", type=int, default=0, help="experiment order seed")
+    parser.add_argument("--loading-order", choices=["Shuffled", "Blocked"], default="Shuffled")
+    parser.add_argument("--window", type=int, default=None, help="loading order window, in volumes")
+    parser.add_argument("--cache-dir", default=None, help="cache directory (defaults to the module's one)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--transcode", action="store_true", help="also transcode compressed inputs")
+    parser.add_argument("--smoothing", type=float, default=None, help="surface smoothing factor")
+    parser.add_argument("--decimation", type=float, default=None, help="surface decimation factor")
+    parser.add_argument("--crop-margin", type=float, default=None,
+                        help="also crop the volumes to their segmentations, with this margin in mm")
+    parser.add_argument("--metrics", action="store_true", help="also compute the agreement metrics between methods")
+    return parser.parse_args(argv)
+
+
+def main(argv) -> int:
+    from SlicerLiverSegments import SlicerLiverSegmentsLogic
+
+    args = parseArguments(argv)
+
+    directories = [args.volumes] + args.methods
+    missingDirectories = [directory for directory in directories if not os.path.isdir(directory)]
+    if missingDirectories:
+        print(f"Directories not found: {', '.join(missingDirectories)}")
+        return 1
+
+    logic = SlicerLiverSegmentsLogic()
+    parameterNode = logic.getParameterNode()
+    parameterNode.volumesDirectory = args.volumes
+    parameterNode.methodDirectories = list(args.methods)
+    parameterNode.orderSeed = str(args.seed)
+    parameterNode.loadingOrderMode = args.loading_order
+    if args.window is not None:
+        parameterNode.loadingOrderWindow = args.window
+    if args.cache_dir is not None:
+        parameterNode.cacheDirectory = args.cache_dir
+    if args.workers is not None:
+        parameterNode.workerProcesses = args.workers
+    if args.transcode:
+        parameterNode.transcodingMode = "At experiment start"
+    if args.smoothing is not None:
+        parameterNode.surfaceSmoothing = args.smoothing
+    if args.decimation is not None:
+        parameterNode.surfaceDecimation = args.decimation
+    if args.crop_margin is not None:
+        parameterNode.cropToSegmentation = True
+        parameterNode.cropMargin = args.crop_margin
+    if args.metrics:
+        parameterNode.agreementMetrics = True
+
+    try:
+        if not logic.initializeDatasets():
+            print("The dataset files could not be listed or paired by case ID")
+            return 1
+        logic.computeLoadingOrder()
+        logic.precomputeDatasets()
+    finally:
+        logic.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    import slicer
+    slicer.util.exit(main(sys.argv[1:]))
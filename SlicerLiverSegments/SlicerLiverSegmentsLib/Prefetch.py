@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["DatasetPrefetcher"]
+
+
+class DatasetPrefetcher:
+    """
+    Decodes upcoming datasets on a worker thread so that they can be handed to the MRML scene without waiting on disk.
+
+    Requests are identified by a key (the index in the loading order). The decoding function must not touch
+    the MRML scene; inserting the decoded data into the scene is left to the caller on the main thread.
+
+    Dropping a request cancels it if it has not started yet. A decode already running cannot be interrupted, it is
+    called with an isCancelled keyword argument to check between its stages and stop early.
+    """
+
+    def __init__(self, decodeFunction, maxWorkers: int = 1) -> None:
+        self._decodeFunction = decodeFunction
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="SlicerLiverSegmentsPrefetch")
+        self._pending = {}
+        self._cancelled = {}
+
+    def request(self, key, *args) -> None:
+        """
+        Starts decoding the dataset identified by key, unless it is already pending.
+        """
+        if self._executor is None or key in self._pending:
+            return
+        cancelled = threading.Event()
+        self._cancelled[key] = cancelled
+        self._pending[key] = self._executor.submit(self._decodeFunction, *args, isCancelled=cancelled.is_set)
+
+    def _drop(self, key):
+        self._cancelled.pop(key).set()
+        return self._pending.pop(key)
+
+    def take(self, key):
+        """
+        Returns the decoded dataset for key, waiting for it if still in progress, or None if it was never requested
+        or failed to decode.
+        """
+        if key not in self._pending:
+            return None
+        self._cancelled.pop(key)
+        future = self._pending.pop(key)
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning(f"Prefetch of dataset {key} failed: {e}")
+            return None
+
+    def isDone(self, key) -> bool:
+        """
+        Returns whether take(key) would return without waiting.
+        """
+        future = self._pending.get(key)
+        return future is None or future.done()
+
+    def completed(self) -> dict:
+        """
+        Returns the decoded datasets of the requests done and not taken yet, by key. Failed requests are left for
+        take to report.
+        """
+        return {key: future.result() for key, future in self._pending.items()
+                if future.done() and not future.cancelled() and future.exception() is None}
+
+    def cancel(self, key) -> None:
+        """
+        Drops the pending request for key. A request not yet started is cancelled, a running one is told to stop.
+        """
+        if key in self._pending:
+            self._drop(key).cancel()
+
+    def retain(self, keys) -> None:
+        """
+        Drops every pending request whose key is not in keys. Requests not yet started are cancelled, running ones
+        are told to stop.
+        """
+        for key in [key for key in self._pending if key not in keys]:
+            self._drop(key).cancel()
+
+    def shutdown(self) -> None:
+        self.retain(())
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,152 @@
+import csv
+import os
+import sqlite3
+
+from .ResultsJournal import _replaceAtomically
+
+__all__ = ["RATER_COLUMN", "ResultsDatabase"]
+
+# Column of the rater of each evaluation, in the database and in its exports
+RATER_COLUMN = "Rater"
+
+# File systems of network shares, as named in /proc/mounts
+_NETWORK_FILE_SYSTEMS = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "afs", "ncpfs", "9p", "ceph", "glusterfs",
+                         "lustre", "fuse.sshfs", "fuse.glusterfs", "fuse.ceph", "davfs", "fuse.davfs2")
+
+
+def _isNetworkPath(path: str) -> bool:
+    """
+    Returns whether path is on a network share. Paths whose file system cannot be determined are considered
+    network ones.
+    """
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        drive = os.path.splitdrive(path)[0]
+        if drive.startswith("\\\\"):
+            return True
+        import ctypes
+        driveRemote = 4
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == driveRemote
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return True
+    # File system of the deepest mount point containing the path
+    fileSystem = None
+    mountPointLength = -1
+    for mountPoint, mountFileSystem in mounts:
+        mountPoint = mountPoint.replace("\\040", " ")
+        if (path == mountPoint or path.startswith(mountPoint.rstrip("/") + "/")) and len(mountPoint) > mountPointLength:
+            fileSystem, mountPointLength = mountFileSystem, len(mountPoint)
+    return fileSystem is None or fileSystem in _NETWORK_FILE_SYSTEMS
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ResultsDatabase:
+    """
+    Saved evaluations of the raters of a study, in a SQLite database with one row per rater and evaluation.
+
+    The sessions of several raters, in as many Slicer instances, save to it concurrently. On local disks the database
+    is in write-ahead logging mode, so that readers do not wait for writers. Write-ahead logging needs all the
+    instances on the same host, so on network shares it uses a rollback journal and file locks instead. Each save is a
+    single row upsert on the (rater, key columns) primary key, and the results of all raters are exported to CSV on
+    demand with one query.
+    """
+
+    def __init__(self, path: str, columns: list, keyColumns: tuple, timeout: float = 30.0,
+                 journalMode: str = None) -> None:
+        """
+        columns are the names of the results columns, keyColumns the ones identifying an evaluation of a rater.
+        Writers wait up to timeout seconds for each other. journalMode is the SQLite journal mode, WAL or DELETE
+        depending on the location of the database by default.
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.keyColumns = tuple(keyColumns)
+        self.timeout = timeout
+        if journalMode is None:
+            journalMode = "DELETE" if _isNetworkPath(os.path.dirname(os.path.abspath(path))) else "WAL"
+        self.journalMode = journalMode
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is not None:
+            return self._connection
+
+        # Statements are committed as they are executed, each save being one transaction
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            connection.execute(f"PRAGMA journal_mode={self.journalMode}")
+            if self.journalMode == "WAL":
+                # Committed saves survive a crash of the application, only a power loss may lose the last ones
+                connection.execute("PRAGMA synchronous=NORMAL")
+            primaryKey = ", ".join(_quote(name) for name in (RATER_COLUMN,) + self.keyColumns)
+            columnDefinitions = ", ".join([f"{_quote(RATER_COLUMN)} TEXT NOT NULL"]
+                                          + [_quote(name) for name in self.columns])
+            connection.execute(f"CREATE TABLE IF NOT EXISTS results ({columnDefinitions}, "
+                               f"PRIMARY KEY ({primaryKey})) WITHOUT ROWID")
+            # Databases created by sessions with fewer columns are extended
+            existingColumns = {row[1] for row in connection.execute("PRAGMA table_info(results)")}
+            for name in self.columns:
+                if name not in existingColumns:
+                    connection.execute(f"ALTER TABLE results ADD COLUMN {_quote(name)}")
+        except sqlite3.Error:
+            connection.close()
+            raise
+        self._connection = connection
+        return connection
+
+    def save(self, rater: str, record: dict) -> None:
+        """
+        Inserts or replaces the evaluation of a rater given by record, a value for each results column
+        """
+        names = [RATER_COLUMN] + self.columns
+        values = [rater] + [record.get(name) for name in self.columns]
+        self._connect().execute(
+            f"INSERT OR REPLACE INTO results ({', '.join(_quote(name) for name in names)}) "
+            f"VALUES ({', '.join('?' * len(names))})", values)
+
+    def records(self, rater: str) -> list:
+        """
+        Returns the saved evaluations of a rater, as one dictionary of the results columns per evaluation
+        """
+        cursor = self._connect().execute(
+            f"SELECT {', '.join(_quote(name) for name in self.columns)} FROM results "
+            f"WHERE {_quote(RATER_COLUMN)} = ?", (rater,))
+        return [dict(zip(self.columns, row)) for row in cursor]
+
+    def exportCsv(self, csvPath: str) -> int:
+        """
+        Writes the evaluations of all raters to a CSV file atomically, with the rater first. Returns the number of
+        evaluations written.
+        """
+        names = [RATER_COLUMN] + self.columns
+        orderBy = ", ".join(_quote(name) for name in (RATER_COLUMN,) + self.keyColumns)
+        # A read transaction gives a consistent snapshot while other sessions keep saving
+        connection = self._connect()
+        connection.execute("BEGIN")
+        try:
+            cursor = connection.execute(
+                f"SELECT {', '.join(_quote(name) for name in names)} FROM results ORDER BY {orderBy}")
+            numberOfRows = 0
+
+            def writeCsv(f):
+                nonlocal numberOfRows
+                writer = csv.writer(f)
+                writer.writerow(names)
+                for row in cursor:
+                    writer.writerow(row)
+                    numberOfRows += 1
+            _replaceAtomically(csvPath, writeCsv)
+        finally:
+            connection.execute("COMMIT")
+        return numberOfRows
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,90 @@
+import csv
+import json
+import os
+import threading
+
+__all__ = ["ResultsJournal", "writeResultsCsv"]
+
+
+def _replaceAtomically(path: str, writeFunction) -> None:
+    """
+    Writes a file through a temporary file in the same directory and renames it over path once it is on disk,
+    so that readers never see a partially written file.
+    """
+    temporaryPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporaryPath, "w", newline="", encoding="utf-8") as f:
+            writeFunction(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaryPath, path)
+    finally:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+
+
+def writeResultsCsv(csvPath: str, header: list, rows) -> None:
+    """
+    Writes a results CSV atomically
+    """
+    def writeCsv(f):
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    _replaceAtomically(csvPath, writeCsv)
+
+
+class ResultsJournal:
+    """
+    Append-only journal of saved evaluations, stored as JSON lines next to the results file.
+
+    Each save appends one record and syncs it to disk, so its cost does not depend on the size of the study and no
+    rating is lost if the application crashes. The results CSV is produced from the table by compact().
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+
+    def append(self, record: dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a+", encoding="utf-8")
+            # Terminate a record left incomplete by a crash, so that it does not corrupt the next one
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    self._file.write("\n")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def records(self) -> list:
+        """
+        Returns the journaled records in the order they were saved. A record truncated by a crash is skipped.
+        """
+        if not os.path.isfile(self.path):
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def compact(self, csvPath: str, header: list, rows: list) -> None:
+        """
+        Writes the results CSV atomically and clears the journal, whose records are all in the CSV from then on.
+        A crash in between leaves the journal to be replayed over the new CSV, which gives the same results.
+        """
+        writeResultsCsv(csvPath, header, rows)
+
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,63 @@
+import itertools
+import random
+from collections import OrderedDict
+
+__all__ = ["shuffledLoadingOrder", "blockedLoadingOrder", "countVolumeLoads"]
+
+
+def shuffledLoadingOrder(numberOfMethods: int, numberOfSequences: int, seed: int) -> list:
+    """
+    Returns the (method, sequence) pairs in a fully random order. This is the original experiment ordering,
+    and produces the same order as before for a given seed.
+    """
+    generator = random.Random(seed)
+    methods = list(range(numberOfMethods))
+    sequences = list(range(numberOfSequences))
+    generator.shuffle(sequences)
+
+    loadingOrder = list(itertools.product(methods, sequences))
+    generator.shuffle(loadingOrder)
+    return loadingOrder
+
+
+def blockedLoadingOrder(numberOfMethods: int, numberOfSequences: int, seed: int, windowSize: int) -> list:
+    """
+    Returns the (method, sequence) pairs in a block-randomized order. Sequences are shuffled and grouped in blocks
+    of windowSize sequences, and all the presentations of a block are shuffled together. Every presentation of a
+    sequence therefore falls within windowSize * numberOfMethods consecutive datasets, while the order of methods
+    stays random.
+    """
+    generator = random.Random(seed)
+    methods = list(range(numberOfMethods))
+    sequences = list(range(numberOfSequences))
+    generator.shuffle(sequences)
+
+    windowSize = max(1, windowSize)
+    loadingOrder = []
+    for start in range(0, numberOfSequences, windowSize):
+        block = list(itertools.product(methods, sequences[start:start + windowSize]))
+        generator.shuffle(block)
+        loadingOrder.extend(block)
+    return loadingOrder
+
+
+def countVolumeLoads(loadingOrder: list, cacheBudget: int, volumeSizes=None) -> int:
+    """
+    Returns how many volumes have to be read when going through loadingOrder once, with a least-recently-used
+    cache of volumes whose total size is within cacheBudget. volumeSizes gives the size of the volume of each
+    sequence, in the unit of cacheBudget; without it, cacheBudget is a number of volumes. The volume shown is kept
+    even if it alone exceeds the budget.
+    """
+    cache = OrderedDict()
+    cachedSize = 0
+    loads = 0
+    for _, sequence in loadingOrder:
+        if sequence in cache:
+            cache.move_to_end(sequence)
+            continue
+        loads += 1
+        cache[sequence] = 1 if volumeSizes is None else volumeSizes[sequence]
+        cachedSize += cache[sequence]
+        while cachedSize > max(0, cacheBudget) and len(cache) > 1:
+            cachedSize -= cache.popitem(last=False)[1]
+    return loads
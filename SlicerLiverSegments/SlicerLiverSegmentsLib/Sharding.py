@@ -0,0 +1,107 @@
+import csv
+import os
+import random
+
+from .ResultsJournal import _replaceAtomically
+
+__all__ = ["shardLoadingOrder", "shardFileName", "mergeShardResults", "writeMergedResults"]
+
+# Columns identifying an evaluation and the files it was made on, in results files
+KEY_COLUMNS = ("Method", "Sequence")
+FILE_COLUMNS = ("Volume File", "Segmentation File")
+
+
+def shardLoadingOrder(loadingOrder: list, shardCount: int, shardIndex: int, overlapFraction: float,
+                      seed: int) -> list:
+    """
+    Returns the part of loadingOrder evaluated by shard shardIndex (starting at 0) out of shardCount.
+
+    A fraction overlapFraction of the evaluations, drawn with seed, is given to every shard so that inter-rater
+    agreement can be measured. The others are split in contiguous runs of nearly equal size. Each shard keeps the
+    relative order of loadingOrder, so that blocked orders stay blocked.
+    """
+    if shardCount <= 1:
+        return list(loadingOrder)
+    numberOfEvaluations = len(loadingOrder)
+    shared = set(random.Random(seed).sample(range(numberOfEvaluations),
+                                            round(numberOfEvaluations * overlapFraction)))
+    own = [position for position in range(numberOfEvaluations) if position not in shared]
+    start = len(own) * shardIndex // shardCount
+    stop = len(own) * (shardIndex + 1) // shardCount
+    return [loadingOrder[position] for position in sorted(shared.union(own[start:stop]))]
+
+
+def shardFileName(path: str, shardIndex: int, shardCount: int) -> str:
+    """
+    Returns the results file of a shard (starting at 0): results.csv becomes results.shard2of4.csv.
+    """
+    base, extension = os.path.splitext(path)
+    return f"{base}.shard{shardIndex + 1}of{shardCount}{extension}"
+
+
+def mergeShardResults(paths: list, scoreColumns: tuple) -> tuple:
+    """
+    Reads the results files of several shards and returns the header, the rows of all shards with a leading Shard
+    column (the position of the file in paths, starting at 1), sorted by evaluation, and a list of problems:
+    evaluations saved twice by a shard or made on different files by different shards, and evaluations not scored.
+    Evaluations shared by several shards appear once per shard. Empty files, of shards that did not save any
+    evaluation, are skipped with a problem. Raises ValueError if a file lacks a column needed to merge it.
+    """
+    header = None
+    headerPath = None
+    rows = []
+    problems = []
+    filesByKey = {}
+    for shard, path in enumerate(paths, start=1):
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            fieldNames = reader.fieldnames
+            shardRows = list(reader)
+        if fieldNames is None:
+            problems.append(f"{path}: empty, skipped")
+            continue
+        missingColumns = [column for column in KEY_COLUMNS + FILE_COLUMNS + tuple(scoreColumns)
+                          if column not in fieldNames]
+        if missingColumns:
+            raise ValueError(f"{path} has no {', '.join(missingColumns)} column")
+        if header is None:
+            header = ["Shard"] + fieldNames
+            headerPath = path
+        elif fieldNames != header[1:]:
+            problems.append(f"{path}: columns differ from {headerPath}")
+            continue
+
+        seenKeys = set()
+        unscored = 0
+        for row in shardRows:
+            key = tuple(row[column] for column in KEY_COLUMNS)
+            if "-1" in key:
+                # Row of an evaluation never saved
+                unscored += 1
+                continue
+            if key in seenKeys:
+                problems.append(f"{path}: method {key[0]} sequence {key[1]} saved more than once")
+                continue
+            seenKeys.add(key)
+
+            files = tuple(row[column] for column in FILE_COLUMNS)
+            otherShard, otherFiles = filesByKey.setdefault(key, (shard, files))
+            if otherFiles != files:
+                problems.append(f"{path}: method {key[0]} sequence {key[1]} was made on {', '.join(files)} "
+                                f"but on {', '.join(otherFiles)} in shard {otherShard}")
+            if any(row[column] in ("", "-1") for column in scoreColumns):
+                unscored += 1
+            rows.append({"Shard": str(shard), **row})
+        if unscored:
+            problems.append(f"{path}: {unscored} evaluations not scored")
+
+    rows.sort(key=lambda row: (int(row["Method"]), int(row["Sequence"]), int(row["Shard"])))
+    return header or ["Shard"], rows, problems
+
+
+def writeMergedResults(path: str, header: list, rows: list) -> None:
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(rows)
+    _replaceAtomically(path, write)
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import vtk
+
+__all__ = ["SurfaceCache", "fileContentHash"]
+
+# Content hashes of the most recently hashed files, by path, modification time and size
+MAX_CONTENT_HASHES = 4096
+_contentHashes = OrderedDict()
+_contentHashesLock = threading.Lock()
+
+
+def fileContentHash(path: str) -> str:
+    """
+    Returns the SHA-256 hash of a file's content. Hashes of the last MAX_CONTENT_HASHES files are remembered for
+    as long as the file modification time and size do not change, so repeated calls are cheap.
+    """
+    stat = os.stat(path)
+    memoKey = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _contentHashesLock:
+        contentHash = _contentHashes.get(memoKey)
+        if contentHash is not None:
+            _contentHashes.move_to_end(memoKey)
+            return contentHash
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    contentHash = digest.hexdigest()
+    with _contentHashesLock:
+        _contentHashes[memoKey] = contentHash
+        while len(_contentHashes) > MAX_CONTENT_HASHES:
+            _contentHashes.popitem(last=False)
+    return contentHash
+
+
+class SurfaceCache:
+    """
+    Persistent cache of closed surfaces generated from segmentation files.
+
+    Surfaces are stored as one .vtp file per segment, under a key made of the segmentation file content hash
+    and the conversion parameters used to build them, so that changing either produces new surfaces.
+
+    The directory is kept under maxBytes: once surfaces are saved, the least recently used entries are deleted.
+    Loading an entry updates the modification time of its directory, which orders the entries by use.
+    """
+
+    DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+    def __init__(self, directory: str, maxBytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def key(self, segmentationPath: str, conversionParameters: str) -> str:
+        parametersHash = hashlib.sha256(conversionParameters.encode("utf-8")).hexdigest()[:16]
+        return f"{fileContentHash(segmentationPath)}-{parametersHash}"
+
+    def _segmentPath(self, key: str, segmentIndex: int) -> str:
+        return os.path.join(self.directory, key, f"{segmentIndex}.vtp")
+
+    def load(self, key: str, numberOfSegments: int):
+        """
+        Returns the cached surfaces of all segments, or None if any of them is missing.
+        """
+        paths = [self._segmentPath(key, i) for i in range(numberOfSegments)]
+        if not all(os.path.isfile(path) for path in paths):
+            return None
+
+        polyDatas = []
+        for path in paths:
+            reader = vtk.vtkXMLPolyDataReader()
+            reader.SetFileName(path)
+            reader.Update()
+            if reader.GetErrorCode() != 0:
+                return None
+            polyData = vtk.vtkPolyData()
+            polyData.ShallowCopy(reader.GetOutput())
+            polyDatas.append(polyData)
+        try:
+            os.utime(os.path.join(self.directory, key))
+        except OSError:
+            pass
+        return polyDatas
+
+    def save(self, key: str, polyDatas: list) -> None:
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        for segmentIndex, polyData in enumerate(polyDatas):
+            path = self._segmentPath(key, segmentIndex)
+            temporaryPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            writer = vtk.vtkXMLPolyDataWriter()
+            writer.SetFileName(temporaryPath)
+            writer.SetInputData(polyData if polyData is not None else vtk.vtkPolyData())
+            writer.SetDataModeToAppended()
+            writer.SetCompressorTypeToLZ4()
+            if writer.Write():
+                os.replace(temporaryPath, path)
+            elif os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+        self.prune(keep=key)
+
+    def prune(self, keep: str = None) -> None:
+        """
+        Deletes the least recently used entries, other than keep, until the directory is under maxBytes.
+        """
+        entries = []
+        totalBytes = 0
+        try:
+            with os.scandir(self.directory) as directoryEntries:
+                for directoryEntry in directoryEntries:
+                    if not directoryEntry.is_dir():
+                        continue
+                    with os.scandir(directoryEntry.path) as files:
+                        nbytes = sum(file.stat().st_size for file in files if file.is_file())
+                    entries.append((directoryEntry.stat().st_mtime_ns, directoryEntry.name, nbytes))
+                    totalBytes += nbytes
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Failed to list surface cache {self.directory}: {e}")
+            return
+
+        for _, key, nbytes in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            totalBytes -= nbytes
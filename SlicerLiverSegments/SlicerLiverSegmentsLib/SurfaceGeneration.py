@@ -0,0 +1,185 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+__all__ = ["SurfaceGenerator", "segmentMasks", "buildClosedSurface", "polyDataFromArrays"]
+
+
+def segmentMasks(labelmap: np.ndarray):
+    """
+    Yields (labelValue, mask, offset) for each non-zero label of a KJI labelmap, in ascending label order.
+    Each mask is cropped to the bounding box of its label, and offset is the IJK index of its first voxel.
+    """
+    if labelmap.dtype.kind in "ub" or (labelmap.dtype.kind == "i" and labelmap.min() >= 0):
+        labelValues = np.flatnonzero(np.bincount(labelmap.ravel()))
+    else:
+        labelValues = np.unique(labelmap)
+    for labelValue in labelValues[labelValues != 0]:
+        mask = labelmap == labelValue
+        bounds = []
+        for axis in range(3):
+            indices = np.flatnonzero(mask.any(axis=tuple(a for a in range(3) if a != axis)))
+            bounds.append((indices[0], indices[-1] + 1))
+        (k0, k1), (j0, j1), (i0, i1) = bounds
+        yield int(labelValue), mask[k0:k1, j0:j1, i0:i1].astype(np.uint8), (int(i0), int(j0), int(k0))
+
+
+def buildClosedSurface(mask: np.ndarray, offset: tuple, ijkToRas: np.ndarray,
+                       smoothingFactor: float, decimationFactor: float, computeNormals: bool) -> tuple:
+    """
+    Builds the closed surface of a binary KJI mask and returns it as arrays (see polyDataFromArrays), so that it
+    can be sent back from a worker process. Follows the steps of the binary labelmap to closed surface conversion
+    rule: discrete flying edges, decimation, windowed sinc smoothing and transformation to RAS.
+    """
+    # Pad so that surfaces touching the bounding box are closed
+    mask = np.pad(mask, 1)
+    image = vtk.vtkImageData()
+    image.SetDimensions(mask.shape[2], mask.shape[1], mask.shape[0])
+    image.SetOrigin(offset[0] - 1, offset[1] - 1, offset[2] - 1)
+    image.GetPointData().SetScalars(
+        numpy_support.numpy_to_vtk(mask.ravel(), deep=True, array_type=vtk.VTK_UNSIGNED_CHAR))
+
+    flyingEdges = vtk.vtkDiscreteFlyingEdges3D()
+    flyingEdges.SetInputData(image)
+    flyingEdges.SetValue(0, 1)
+    flyingEdges.ComputeGradientsOff()
+    flyingEdges.ComputeNormalsOff()
+    flyingEdges.ComputeScalarsOff()
+    surface = flyingEdges.GetOutputPort()
+
+    if decimationFactor > 0.0:
+        decimator = vtk.vtkDecimatePro()
+        decimator.SetInputConnection(surface)
+        decimator.SetFeatureAngle(60)
+        decimator.SplittingOff()
+        decimator.PreserveTopologyOn()
+        decimator.SetMaximumError(1)
+        decimator.SetTargetReduction(decimationFactor)
+        surface = decimator.GetOutputPort()
+
+    if smoothingFactor > 0.0:
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputConnection(surface)
+        smoother.SetNumberOfIterations(20)
+        smoother.BoundarySmoothingOff()
+        smoother.FeatureEdgeSmoothingOff()
+        smoother.SetFeatureAngle(90.0)
+        smoother.SetPassBand(pow(10.0, -4.0 * smoothingFactor))
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOn()
+        surface = smoother.GetOutputPort()
+
+    transform = vtk.vtkTransform()
+    transform.SetMatrix(ijkToRas.ravel().tolist())
+    transformer = vtk.vtkTransformPolyDataFilter()
+    transformer.SetInputConnection(surface)
+    transformer.SetTransform(transform)
+    surface = transformer.GetOutputPort()
+
+    if computeNormals:
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputConnection(surface)
+        normals.ConsistencyOn()
+        normals.SplittingOff()
+        # Mirroring geometries turn the surface inside out
+        normals.SetFlipNormals(np.linalg.det(ijkToRas[:3, :3]) < 0)
+        surface = normals.GetOutputPort()
+
+    outputProducer = surface.GetProducer()
+    outputProducer.Update()
+    polyData = outputProducer.GetOutputDataObject(0)
+
+    if polyData.GetNumberOfPoints() == 0:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), None
+    polys = polyData.GetPolys()
+    pointNormals = polyData.GetPointData().GetNormals()
+    return (
+        numpy_support.vtk_to_numpy(polyData.GetPoints().GetData()).copy(),
+        numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int64),
+        numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64),
+        numpy_support.vtk_to_numpy(pointNormals).copy() if pointNormals is not None else None,
+    )
+
+
+def polyDataFromArrays(points: np.ndarray, offsets: np.ndarray, connectivity: np.ndarray, normals=None):
+    """
+    Rebuilds a vtkPolyData from the arrays returned by buildClosedSurface.
+    """
+    polyData = vtk.vtkPolyData()
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+    polyData.SetPoints(vtkPoints)
+
+    polys = vtk.vtkCellArray()
+    polys.SetData(
+        numpy_support.numpy_to_vtk(offsets, deep=True, array_type=vtk.VTK_ID_TYPE),
+        numpy_support.numpy_to_vtk(connectivity, deep=True, array_type=vtk.VTK_ID_TYPE))
+    polyData.SetPolys(polys)
+
+    if normals is not None:
+        vtkNormals = numpy_support.numpy_to_vtk(normals, deep=True)
+        vtkNormals.SetName("Normals")
+        polyData.GetPointData().SetNormals(vtkNormals)
+    return polyData
+
+
+class SurfaceGenerator:
+    """
+    Builds the closed surfaces of the segments of a labelmap in parallel, in a pool of worker processes.
+
+    Worker processes are spawned with the given Python executable (PythonSlicer when running inside Slicer, as the
+    application executable cannot act as a Python interpreter) and only import VTK and NumPy.
+    """
+
+    def __init__(self, maxWorkers: int, executable: str = None) -> None:
+        self._maxWorkers = maxWorkers
+        self._executable = executable
+        self._executor = None
+
+    @property
+    def maxWorkers(self) -> int:
+        return self._maxWorkers
+
+    def _getExecutor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            if self._executable:
+                context.set_executable(self._executable)
+            self._executor = ProcessPoolExecutor(max_workers=self._maxWorkers, mp_context=context)
+        return self._executor
+
+    def submit(self, labelmap: np.ndarray, ijkToRas: np.ndarray,
+               smoothingFactor: float, decimationFactor: float, computeNormals: bool) -> dict:
+        """
+        Starts building the closed surfaces of labelmap and returns a dictionary mapping each non-zero label value
+        to the future of its surface. Pass it to collect once the futures are done.
+        """
+        executor = self._getExecutor()
+        return {
+            labelValue: executor.submit(buildClosedSurface, mask, offset, ijkToRas,
+                                        smoothingFactor, decimationFactor, computeNormals)
+            for labelValue, mask, offset in segmentMasks(labelmap)
+        }
+
+    @staticmethod
+    def collect(futures: dict) -> dict:
+        """
+        Returns a dictionary mapping each label value of futures to its closed surface polydata, waiting for
+        the surfaces still in progress.
+        """
+        return {labelValue: polyDataFromArrays(*future.result()) for labelValue, future in futures.items()}
+
+    def generate(self, labelmap: np.ndarray, ijkToRas: np.ndarray,
+                 smoothingFactor: float, decimationFactor: float, computeNormals: bool) -> dict:
+        """
+        Returns a dictionary mapping each non-zero label value of labelmap to its closed surface polydata.
+        """
+        return self.collect(self.submit(labelmap, ijkToRas, smoothingFactor, decimationFactor, computeNormals))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
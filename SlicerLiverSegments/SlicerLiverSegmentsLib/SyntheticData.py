@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import SimpleITK as sitk
+
+__all__ = ["syntheticCase", "writeSyntheticStudy"]
+
+# Couinaud-like division: 4 sectors around the liver axis, split in an upper and a lower half
+NUMBER_OF_SEGMENTS = 8
+
+
+def syntheticCase(shape: tuple, seed: int, numberOfMethods: int = 4, chunkSize: int = 64) -> tuple:
+    """
+    Returns a CT-like volume (int16, Hounsfield units) of the given KJI shape and one liver segments labelmap
+    (uint8, labels 1 to 8) per method. Methods place the segment boundaries slightly differently.
+    Slabs of chunkSize slices are generated at a time, to keep temporary arrays small for large volumes.
+    """
+    generator = np.random.default_rng(seed)
+    depth, height, width = shape
+    volume = np.empty(shape, dtype=np.int16)
+    labelmaps = [np.zeros(shape, dtype=np.uint8) for _ in range(numberOfMethods)]
+
+    # Normalized coordinates in [-1, 1], with a per-case jitter of the liver position and size
+    center = generator.uniform(-0.05, 0.05, 3)
+    radii = np.array([0.6, 0.35, 0.45]) * generator.uniform(0.9, 1.1, 3)
+    yy = np.linspace(-1.0, 1.0, height)[:, np.newaxis]
+    xx = np.linspace(-1.0, 1.0, width)[np.newaxis, :]
+    body = (xx / 0.9) ** 2 + (yy / 0.7) ** 2 <= 1.0
+    angle = np.arctan2(yy + 0.1 - center[1], xx - 0.2 - center[2])
+
+    for start in range(0, depth, chunkSize):
+        stop = min(depth, start + chunkSize)
+        zz = np.linspace(-1.0, 1.0, depth)[start:stop, np.newaxis, np.newaxis]
+        liver = (((zz - center[0]) / radii[0]) ** 2
+                 + ((yy + 0.1 - center[1]) / radii[1]) ** 2
+                 + ((xx - 0.2 - center[2]) / radii[2]) ** 2) <= 1.0
+
+        slab = np.where(body, np.int16(40), np.int16(-1000)) * np.ones((stop - start, 1, 1), dtype=np.int16)
+        slab[liver] = 60
+        slab += generator.integers(-15, 16, slab.shape, dtype=np.int16)
+        volume[start:stop] = slab
+
+        for method, labelmap in enumerate(labelmaps):
+            sector = np.floor(((angle + np.pi + 0.05 * method) % (2 * np.pi)) / (np.pi / 2)).astype(np.uint8)
+            lower = (zz < center[0] + 0.02 * method).astype(np.uint8)
+            labels = np.broadcast_to(1 + sector + 4 * lower, liver.shape)
+            labelmap[start:stop] = np.where(liver, labels, 0)
+
+    return volume, labelmaps
+
+
+def _image(array: np.ndarray, spacing: tuple) -> sitk.Image:
+    image = sitk.GetImageFromArray(array)
+    image.SetSpacing(spacing)
+    return image
+
+
+def _segmentationImage(labelmap: np.ndarray, spacing: tuple) -> sitk.Image:
+    """
+    Returns the labelmap as an image carrying the segment fields of the .seg.nrrd format.
+    """
+    image = _image(labelmap, spacing)
+    colors = np.random.default_rng(0).uniform(0.2, 1.0, (NUMBER_OF_SEGMENTS, 3))
+    for segmentIndex in range(NUMBER_OF_SEGMENTS):
+        prefix = f"Segment{segmentIndex}_"
+        image.SetMetaData(prefix + "ID", f"Segment_{segmentIndex + 1}")
+        image.SetMetaData(prefix + "Name", f"Segment {segmentIndex + 1}")
+        image.SetMetaData(prefix + "LabelValue", str(segmentIndex + 1))
+        image.SetMetaData(prefix + "Layer", "0")
+        image.SetMetaData(prefix + "Color", " ".join(f"{c:.3f}" for c in colors[segmentIndex]))
+    return image
+
+
+def writeSyntheticStudy(directory: str, numberOfCases: int, shape: tuple, volumeExtension: str = ".nii.gz",
+                        segmentationExtension: str = ".nii.gz", numberOfMethods: int = 4,
+                        spacing: tuple = (0.8, 0.8, 1.0), seed: int = 0) -> tuple:
+    """
+    Writes a synthetic study laid out like an experiment: a volumes directory and one segmentations directory per
+    method, with files named after the case ID. Returns the volumes directory and the list of method directories.
+    Supported extensions are .nii.gz, .nii and .nrrd, and .seg.nrrd for segmentations.
+    """
+    volumesDirectory = os.path.join(directory, "Volumes")
+    methodDirectories = [os.path.join(directory, f"Method{method + 1}") for method in range(numberOfMethods)]
+    for path in [volumesDirectory] + methodDirectories:
+        os.makedirs(path, exist_ok=True)
+
+    for case in range(numberOfCases):
+        volume, labelmaps = syntheticCase(shape, seed + case, numberOfMethods)
+        caseName = f"case{case:04d}"
+        sitk.WriteImage(_image(volume, spacing), os.path.join(volumesDirectory, caseName + volumeExtension),
+                        useCompression=volumeExtension.endswith(".gz"))
+        for labelmap, methodDirectory in zip(labelmaps, methodDirectories):
+            path = os.path.join(methodDirectory, caseName + segmentationExtension)
+            if segmentationExtension == ".seg.nrrd":
+                sitk.WriteImage(_segmentationImage(labelmap, spacing), path, useCompression=True)
+            else:
+                sitk.WriteImage(_image(labelmap, spacing), path, useCompression=path.endswith((".gz", ".nrrd")))
+
+    return volumesDirectory, methodDirectories
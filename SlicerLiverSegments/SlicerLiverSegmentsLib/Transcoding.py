@@ -0,0 +1,86 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .ImageIO import DecodedImage, loadDecodedImage, readImage, saveDecodedImage
+
+__all__ = ["TranscodingCache", "needsTranscoding"]
+
+# Extensions of inputs stored compressed (NRRD files are usually gzip encoded)
+COMPRESSED_EXTENSIONS = (".gz", ".nrrd")
+
+
+def needsTranscoding(path: str) -> bool:
+    return path.endswith(COMPRESSED_EXTENSIONS)
+
+
+def _transcode(directory: str, sourcePath: str) -> None:
+    """
+    Worker process entry point
+    """
+    TranscodingCache(directory).read(sourcePath)
+
+
+class TranscodingCache:
+    """
+    Keeps an uncompressed copy of compressed input images, so that they are decoded only once.
+
+    Each input is stored as a .npy voxel buffer, loaded memory-mapped, and a .json file with its geometry and
+    metadata. Entries are keyed by the input path, size and modification time, so a modified input is transcoded
+    again.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._executor = None
+
+    def _entryPath(self, sourcePath: str) -> str:
+        stat = os.stat(sourcePath)
+        key = hashlib.sha1(f"{os.path.abspath(sourcePath)}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+        return os.path.join(self.directory, key.hexdigest())
+
+    def isCached(self, sourcePath: str) -> bool:
+        return os.path.isfile(self._entryPath(sourcePath) + ".json")
+
+    def load(self, sourcePath: str):
+        """
+        Returns the cached image of sourcePath with a memory-mapped voxel array, or None if not cached.
+        """
+        return loadDecodedImage(self._entryPath(sourcePath))
+
+    def store(self, sourcePath: str, decoded: DecodedImage) -> None:
+        saveDecodedImage(self._entryPath(sourcePath), decoded, source=os.path.abspath(sourcePath))
+
+    def read(self, sourcePath: str) -> DecodedImage:
+        """
+        Returns the image of sourcePath from the cache, transcoding it first if needed.
+        """
+        decoded = self.load(sourcePath)
+        if decoded is not None:
+            return decoded
+        decoded = readImage(sourcePath)
+        try:
+            self.store(sourcePath, decoded)
+        except OSError as e:
+            print(f"Failed to transcode {sourcePath}: {e}")
+            return decoded
+        return self.load(sourcePath) or decoded
+
+    def transcodeInBackground(self, sourcePaths: list, maxWorkers: int, executable: str = None) -> list:
+        """
+        Transcodes the given inputs in a pool of worker processes and returns their futures. Inputs already
+        cached are skipped.
+        """
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            if executable:
+                context.set_executable(executable)
+            self._executor = ProcessPoolExecutor(max_workers=maxWorkers, mp_context=context)
+        return [self._executor.submit(_transcode, self.directory, sourcePath)
+                for sourcePath in sourcePaths if not self.isCached(sourcePath)]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
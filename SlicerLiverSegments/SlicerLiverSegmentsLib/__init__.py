@@ -0,0 +1,18 @@
+from .AgreementMetrics import *
+from .Analytics import *
+from .Caches import *
+from .Cropping import *
+from .DatasetRegistry import *
+from .DicomIndex import *
+from .DirectoryScanner import *
+from .ImageIO import *
+from .Instrumentation import *
+from .Prefetch import *
+from .ResultsDatabase import *
+from .ResultsJournal import *
+from .Scheduling import *
+from .Sharding import *
+from .SurfaceCache import *
+from .SurfaceGeneration import *
+from .SyntheticData import *
+from .Transcoding import *
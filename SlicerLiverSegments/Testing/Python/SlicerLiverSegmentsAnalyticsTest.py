@@ -0,0 +1,156 @@
+import math
+import unittest
+
+import numpy as np
+
+from SlicerLiverSegmentsLib import RatingsAnalytics
+from SlicerLiverSegmentsLib.Analytics import _chiSquareSurvival
+
+#
+# SlicerLiverSegmentsAnalyticsTest
+#
+# Statistics of the ratings, checked against textbook values. Pure Python, does not need the application.
+#
+
+
+class SlicerLiverSegmentsAnalyticsTest(unittest.TestCase):
+
+    def analytics(self, numberOfMethods=4):
+        return RatingsAnalytics(("Q1 Scoring",), numberOfMethods)
+
+    def addMethodScores(self, analytics, matrix, rater=0):
+        """
+        Adds the scores of a rater, with one row per sequence and one column per method
+        """
+        sequences, methods = np.indices(np.shape(matrix))
+        analytics.raterIndex(f"Rater {rater}")
+        analytics.add(np.full(np.size(matrix), rater), methods.ravel(), sequences.ravel(),
+                      np.ravel(matrix)[:, np.newaxis])
+
+    def addRaterScores(self, analytics, matrix):
+        """
+        Adds the scores of method 0, with one row per sequence and one column per rater
+        """
+        sequences, raters = np.indices(np.shape(matrix))
+        for rater in range(np.shape(matrix)[1]):
+            analytics.raterIndex(f"Rater {rater}")
+        analytics.add(raters.ravel(), np.zeros(np.size(matrix)), sequences.ravel(), np.ravel(matrix)[:, np.newaxis])
+
+    def test_ChiSquareSurvival(self):
+        # Odd and even degrees of freedom, from scipy.stats.chi2.sf
+        self.assertAlmostEqual(_chiSquareSurvival(0.5, 1), 0.47950012218695337, places=10)
+        self.assertAlmostEqual(_chiSquareSurvival(2.0, 2), math.exp(-1.0), places=10)
+        self.assertAlmostEqual(_chiSquareSurvival(3.5, 3), 0.3207621208056397, places=10)
+        self.assertAlmostEqual(_chiSquareSurvival(7.2, 4), 0.12568912325754575, places=10)
+        self.assertEqual(_chiSquareSurvival(0.0, 3), 1.0)
+
+    def test_ScoreDistributions(self):
+        analytics = self.analytics(2)
+        self.addMethodScores(analytics, [[1, 5], [3, 4]])
+        self.assertTrue(np.array_equal(analytics.meanScores(), [[2.0], [4.5]]))
+        # Saving an evaluation again replaces its score, unanswered questions are not counted
+        analytics.add(0, 0, 0, [[3]])
+        analytics.add(0, 1, 1, [[-1]])
+        self.assertEqual(len(analytics), 4)
+        self.assertTrue(np.array_equal(analytics.scoreDistributions()[:, 0], [[0, 0, 0, 2, 0, 0], [0, 0, 0, 0, 0, 1]]))
+        self.assertEqual(analytics.meanScores()[1, 0], 5.0)
+
+    def test_Friedman(self):
+        # With ties within blocks, as scipy.stats.friedmanchisquare
+        analytics = self.analytics()
+        self.addMethodScores(analytics, [[1, 2, 3, 3], [2, 2, 4, 5], [1, 3, 3, 4], [2, 1, 5, 5], [3, 3, 4, 4],
+                                         [1, 2, 2, 5]])
+        statistic, pValue, numberOfBlocks = analytics.friedman(0)
+        self.assertAlmostEqual(statistic, 15.113207547169822, places=10)
+        self.assertAlmostEqual(pValue, 0.0017224168361887763, places=10)
+        self.assertEqual(numberOfBlocks, 6)
+
+    def test_Wilcoxon(self):
+        # Differences 2, 0, 2, 3, 0, 1, -2, 4, -1, 2: zero differences are dropped and tied ones share their ranks.
+        # Negative ranks sum to 6 as in scipy.stats.wilcoxon(zero_method="wilcox", correction=False), positive
+        # ones to 36 - 6.
+        analytics = self.analytics(2)
+        firstScores = [5, 4, 3, 5, 2, 4, 3, 5, 1, 4]
+        secondScores = [3, 4, 1, 2, 2, 3, 5, 1, 2, 2]
+        self.addMethodScores(analytics, np.column_stack([firstScores, secondScores]))
+        positiveRankSum, pValue, n = analytics.wilcoxon(0, 0, 1)
+        self.assertEqual(positiveRankSum, 30.0)
+        self.assertAlmostEqual(pValue, 0.08848271717174365, places=10)
+        self.assertEqual(n, 8)
+        self.assertEqual([pair[:2] for pair in analytics.pairwiseWilcoxon(0)], [(0, 1)])
+
+    def test_CohensKappa(self):
+        # 50 items rated yes (1) or no (0): 20 both yes, 5 yes and no, 10 no and yes, 15 both no. Kappa is 0.4.
+        analytics = self.analytics(1)
+        pairs = [(1, 1)] * 20 + [(1, 0)] * 5 + [(0, 1)] * 10 + [(0, 0)] * 15
+        self.addRaterScores(analytics, pairs)
+        self.assertAlmostEqual(analytics.cohensKappa(0, 0, 1), 0.4, places=10)
+        # With two adjacent categories, quadratic weights are the unweighted ones
+        self.assertAlmostEqual(analytics.cohensKappa(0, 0, 1, weighted=True), 0.4, places=10)
+        self.assertAlmostEqual(analytics.cohensKappa(0, 1, 0), 0.4, places=10)
+
+    def test_FleissKappa(self):
+        # Fleiss (1971): 10 subjects rated by 14 raters in 5 categories, kappa is 0.210
+        categoryCounts = [
+            [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+            [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+        ]
+        ratings = [np.repeat(np.arange(1, 6), counts) for counts in categoryCounts]
+        analytics = self.analytics(1)
+        self.addRaterScores(analytics, ratings)
+        self.assertAlmostEqual(analytics.fleissKappa(0), 0.20993070442195522, places=10)
+        self.assertEqual(round(analytics.fleissKappa(0), 3), 0.210)
+
+    def test_Icc(self):
+        # Shrout and Fleiss (1979): 6 targets rated by 4 judges on a 10 point scale, with BMS 11.24, JMS 32.49 and
+        # EMS 1.02, ICC(2,1) is 0.29
+        analytics = RatingsAnalytics(("Q1 Scoring",), 1, maxScore=10)
+        self.addRaterScores(analytics, [[9, 2, 5, 8], [6, 1, 3, 2], [8, 4, 6, 8], [7, 1, 2, 6], [10, 5, 6, 9],
+                                        [6, 2, 4, 7]])
+        icc, n = analytics.icc(0)
+        self.assertAlmostEqual(icc, 0.2897637795275592, places=10)
+        self.assertEqual(round(icc, 2), 0.29)
+        self.assertEqual(n, 6)
+
+    def test_OneRater(self):
+        analytics = self.analytics()
+        self.addMethodScores(analytics, [[1, 2, 3, 4], [2, 3, 4, 5]])
+        self.assertTrue(math.isnan(analytics.cohensKappa(0, 0, 1)))
+        self.assertTrue(math.isnan(analytics.fleissKappa(0)))
+        self.assertTrue(math.isnan(analytics.icc(0)[0]))
+        # Methods are still compared
+        self.assertEqual(analytics.friedman(0)[2], 2)
+
+    def test_IdenticalRatings(self):
+        analytics = self.analytics(2)
+        self.addRaterScores(analytics, np.full((5, 3), 3))
+        self.addMethodScores(analytics, np.full((5, 2), 3))
+        self.assertTrue(math.isnan(analytics.cohensKappa(0, 0, 1)))
+        self.assertTrue(math.isnan(analytics.fleissKappa(0)))
+        self.assertTrue(math.isnan(analytics.icc(0)[0]))
+        self.assertEqual(analytics.friedman(0), (0.0, 1.0, 5))
+        positiveRankSum, pValue, n = analytics.wilcoxon(0, 0, 1)
+        self.assertTrue(math.isnan(positiveRankSum) and math.isnan(pValue))
+        self.assertEqual(n, 0)
+
+    def test_SingleDataset(self):
+        analytics = self.analytics(3)
+        self.addMethodScores(analytics, [[1, 2, 3]])
+        statistic, pValue, numberOfBlocks = analytics.friedman(0)
+        self.assertAlmostEqual(statistic, 2.0)
+        self.assertAlmostEqual(pValue, math.exp(-1.0))
+        self.assertEqual(numberOfBlocks, 1)
+
+        analytics = self.analytics(1)
+        self.addRaterScores(analytics, [[2, 4]])
+        self.assertEqual(analytics.icc(0)[1], 1)
+        self.assertTrue(math.isnan(analytics.icc(0)[0]))
+        # Chance agreement is nil, so a disagreement on the single dataset gives a kappa of 0
+        self.assertEqual(analytics.cohensKappa(0, 0, 1), 0.0)
+
+    def test_NoRatings(self):
+        analytics = self.analytics()
+        self.assertTrue(np.isnan(analytics.meanScores()).all())
+        self.assertTrue(math.isnan(analytics.friedman(0)[0]))
+        self.assertEqual(analytics.wilcoxon(0, 0, 1)[2], 0)
+        self.assertTrue(math.isnan(analytics.fleissKappa(0)))
@@ -0,0 +1,112 @@
+import json
+import os
+import shutil
+import tempfile
+
+import slicer
+from slicer.ScriptedLoadableModule import ScriptedLoadableModuleTest
+
+from SlicerLiverSegments import SlicerLiverSegmentsLogic
+from SlicerLiverSegmentsLib import Instrumentation, peakMemoryUsage, writeSyntheticStudy
+
+#
+# SlicerLiverSegmentsBenchmark
+#
+# Measures the latency of the navigation hot path on synthetic studies. Configured with environment variables:
+#
+#   SLICERLIVERSEGMENTS_BENCHMARK_SIZES    comma separated volume sizes, as IxJxK (default: 64x64x64)
+#   SLICERLIVERSEGMENTS_BENCHMARK_FORMATS  comma separated volume:segmentation extensions
+#                                          (default: .nii.gz:.nii.gz,.nrrd:.seg.nrrd)
+#   SLICERLIVERSEGMENTS_BENCHMARK_CASES    number of cases of each study (default: 3)
+#   SLICERLIVERSEGMENTS_BENCHMARK_OUTPUT   JSON file the results are written to (default: printed only)
+#
+# For example, SLICERLIVERSEGMENTS_BENCHMARK_SIZES=256x256x256,512x512x800 for production-like volumes.
+#
+# The reported peakRss is the peak resident memory of the process when a configuration finishes, so it includes the
+# configurations benchmarked before it.
+#
+
+
+class SlicerLiverSegmentsBenchmark(ScriptedLoadableModuleTest):
+
+    def setUp(self):
+        slicer.mrmlScene.Clear()
+
+    def runTest(self):
+        self.setUp()
+        self.test_NavigationBenchmark()
+
+    def configurations(self):
+        sizes = os.environ.get("SLICERLIVERSEGMENTS_BENCHMARK_SIZES", "64x64x64")
+        formats = os.environ.get("SLICERLIVERSEGMENTS_BENCHMARK_FORMATS", ".nii.gz:.nii.gz,.nrrd:.seg.nrrd")
+        for size in sizes.split(","):
+            i, j, k = (int(n) for n in size.lower().split("x"))
+            for fileFormat in formats.split(","):
+                volumeExtension, segmentationExtension = fileFormat.split(":")
+                yield (k, j, i), volumeExtension, segmentationExtension
+
+    def test_NavigationBenchmark(self):
+        numberOfCases = int(os.environ.get("SLICERLIVERSEGMENTS_BENCHMARK_CASES", "3"))
+        results = []
+        for shape, volumeExtension, segmentationExtension in self.configurations():
+            self.delayDisplay(f"Benchmarking {shape[::-1]} {volumeExtension} / {segmentationExtension}")
+            results.append(self.runBenchmark(numberOfCases, shape, volumeExtension, segmentationExtension))
+
+        report = json.dumps({"numberOfCases": numberOfCases, "results": results}, indent=2)
+        print(report)
+        outputPath = os.environ.get("SLICERLIVERSEGMENTS_BENCHMARK_OUTPUT")
+        if outputPath:
+            with open(outputPath, "w") as f:
+                f.write(report)
+        self.delayDisplay("Benchmark finished")
+
+    def runBenchmark(self, numberOfCases, shape, volumeExtension, segmentationExtension):
+        slicer.mrmlScene.Clear()
+        studyDirectory = tempfile.mkdtemp(prefix="SlicerLiverSegmentsBenchmark")
+        try:
+            volumesDirectory, methodDirectories = writeSyntheticStudy(
+                studyDirectory, numberOfCases, shape, volumeExtension, segmentationExtension)
+
+            logic = SlicerLiverSegmentsLogic()
+            parameterNode = logic.getParameterNode()
+            parameterNode.volumesDirectory = volumesDirectory
+            parameterNode.methodDirectories = list(methodDirectories)
+            parameterNode.orderSeed = "0"
+            parameterNode.outputFileName = os.path.join(studyDirectory, "results.csv")
+            parameterNode.cacheDirectory = os.path.join(studyDirectory, "Cache")
+            parameterNode.resultsTableNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTableNode")
+
+            instrumentation = Instrumentation(historySize=100000)
+
+            def measure(operation, function):
+                with instrumentation.measure(operation):
+                    function()
+
+            try:
+                measure("initializeExperiment", lambda: self.assertTrue(logic.initializeExperiment()))
+                measure("startExperiment", logic.startExperiment)
+                while not logic.isLastDataset():
+                    measure("saveCurrentDataToTable", logic.saveCurrentDataToTable)
+                    measure("nextDataset", logic.nextDataset)
+                measure("saveCurrentDataToTable", logic.saveCurrentDataToTable)
+                for _ in range(min(4, parameterNode.totalEvaluations - 1)):
+                    measure("previousDataset", logic.previousDataset)
+                measure("firstDataset", logic.firstDataset)
+                measure("lastDataset", logic.lastDataset)
+            finally:
+                logic.cleanup()
+
+            operations = {
+                operation: {"count": count, "mean": mean, "p50": median, "p95": p95, "max": maximum}
+                for operation, count, mean, median, p95, maximum in instrumentation.summary()
+            }
+            return {
+                "size": list(shape[::-1]),
+                "volumeFormat": volumeExtension,
+                "segmentationFormat": segmentationExtension,
+                "operations": operations,
+                "peakRss": peakMemoryUsage(),
+            }
+        finally:
+            slicer.mrmlScene.Clear()
+            shutil.rmtree(studyDirectory, ignore_errors=True)
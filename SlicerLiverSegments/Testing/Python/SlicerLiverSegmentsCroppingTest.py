@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from SlicerLiverSegmentsLib import cropToBounds, ijkToRasMatrix, labelBounds, readImage, syntheticCase, writeSyntheticStudy
+
+#
+# SlicerLiverSegmentsCroppingTest
+#
+# Geometry of volumes cropped to their segmentations. Pure Python, does not need the application.
+#
+
+
+class SlicerLiverSegmentsCroppingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temporaryDirectory.cleanup()
+
+    def writeCase(self, origin, direction):
+        """
+        Writes a small synthetic case with the given LPS geometry, returns the volume and segmentation paths
+        """
+        volume, labelmaps = syntheticCase((24, 32, 40), seed=3, numberOfMethods=1)
+        paths = []
+        for array, fileName in [(volume, "volume.nrrd"), (labelmaps[0], "segmentation.nrrd")]:
+            image = sitk.GetImageFromArray(array)
+            image.SetOrigin(origin)
+            image.SetSpacing((0.8, 0.7, 1.5))
+            image.SetDirection(direction)
+            paths.append(os.path.join(self.temporaryDirectory.name, fileName))
+            sitk.WriteImage(image, paths[-1])
+        return paths
+
+    def assertCropAligned(self, volumePath, segmentationPath, margin):
+        volume = readImage(volumePath)
+        segmentation = readImage(segmentationPath)
+        lower, upper = labelBounds(segmentation)
+        cropped = cropToBounds(volume, lower, upper, margin)
+        croppedSegmentation = cropToBounds(segmentation, lower, upper, margin)
+
+        # The cropped volume is the full one translated by a whole number of voxels
+        fullMatrix = ijkToRasMatrix(volume)
+        croppedMatrix = ijkToRasMatrix(cropped)
+        offset = (np.linalg.inv(fullMatrix) @ croppedMatrix[:, 3])[:3]
+        self.assertTrue(np.allclose(offset, np.round(offset), atol=1e-6))
+        offset = np.round(offset).astype(int)
+        translation = np.eye(4)
+        translation[:3, 3] = offset
+        self.assertTrue(np.allclose(croppedMatrix, fullMatrix @ translation, atol=1e-6))
+
+        # Voxels at the same RAS position have the same value
+        (i0, j0, k0), (k1, j1, i1) = offset, cropped.array.shape
+        self.assertTrue(np.array_equal(cropped.array, volume.array[k0:k0 + k1, j0:j0 + j1, i0:i0 + i1]))
+
+        # The segmentation cropped to the same bounds stays aligned with the volume and keeps all its labels
+        self.assertTrue(np.allclose(ijkToRasMatrix(croppedSegmentation), croppedMatrix, atol=1e-6))
+        self.assertEqual(croppedSegmentation.array.shape, cropped.array.shape)
+        self.assertEqual(np.count_nonzero(croppedSegmentation.array), np.count_nonzero(segmentation.array))
+        return cropped
+
+    def test_CropSyntheticStudy(self):
+        volumesDirectory, methodDirectories = writeSyntheticStudy(
+            self.temporaryDirectory.name, 1, (24, 32, 40), volumeExtension=".nrrd", segmentationExtension=".nrrd",
+            numberOfMethods=1)
+        volumePath = os.path.join(volumesDirectory, "case0000.nrrd")
+        segmentationPath = os.path.join(methodDirectories[0], "case0000.nrrd")
+
+        # Without margin, the crop is the extent of the segmented voxels
+        cropped = self.assertCropAligned(volumePath, segmentationPath, 0.0)
+        labelled = np.nonzero(readImage(segmentationPath).array)
+        self.assertEqual(cropped.array.shape, tuple(int(np.ptp(indices)) + 1 for indices in labelled))
+
+        # A margin grows the crop, within the volume
+        self.assertGreater(self.assertCropAligned(volumePath, segmentationPath, 5.0).array.size, cropped.array.size)
+        self.assertEqual(self.assertCropAligned(volumePath, segmentationPath, 1000.0).array.shape, (24, 32, 40))
+
+    def test_CropObliqueVolume(self):
+        # Origin away from zero, axes rotated and flipped, so that LPS and RAS differ on every axis
+        angle = np.radians(25.0)
+        direction = np.array([[np.cos(angle), -np.sin(angle), 0.0],
+                              [np.sin(angle), np.cos(angle), 0.0],
+                              [0.0, 0.0, -1.0]])
+        volumePath, segmentationPath = self.writeCase((-120.5, 80.25, 310.0), tuple(direction.ravel()))
+        self.assertCropAligned(volumePath, segmentationPath, 0.0)
+        self.assertCropAligned(volumePath, segmentationPath, 3.0)
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from SlicerLiverSegmentsLib import DEFAULT_CASE_ID_PATTERN, DicomSeriesIndex, DirectoryScanner
+
+#
+# SlicerLiverSegmentsDicomIndexTest
+#
+# Indexing and reading of DICOM series. Pure Python, does not need the application.
+#
+# Series are read by worker processes started with spawn, which import the main module again. The tests are started
+# under the main guard, so that the workers do not run them again when this file is run as a script.
+#
+
+
+def writeSeries(directory, array, origin, spacing, direction, patientId, seriesInstanceUid):
+    """
+    Writes a KJI array as a DICOM series of one file per slice
+    """
+    os.makedirs(directory, exist_ok=True)
+    image = sitk.GetImageFromArray(array)
+    image.SetOrigin(origin)
+    image.SetSpacing(spacing)
+    image.SetDirection(direction)
+    writer = sitk.ImageFileWriter()
+    writer.KeepOriginalImageUIDOn()
+    orientation = "\\".join(str(value) for value in np.array(direction).reshape(3, 3)[:, :2].T.ravel())
+    for k in range(image.GetDepth()):
+        sliceImage = image[:, :, k]
+        for tag, value in [
+            ("0008|0060", "CT"),
+            ("0010|0020", patientId),
+            ("0020|000d", seriesInstanceUid + ".1"),
+            ("0020|000e", seriesInstanceUid),
+            ("0020|0013", str(k + 1)),
+            ("0020|0032", "\\".join(str(value) for value in image.TransformIndexToPhysicalPoint((0, 0, k)))),
+            ("0020|0037", orientation),
+            ("0018|0050", str(spacing[2])),
+        ]:
+            sliceImage.SetMetaData(tag, value)
+        writer.SetFileName(os.path.join(directory, f"slice{k:03d}.dcm"))
+        writer.Execute(sliceImage)
+
+
+class SlicerLiverSegmentsDicomIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temporaryDirectory.name, "Volumes")
+        self.index = DicomSeriesIndex(os.path.join(self.temporaryDirectory.name, "Dicom"))
+        self.array = np.random.default_rng(0).integers(-1000, 1000, (6, 10, 12), dtype=np.int16)
+        # Axes rotated and flipped, so that any mix-up of the direction columns shows
+        angle = np.radians(20.0)
+        self.direction = tuple(np.array([[np.cos(angle), 0.0, np.sin(angle)],
+                                         [0.0, -1.0, 0.0],
+                                         [np.sin(angle), 0.0, -np.cos(angle)]]).ravel())
+        # Patient/study/series layout, the study and series directories being numbered per patient
+        for patient in (1, 2):
+            writeSeries(os.path.join(self.root, f"PAT00{patient}", "STUDY1", "SERIES2"), self.array + patient,
+                        (-100.0, 50.0 * patient, 20.0), (0.7, 0.8, 2.5), self.direction, f"P{patient}",
+                        f"1.2.826.0.1.3680043.2.1125.{patient}")
+
+    def tearDown(self):
+        self.index.shutdown()
+        self.temporaryDirectory.cleanup()
+
+    def seriesReaderImage(self, series):
+        reader = sitk.ImageSeriesReader()
+        reader.SetFileNames(sitk.ImageSeriesReader.GetGDCMSeriesFileNames(
+            os.path.join(self.root, series.directory), series.seriesInstanceUid))
+        return reader.Execute()
+
+    def test_Geometry(self):
+        series = self.index.scan(self.root)
+        self.assertEqual(len(series), 2)
+        for entry in series:
+            # The geometry read from the headers is the one of the series reader
+            image = self.seriesReaderImage(entry)
+            self.assertTrue(np.allclose(entry.origin, image.GetOrigin(), atol=1e-4))
+            self.assertTrue(np.allclose(entry.spacing, image.GetSpacing(), atol=1e-4))
+            self.assertTrue(np.allclose(entry.direction, image.GetDirection(), atol=1e-4))
+            self.assertTrue(np.allclose(entry.direction, self.direction, atol=1e-4))
+            self.assertEqual(len(entry.files), 6)
+
+    def test_Read(self):
+        series = self.index.scan(self.root)
+        # Slices are read in one go, or in chunks by worker processes
+        for maxWorkers in (1, 2):
+            shutil.rmtree(os.path.join(self.index.databaseDirectory, "Pixels"), ignore_errors=True)
+            self.index.maxWorkers = maxWorkers
+            for entry in series:
+                decoded = self.index.read(os.path.join(self.root, entry.name))
+                expected = sitk.GetArrayFromImage(self.seriesReaderImage(entry))
+                self.assertTrue(np.array_equal(decoded.array, expected))
+                self.assertEqual(decoded.metadata["PatientID"], entry.patientId)
+
+        # Then from the pixel data cache, memory-mapped
+        decoded = self.index.read(os.path.join(self.root, series[0].name))
+        self.assertIsInstance(decoded.array, np.memmap)
+        self.assertTrue(np.array_equal(decoded.array, self.array + 1))
+
+    def test_CaseId(self):
+        scanner = DirectoryScanner(self.temporaryDirectory.name, (), DEFAULT_CASE_ID_PATTERN)
+        series = self.index.scan(self.root)
+        self.assertEqual([entry.caseDirectory for entry in series], ["PAT001", "PAT002"])
+        # The case ID comes from the patient directory, not from the series one
+        self.assertEqual([scanner.caseId(entry.caseDirectory) for entry in series], ["001", "002"])
+        self.assertEqual([entry.patientId for entry in series], ["P1", "P2"])
+
+        # Series directly in the indexed directory have no case directory
+        seriesDirectory = os.path.join(self.root, "PAT001", "STUDY1", "SERIES2")
+        index = DicomSeriesIndex(os.path.join(self.temporaryDirectory.name, "Dicom"))
+        self.assertEqual([entry.caseDirectory for entry in index.scan(seriesDirectory)], [""])
+
+    def test_IndexInvalidation(self):
+        series = self.index.scan(self.root)
+
+        # An unchanged directory is not indexed again
+        index = DicomSeriesIndex(self.index.databaseDirectory)
+        index._index = lambda dirPath: self.fail("indexed again")
+        self.assertEqual(index.scan(self.root), series)
+        self.assertEqual(index.series(os.path.join(self.root, series[0].name)), series[0])
+
+        # Adding a series to a nested directory only changes the modification time of that directory, the whole
+        # directory is indexed again
+        rootMtime = os.stat(self.root).st_mtime_ns
+        time.sleep(0.01)
+        writeSeries(os.path.join(self.root, "PAT001", "STUDY1", "SERIES2", "Reconstruction"), self.array,
+                    (0.0, 0.0, 0.0), (1.0, 1.0, 1.0), tuple(np.eye(3).ravel()), "P1", "1.2.826.0.1.3680043.2.1125.3")
+        self.assertEqual(os.stat(self.root).st_mtime_ns, rootMtime)
+        index = DicomSeriesIndex(self.index.databaseDirectory)
+        self.assertEqual(len(index.scan(self.root)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from SlicerLiverSegmentsLib import DEFAULT_CASE_ID_PATTERN, DirectoryScanner, ManifestEntry, pairByCaseId
+
+#
+# SlicerLiverSegmentsDirectoryScannerTest
+#
+# Case IDs of dataset files and pairing of segmentations with volumes. Pure Python, does not need the application.
+#
+
+
+class SlicerLiverSegmentsDirectoryScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        self.scanner = DirectoryScanner(
+            os.path.join(self.temporaryDirectory.name, "Manifests"), (".nii.gz", ".nrrd"), DEFAULT_CASE_ID_PATTERN)
+
+    def tearDown(self):
+        self.temporaryDirectory.cleanup()
+
+    def entries(self, names):
+        return [ManifestEntry(name=name, size=0, mtime=0, caseId=self.scanner.caseId(name)) for name in names]
+
+    def test_CaseId(self):
+        # The last number of the file name is the case ID, whatever the prefixes and extensions
+        self.assertEqual(self.scanner.caseId("case012.nii.gz"), "012")
+        self.assertEqual(self.scanner.caseId("3D_liver_v2_case012.nii.gz"), "012")
+        self.assertEqual(self.scanner.caseId("liver-7_seg.nrrd"), "7")
+        self.assertIsNone(self.scanner.caseId("liver.nrrd"))
+
+        # With a group, the group is the case ID
+        scanner = DirectoryScanner(self.temporaryDirectory.name, (".nrrd",), r"patient([0-9]+)")
+        self.assertEqual(scanner.caseId("patient4_phase2.nrrd"), "4")
+
+    def test_PairByCaseId(self):
+        volumes = self.entries(["volume1.nrrd", "volume2.nrrd", "volume3.nrrd"])
+        segmentations = self.entries(["seg_v2_3.nrrd", "seg_v2_1.nrrd", "seg_v2_2.nrrd"])
+        pairedEntries, problems = pairByCaseId(volumes, segmentations)
+        self.assertEqual(problems, [])
+        self.assertEqual([entry.name for entry in pairedEntries], ["seg_v2_1.nrrd", "seg_v2_2.nrrd", "seg_v2_3.nrrd"])
+
+    def test_PairingProblems(self):
+        volumes = self.entries(["volume1.nrrd", "volume2.nrrd", "volume3.nrrd"])
+
+        # Duplicate and unpaired case IDs of the segmentations are all reported
+        segmentations = self.entries(["seg1.nrrd", "seg01.nrrd", "seg2.nrrd", "seg4.nrrd", "seg.nrrd"])
+        for index, entry in enumerate(segmentations):
+            if entry.name == "seg01.nrrd":
+                segmentations[index] = ManifestEntry(name=entry.name, size=0, mtime=0, caseId="1")
+        pairedEntries, problems = pairByCaseId(volumes, segmentations)
+        self.assertIsNone(pairedEntries)
+        self.assertEqual(sorted(problems), sorted([
+            "seg01.nrrd: case ID 1 also used by seg1.nrrd",
+            "seg.nrrd: no case ID",
+            "volume3.nrrd: no file for case ID 3",
+            "seg4.nrrd: case ID 4 has no volume",
+        ]))
+
+        # So are the ones of the volumes
+        volumes.append(ManifestEntry(name="volume3b.nrrd", size=0, mtime=0, caseId="3"))
+        pairedEntries, problems = pairByCaseId(volumes, self.entries(["seg1.nrrd", "seg2.nrrd", "seg3.nrrd"]))
+        self.assertIsNone(pairedEntries)
+        self.assertEqual(problems, ["volume3b.nrrd: case ID 3 also used by volume3.nrrd"])
+
+    def test_PairByPosition(self):
+        # Without any case ID in the file names, files are paired in name order
+        volumes = self.entries(["liver_a.nrrd", "liver_b.nrrd", "liver_c.nrrd"])
+        segmentations = self.entries(["seg_c.nrrd", "seg_a.nrrd", "seg_b.nrrd"])
+        pairedEntries, problems = pairByCaseId(volumes, segmentations)
+        self.assertEqual(problems, [])
+        self.assertEqual([entry.name for entry in pairedEntries], ["seg_a.nrrd", "seg_b.nrrd", "seg_c.nrrd"])
+
+        # As long as there are as many of them
+        pairedEntries, problems = pairByCaseId(volumes, segmentations[:2])
+        self.assertIsNone(pairedEntries)
+        self.assertEqual(problems, ["2 files for 3 volumes, and no case IDs to pair them"])
+
+        # A single case ID in either directory means files are paired by case ID
+        pairedEntries, problems = pairByCaseId(volumes, self.entries(["seg_a.nrrd", "seg_b.nrrd", "seg_c2.nrrd"]))
+        self.assertIsNone(pairedEntries)
+        self.assertIn("liver_a.nrrd: no case ID", problems)
+
+        self.assertEqual(pairByCaseId([], []), ([], []))
+
+    def test_Scan(self):
+        directory = os.path.join(self.temporaryDirectory.name, "Volumes")
+        os.makedirs(directory)
+        for name in ["case2.nrrd", "case1.nii.gz", "notes.txt"]:
+            with open(os.path.join(directory, name), "w") as f:
+                f.write(name)
+
+        entries = self.scanner.scan(directory)
+        self.assertEqual([(entry.name, entry.caseId) for entry in entries], [("case1.nii.gz", "1"), ("case2.nrrd", "2")])
+        # The manifest is used while the directory is unchanged
+        self.assertEqual(self.scanner.scan(directory), entries)
+        self.assertEqual(len(os.listdir(self.scanner.manifestDirectory)), 1)
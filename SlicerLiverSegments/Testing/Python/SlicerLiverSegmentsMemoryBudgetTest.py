@@ -0,0 +1,103 @@
+import unittest
+
+from SlicerLiverSegmentsLib import MemoryBudget
+
+#
+# SlicerLiverSegmentsMemoryBudgetTest
+#
+# Accounting and eviction of the memory retained by a session. Pure Python, does not need the application.
+#
+
+
+class SlicerLiverSegmentsMemoryBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.budget = MemoryBudget(100)
+        self.released = []
+
+    def put(self, key, nbytes, priority, category="Volumes"):
+        self.budget.put(key, category, nbytes, priority, value=key, release=lambda: self.released.append(key))
+
+    def test_EvictionOrder(self):
+        self.put("shown", 30, MemoryBudget.PINNED)
+        self.put("prefetched", 20, MemoryBudget.PREFETCHED)
+        self.put("cached1", 20, MemoryBudget.CACHED)
+        self.put("cached2", 20, MemoryBudget.CACHED)
+        self.assertEqual(self.budget.totalBytes, 90)
+        self.assertEqual(self.released, [])
+
+        # Cached entries go first, the least recently used one first
+        self.assertEqual(self.budget.get("cached1"), "cached1")
+        self.put("cached3", 20, MemoryBudget.CACHED)
+        self.assertEqual(self.released, ["cached2"])
+
+        # Then prefetched ones, even if more recently used than the cached ones
+        self.put("prefetched2", 60, MemoryBudget.PREFETCHED)
+        self.assertEqual(self.released, ["cached2", "cached1", "cached3", "prefetched"])
+        self.assertEqual(self.budget.keys(), ["shown", "prefetched2"])
+        self.assertEqual(self.budget.totalBytes, 90)
+        self.assertEqual(self.budget.usage(), {"Volumes": 90})
+
+        # Lowering the budget evicts, the pinned entry is kept
+        self.budget.budgetBytes = 50
+        self.assertEqual(self.released[-1], "prefetched2")
+        self.assertEqual(self.budget.keys(), ["shown"])
+
+    def test_Reregister(self):
+        self.put("dataset", 30, MemoryBudget.PREFETCHED)
+        self.put("other", 30, MemoryBudget.PREFETCHED, category="Segmentations")
+
+        # Registering a key again replaces its entry, without releasing it, and makes it the most recently used one
+        self.put("dataset", 50, MemoryBudget.PREFETCHED)
+        self.assertEqual(len(self.budget), 2)
+        self.assertEqual(self.budget.totalBytes, 80)
+        self.assertEqual(self.budget.usage(), {"Volumes": 50, "Segmentations": 30})
+        self.put("third", 30, MemoryBudget.PREFETCHED)
+        self.assertEqual(self.released, ["other"])
+
+        # Pinning an entry again protects it, unpinning makes it evictable
+        self.budget.setPriority("dataset", MemoryBudget.PINNED)
+        self.put("large", 60, MemoryBudget.CACHED)
+        self.assertEqual(self.released, ["other", "large"])
+        self.assertEqual(self.budget.keys(), ["dataset", "third"])
+        self.put("dataset", 50, MemoryBudget.CACHED)
+        self.budget.budgetBytes = 40
+        self.assertEqual(self.released, ["other", "large", "dataset"])
+        self.assertEqual((self.budget.keys(), self.budget.totalBytes), (["third"], 30))
+
+        # Stopping to track an entry does not release it
+        self.budget.budgetBytes = 100
+        self.put("dataset", 30, MemoryBudget.CACHED)
+        self.assertEqual(self.budget.pop("dataset"), "dataset")
+        self.assertNotIn("dataset", self.budget)
+        self.assertEqual(self.budget.pop("dataset"), None)
+        self.assertEqual(self.released.count("dataset"), 1)
+
+    def test_OverBudgetWhenPinned(self):
+        self.put("shown", 80, MemoryBudget.PINNED)
+        self.put("segmentation", 40, MemoryBudget.PINNED)
+        # Pinned entries are counted even when they exceed the budget, nothing can be evicted
+        self.assertEqual(self.budget.totalBytes, 120)
+        self.assertEqual(self.budget.keys(), ["shown", "segmentation"])
+        self.assertEqual(self.released, [])
+
+        # Any other entry is evicted as soon as it is added
+        self.put("prefetched", 10, MemoryBudget.PREFETCHED)
+        self.assertEqual(self.released, ["prefetched"])
+        self.assertEqual(self.budget.totalBytes, 120)
+
+        # Once the shown dataset is unpinned, the budget is met again
+        self.budget.setPriority("shown", MemoryBudget.CACHED)
+        self.assertEqual(self.released, ["prefetched", "shown"])
+        self.assertEqual(self.budget.totalBytes, 40)
+
+    def test_ReleaseDroppingEntries(self):
+        # Releasing a volume may stop tracking the segmentation loaded with it
+        self.put("segmentation", 30, MemoryBudget.CACHED)
+        self.budget.put("volume", "Volumes", 50, MemoryBudget.CACHED,
+                        release=lambda: (self.released.append("volume"), self.budget.pop("segmentation")))
+        self.budget.get("segmentation")
+        self.put("shown", 60, MemoryBudget.PINNED)
+        self.assertEqual(self.released, ["volume"])
+        self.assertEqual(self.budget.keys(), ["shown"])
+        self.assertEqual(self.budget.totalBytes, 60)
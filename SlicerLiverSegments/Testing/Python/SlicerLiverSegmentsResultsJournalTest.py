@@ -0,0 +1,108 @@
+import csv
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from SlicerLiverSegmentsLib import ResultsJournal, writeResultsCsv
+
+#
+# SlicerLiverSegmentsResultsJournalTest
+#
+# Journaling of saved evaluations and compaction into the results file. Pure Python, does not need the application.
+#
+
+HEADER = ["Sequence", "Method", "Q1 Scoring"]
+
+
+class SlicerLiverSegmentsResultsJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        self.csvPath = os.path.join(self.temporaryDirectory.name, "results.csv")
+        self.journal = ResultsJournal(self.csvPath + ".journal")
+
+    def tearDown(self):
+        self.journal.close()
+        self.temporaryDirectory.cleanup()
+
+    def record(self, method, sequence, score):
+        return {"Sequence": sequence, "Method": method, "Q1 Scoring": score}
+
+    def test_AppendAndRead(self):
+        self.assertEqual(self.journal.records(), [])
+        records = [self.record(0, 1, 3), self.record(1, 0, 5), self.record(0, 1, 4)]
+        for record in records:
+            self.journal.append(record)
+        # Records are on disk as soon as they are appended, in the order they were saved
+        self.assertEqual(self.journal.records(), records)
+        self.assertEqual(ResultsJournal(self.journal.path).records(), records)
+
+        # A journal opened again appends after the existing records
+        self.journal.close()
+        journal = ResultsJournal(self.journal.path)
+        journal.append(self.record(2, 2, 1))
+        journal.close()
+        self.assertEqual(self.journal.records(), records + [self.record(2, 2, 1)])
+
+    def test_TruncatedRecord(self):
+        self.journal.append(self.record(0, 1, 3))
+        self.journal.close()
+        # A crash while appending leaves the last record incomplete
+        with open(self.journal.path, "a", encoding="utf-8") as f:
+            f.write('{"Sequence": 0, "Met')
+        self.assertEqual(self.journal.records(), [self.record(0, 1, 3)])
+
+        # The next record starts on a line of its own and is read back
+        journal = ResultsJournal(self.journal.path)
+        journal.append(self.record(1, 0, 5))
+        journal.close()
+        self.assertEqual(self.journal.records(), [self.record(0, 1, 3), self.record(1, 0, 5)])
+
+    def test_Compact(self):
+        for record in [self.record(0, 1, 3), self.record(1, 0, 5), self.record(0, 1, 4)]:
+            self.journal.append(record)
+        rows = [[1, 0, 4], [0, 1, 5]]
+        self.journal.compact(self.csvPath, HEADER, rows)
+
+        with open(self.csvPath, newline="", encoding="utf-8") as f:
+            self.assertEqual(list(csv.reader(f)), [HEADER] + [[str(value) for value in row] for row in rows])
+        # No temporary file is left next to the results file, and the journal is cleared
+        self.assertEqual(sorted(os.listdir(self.temporaryDirectory.name)), ["results.csv"])
+        self.assertEqual(self.journal.records(), [])
+
+        # Evaluations saved after the compaction are journaled again
+        self.journal.append(self.record(2, 2, 1))
+        self.assertEqual(self.journal.records(), [self.record(2, 2, 1)])
+
+    def test_FailedCompaction(self):
+        self.journal.append(self.record(0, 1, 3))
+        with open(self.csvPath, "w", encoding="utf-8") as f:
+            f.write("previous results\n")
+
+        def failingRows():
+            yield [1, 0, 4]
+            raise OSError("disk full")
+
+        # The previous results file and the journal are kept as they were
+        with self.assertRaises(OSError):
+            self.journal.compact(self.csvPath, HEADER, failingRows())
+        with open(self.csvPath, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "previous results\n")
+        self.assertEqual(sorted(os.listdir(self.temporaryDirectory.name)), ["results.csv", "results.csv.journal"])
+        self.assertEqual(self.journal.records(), [self.record(0, 1, 3)])
+
+    def test_ConcurrentWrites(self):
+        # Threads writing the same file each use their own temporary file, the last one replaced wins
+        def write(index):
+            for _ in range(20):
+                writeResultsCsv(self.csvPath, HEADER, [[index, index, index]] * 100)
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(write, range(8)))
+        with open(self.csvPath, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual(len(rows), 101)
+        self.assertEqual(len(set(map(tuple, rows[1:]))), 1)
+        self.assertEqual(sorted(os.listdir(self.temporaryDirectory.name)), ["results.csv"])
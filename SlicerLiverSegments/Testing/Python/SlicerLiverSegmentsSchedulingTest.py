@@ -0,0 +1,55 @@
+import unittest
+
+from SlicerLiverSegmentsLib import blockedLoadingOrder, countVolumeLoads, shuffledLoadingOrder
+
+#
+# SlicerLiverSegmentsSchedulingTest
+#
+# Loading orders and the volume loads they need. Pure Python, does not need the application.
+#
+
+
+class SlicerLiverSegmentsSchedulingTest(unittest.TestCase):
+
+    def allEvaluations(self, numberOfMethods, numberOfSequences):
+        return [(method, sequence) for method in range(numberOfMethods) for sequence in range(numberOfSequences)]
+
+    def test_ShuffledLoadingOrder(self):
+        loadingOrder = shuffledLoadingOrder(4, 10, 1234)
+        self.assertEqual(sorted(loadingOrder), self.allEvaluations(4, 10))
+        # The order is reproducible from the seed, and changes with it
+        self.assertEqual(loadingOrder, shuffledLoadingOrder(4, 10, 1234))
+        self.assertNotEqual(loadingOrder, shuffledLoadingOrder(4, 10, 4321))
+
+    def test_BlockedLoadingOrder(self):
+        windowSize = 3
+        loadingOrder = blockedLoadingOrder(4, 10, 1234, windowSize)
+        self.assertEqual(sorted(loadingOrder), self.allEvaluations(4, 10))
+        self.assertEqual(loadingOrder, blockedLoadingOrder(4, 10, 1234, windowSize))
+
+        # All presentations of a sequence fall within one block of windowSize sequences
+        for sequence in range(10):
+            positions = [position for position, (_, s) in enumerate(loadingOrder) if s == sequence]
+            self.assertEqual(len(positions), 4)
+            self.assertEqual(positions[0] // (windowSize * 4), positions[-1] // (windowSize * 4))
+
+    def test_CountVolumeLoads(self):
+        loadingOrder = [(0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (2, 1)]
+        # Without a cache every change of sequence is a load, the volume shown is always kept
+        self.assertEqual(countVolumeLoads(loadingOrder, 0), 4)
+        self.assertEqual(countVolumeLoads(loadingOrder, 1), 4)
+        self.assertEqual(countVolumeLoads(loadingOrder, 2), 2)
+        self.assertEqual(countVolumeLoads([], 2), 0)
+
+        # With a byte budget, the cache holds as many volumes as fit
+        self.assertEqual(countVolumeLoads(loadingOrder, 200, [100, 100]), 2)
+        self.assertEqual(countVolumeLoads(loadingOrder, 150, [100, 100]), 4)
+        self.assertEqual(countVolumeLoads(loadingOrder, 150, [100, 50]), 2)
+
+    def test_BlockedOrderNeedsFewerLoads(self):
+        windowSize = 2
+        blocked = blockedLoadingOrder(4, 20, 0, windowSize)
+        shuffled = shuffledLoadingOrder(4, 20, 0)
+        # A cache of one window loads each volume once
+        self.assertEqual(countVolumeLoads(blocked, windowSize), 20)
+        self.assertGreater(countVolumeLoads(shuffled, windowSize), 20)
@@ -0,0 +1,121 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from SlicerLiverSegmentsLib import (
+    mergeShardResults,
+    shardFileName,
+    shardLoadingOrder,
+    shuffledLoadingOrder,
+    writeMergedResults,
+    writeResultsCsv,
+)
+
+#
+# SlicerLiverSegmentsShardingTest
+#
+# Splitting of the loading order between raters and merging of their results files. Pure Python, does not need the
+# application.
+#
+
+HEADER = ["Sequence", "Method", "Volume File", "Segmentation File", "Q1 Scoring", "Q2 Scoring"]
+SCORE_COLUMNS = ("Q1 Scoring", "Q2 Scoring")
+
+
+class SlicerLiverSegmentsShardingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        self.loadingOrder = shuffledLoadingOrder(4, 25, 1234)
+
+    def tearDown(self):
+        self.temporaryDirectory.cleanup()
+
+    def shards(self, shardCount, overlapFraction, seed=7):
+        return [shardLoadingOrder(self.loadingOrder, shardCount, shardIndex, overlapFraction, seed)
+                for shardIndex in range(shardCount)]
+
+    def writeShard(self, name, rows, header=HEADER):
+        path = os.path.join(self.temporaryDirectory.name, name)
+        writeResultsCsv(path, header, rows)
+        return path
+
+    def test_DisjointShards(self):
+        shards = self.shards(3, 0.0)
+        self.assertEqual(sorted(sum(shards, [])), sorted(self.loadingOrder))
+        self.assertEqual(sum(len(shard) for shard in shards), len(self.loadingOrder))
+        # Nearly equal sizes, each shard keeping the relative order of the loading order
+        self.assertLessEqual(max(map(len, shards)) - min(map(len, shards)), 1)
+        for shard in shards:
+            positions = [self.loadingOrder.index(evaluation) for evaluation in shard]
+            self.assertEqual(positions, sorted(positions))
+
+    def test_OverlappingShards(self):
+        shards = self.shards(4, 0.1)
+        shared = set(shards[0]).intersection(*shards[1:])
+        self.assertEqual(len(shared), 10)
+        own = [set(shard) - shared for shard in shards]
+        # Apart from the shared evaluations, shards are disjoint and together cover every evaluation
+        self.assertEqual(sum(len(evaluations) for evaluations in own), len(self.loadingOrder) - len(shared))
+        self.assertEqual(shared.union(*own), set(self.loadingOrder))
+
+    def test_StableShards(self):
+        self.assertEqual(self.shards(4, 0.1), self.shards(4, 0.1))
+        self.assertNotEqual(self.shards(4, 0.1), self.shards(4, 0.1, seed=8))
+        self.assertEqual(shardLoadingOrder(self.loadingOrder, 1, 0, 0.1, 7), self.loadingOrder)
+
+    def test_ShardFileName(self):
+        self.assertEqual(shardFileName(os.path.join("out", "results.csv"), 1, 4),
+                         os.path.join("out", "results.shard2of4.csv"))
+
+    def test_Merge(self):
+        first = self.writeShard("results.shard1of2.csv", [
+            [0, 1, "case0.nrrd", "seg0.nrrd", 3, 4],
+            [1, 0, "case1.nrrd", "seg1.nrrd", 5, 5],
+            [-1, -1, "N/A", "N/A", -1, -1],
+        ])
+        second = self.writeShard("results.shard2of2.csv", [
+            [0, 1, "case0.nrrd", "seg0.nrrd", 2, 4],
+            [2, 3, "case2.nrrd", "seg2.nrrd", 1, -1],
+        ])
+        header, rows, problems = mergeShardResults([first, second], SCORE_COLUMNS)
+        self.assertEqual(header, ["Shard"] + HEADER)
+        # Sorted by evaluation, the shared one once per shard
+        self.assertEqual([(row["Method"], row["Sequence"], row["Shard"]) for row in rows],
+                         [("0", "1", "1"), ("1", "0", "1"), ("1", "0", "2"), ("3", "2", "2")])
+        self.assertEqual(problems, [f"{first}: 1 evaluations not scored", f"{second}: 1 evaluations not scored"])
+
+        mergedPath = os.path.join(self.temporaryDirectory.name, "merged.csv")
+        writeMergedResults(mergedPath, header, rows)
+        with open(mergedPath, newline="") as f:
+            self.assertEqual(list(csv.DictReader(f)), rows)
+
+    def test_MergeProblems(self):
+        first = self.writeShard("first.csv", [[0, 1, "case0.nrrd", "seg0.nrrd", 3, 4],
+                                              [0, 1, "case0.nrrd", "seg0.nrrd", 2, 4]])
+        conflicting = self.writeShard("conflicting.csv", [[0, 1, "case0.nrrd", "other.nrrd", 3, 4]])
+        reordered = self.writeShard("reordered.csv", [[1, 0, "case0.nrrd", "seg0.nrrd", 3, 4]],
+                                    header=HEADER[1:2] + HEADER[:1] + HEADER[2:])
+        empty = os.path.join(self.temporaryDirectory.name, "empty.csv")
+        open(empty, "w").close()
+
+        header, rows, problems = mergeShardResults([empty, first, conflicting, reordered], SCORE_COLUMNS)
+        self.assertEqual(header, ["Shard"] + HEADER)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(problems, [
+            f"{empty}: empty, skipped",
+            f"{first}: method 1 sequence 0 saved more than once",
+            f"{conflicting}: method 1 sequence 0 was made on case0.nrrd, other.nrrd but on case0.nrrd, seg0.nrrd "
+            f"in shard 2",
+            f"{reordered}: columns differ from {first}",
+        ])
+
+        # Files without the columns identifying evaluations cannot be merged
+        noMethod = self.writeShard("noMethod.csv", [[0, "case0.nrrd", "seg0.nrrd", 3, 4]],
+                                   header=HEADER[:1] + HEADER[2:])
+        with self.assertRaisesRegex(ValueError, "noMethod.csv has no Method column"):
+            mergeShardResults([first, noMethod], SCORE_COLUMNS)
+
+        # Merging only empty files gives no evaluations
+        self.assertEqual(mergeShardResults([empty], SCORE_COLUMNS), (["Shard"], [], [f"{empty}: empty, skipped"]))
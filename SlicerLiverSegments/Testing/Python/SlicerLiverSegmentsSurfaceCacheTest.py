@@ -0,0 +1,99 @@
+import importlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import vtk
+
+from SlicerLiverSegmentsLib import SurfaceCache, fileContentHash
+
+surfaceCacheModule = importlib.import_module("SlicerLiverSegmentsLib.SurfaceCache")
+
+#
+# SlicerLiverSegmentsSurfaceCacheTest
+#
+# Content hashes of segmentation files and the on-disk cache of their surfaces. Pure Python, does not need the
+# application.
+#
+
+
+def sphere(resolution):
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    source.Update()
+    return source.GetOutput()
+
+
+class SlicerLiverSegmentsSurfaceCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.TemporaryDirectory()
+        self.cache = SurfaceCache(os.path.join(self.temporaryDirectory.name, "Surfaces"))
+
+    def tearDown(self):
+        self.temporaryDirectory.cleanup()
+
+    def writeFile(self, name, content):
+        path = os.path.join(self.temporaryDirectory.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def entrySize(self, key):
+        directory = os.path.join(self.cache.directory, key)
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    def test_FileContentHash(self):
+        path = self.writeFile("seg1.nrrd", "first")
+        contentHash = fileContentHash(path)
+        self.assertEqual(fileContentHash(self.writeFile("seg2.nrrd", "first")), contentHash)
+
+        # The hash is remembered for the file modification time and size, a modified file is hashed again
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(fileContentHash(path), contentHash)
+        self.writeFile("seg1.nrrd", "other")
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(fileContentHash(path), contentHash)
+        os.utime(path, ns=(1, 1))
+        self.assertEqual(fileContentHash(path), fileContentHash(self.writeFile("seg3.nrrd", "other")))
+
+        # Only the hashes of the most recently hashed files are remembered
+        with mock.patch.object(surfaceCacheModule, "MAX_CONTENT_HASHES", 2):
+            paths = [self.writeFile(f"case{i}.nrrd", str(i)) for i in range(3)]
+            for path in paths:
+                fileContentHash(path)
+            self.assertEqual([key[0] for key in surfaceCacheModule._contentHashes],
+                             [os.path.abspath(path) for path in paths[1:]])
+
+    def test_SaveAndLoad(self):
+        key = self.cache.key(self.writeFile("seg.nrrd", "segmentation"), "parameters")
+        self.assertNotEqual(key, self.cache.key(self.writeFile("seg.nrrd", "segmentation"), "other parameters"))
+        self.assertIsNone(self.cache.load(key, 2))
+
+        self.cache.save(key, [sphere(8), None])
+        polyDatas = self.cache.load(key, 2)
+        self.assertEqual([polyData.GetNumberOfPoints() for polyData in polyDatas],
+                         [sphere(8).GetNumberOfPoints(), 0])
+        self.assertIsNone(self.cache.load(key, 3))
+
+    def test_Prune(self):
+        for index in range(3):
+            self.cache.save(f"key{index}", [sphere(16)])
+            os.utime(os.path.join(self.cache.directory, f"key{index}"), ns=(index, index))
+        entrySize = self.entrySize("key0")
+
+        # Loading an entry makes it the most recently used one
+        self.assertIsNotNone(self.cache.load("key0", 1))
+        self.cache.maxBytes = 3 * entrySize
+        self.cache.save("key3", [sphere(16)])
+        self.assertEqual(sorted(os.listdir(self.cache.directory)), ["key0", "key2", "key3"])
+
+        # The entry just saved is kept, even over the budget
+        self.cache.maxBytes = 0
+        self.cache.save("key4", [sphere(16)])
+        self.assertEqual(os.listdir(self.cache.directory), ["key4"])
+
+        # Pruning a missing directory does nothing
+        SurfaceCache(os.path.join(self.temporaryDirectory.name, "Missing")).prune()